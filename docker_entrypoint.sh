@@ -7,6 +7,9 @@ cd /app
 # Run any new database migrations
 python ./manage.py migrate
 
+# Collect the static files (hashed and precompressed when DJANGO_DEBUG=0)
+python ./manage.py collectstatic --noinput
+
 # Create Admin User, ignore errors if it already exists
 python ./manage.py createsuperuser --noinput || true
 
@@ -0,0 +1,341 @@
+"""
+benchmarks.py
+
+This module measures how the views and API endpoints scale with the size of the fleet. Every
+read-only URL pattern of myapp/urls.py is requested with Django's test client (as a superuser,
+so every board is accessible), and for each endpoint the latency percentiles, the number of SQL
+queries and the peak memory allocated while serving it are recorded. The write endpoints only
+act on POST (a GET is just redirected or refused), so they are reported as skipped instead. Used by the `benchmark`
+management command, which seeds fleets of several sizes (see seeding.py) in a throwaway test
+database and saves the results as JSON so that runs can be compared between commits.
+
+It also compares the sync (DRF) and async variants of the machine status API under concurrent
+load: many simultaneous requests are sent through the ASGI application in process, while every
+commit of the write queue is slowed down to simulate a slow disk (see run_async_benchmarks() and
+the `benchmark_async` management command).
+"""
+
+import asyncio
+import json
+import logging
+import math
+import re
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern
+
+from .models import Machine, FaultCase, Warning, Collection
+from . import urls as myapp_urls
+from .views import apply_machine_statuses
+from .write_queue import write_queue
+
+# Endpoints that are not benchmarked, and why: the live event stream never ends, logging out
+# would end the benchmark client's session, and the write endpoints only act on POST (their
+# GET answer is a redirect or an error, which says nothing about the write).
+SKIPPED_ROUTES = {
+    "machine_events/": "never-ending stream",
+    "employee_logout/": "ends the session",
+    **dict.fromkeys([
+        "add_machine/", "delete_machine/<int:machine_id>/", "assign_technician/<int:machine_id>/",
+        "assign_repair/<int:machine_id>/", "bulk_assign/", "create_fault/", "add_fault_note/<int:fault_id>/",
+        "create_warning/", "delete_warning/<int:warning_id>/", "mark_resolved/<int:fault_id>/",
+        "delete_user/<int:user_id>/", "api/machine/faultUpdate", "api/machine/batchUpdate",
+        "api/machine/assign", "api/async/machine/faultUpdate", "api/fault/bulk",
+    ], "write endpoint (POST only)"),
+}
+
+# Extra query strings requested for some endpoints, besides the bare URL ("" = bare URL).
+# "{collection}" is replaced with the id of a seeded collection.
+QUERY_STRINGS = {
+    "manager_dashboard/": ["", "collection_filter={collection}"],
+    "fault_search/": ["q=pressure"],
+    "api/fault/search/": ["q=pressure"],
+}
+
+PATH_PARAMETER_RE = re.compile(r"<(?:(?P<converter>\w+):)?(?P<name>\w+)>")
+
+
+def sample_ids():
+    """
+    Returns the ids substituted for the path parameters of the URL patterns.
+    """
+    technician = User.objects.filter(userprofile__role="Technician").order_by("pk").first()
+    return {
+        "machine": Machine.objects.order_by("pk").values_list("pk", flat=True).first(),
+        "fault": FaultCase.objects.order_by("pk").values_list("pk", flat=True).first(),
+        "warning": Warning.objects.order_by("pk").values_list("pk", flat=True).first(),
+        "collection": Collection.objects.order_by("pk").values_list("pk", flat=True).first(),
+        "user": technician.pk if technician else None,
+    }
+
+
+def endpoint_urls(ids):
+    """
+    Returns [(label, url)] for every benchmarked endpoint of myapp/urls.py. Patterns whose path
+    parameters cannot be filled in (e.g. no warnings were seeded) are left out, and so are the
+    SKIPPED_ROUTES.
+    """
+    endpoints = []
+    for pattern in myapp_urls.urlpatterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        route = str(pattern.pattern)
+        if route in SKIPPED_ROUTES:
+            continue
+
+        def fill(match):
+            name = match["name"]
+            if name == "pk":
+                kind = "collection" if route.startswith("api/collection/") else "machine"
+            else:
+                kind = name.removesuffix("_id")
+            value = ids.get(kind)
+            if value is None:
+                raise LookupError(kind)
+            return str(value)
+
+        try:
+            path = "/" + PATH_PARAMETER_RE.sub(fill, route)
+        except LookupError:
+            continue
+        for query in QUERY_STRINGS.get(route, [""]):
+            query = query.format(**ids)
+            endpoints.append((f"{route}?{query}" if query else route or "/", f"{path}?{query}" if query else path))
+    return endpoints
+
+
+def percentile(samples, fraction):
+    """
+    Returns the nearest-rank percentile (`fraction` between 0 and 1) of a list of numbers.
+    """
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _request(client, url):
+    response = client.get(url)
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def measure(client, url, repeat=10):
+    """
+    Requests `url` once to warm up, then `repeat` times, and returns its status code, p50 and
+    p95 latency (ms), query count and peak traced memory (KiB, from one extra request).
+    """
+    _request(client, url)
+    timings = []
+    for _ in range(repeat):
+        # The query log is cleared by every request (request_started), so the captured queries
+        # are counted right away.
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = _request(client, url)
+            timings.append((time.perf_counter() - started) * 1000)
+        query_count = len(queries)
+
+    tracemalloc.start()
+    try:
+        _request(client, url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "status": response.status_code,
+        "p50_ms": round(percentile(timings, 0.50), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+        "queries": query_count,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(user, repeat=10, only=None):
+    """
+    Benchmarks every endpoint (or those whose label contains `only`) against the current
+    database, logged in as `user`. Returns {label: measurements}; the SKIPPED_ROUTES are
+    reported as {route: {"skipped": reason}}.
+    """
+    client = Client()
+    client.force_login(user)
+    results = {}
+    # An endpoint answering with a 4xx would otherwise be logged on every repeat of its request.
+    request_logger = logging.getLogger("django.request")
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    try:
+        for label, url in endpoint_urls(sample_ids()):
+            if only and only not in label:
+                continue
+            results[label] = measure(client, url, repeat)
+    finally:
+        request_logger.setLevel(level)
+    for route, reason in SKIPPED_ROUTES.items():
+        if not only or only in route:
+            results[route] = {"skipped": reason}
+    return results
+
+
+def compare(previous, current):
+    """
+    Yields (size, label, previous measurements, current measurements) for the endpoints
+    benchmarked at the same fleet size in two saved runs (skipped endpoints are left out).
+    """
+    for size, endpoints in current["results"].items():
+        for label, measurement in endpoints.items():
+            before = previous.get("results", {}).get(size, {}).get(label)
+            if before is not None and "skipped" not in before and "skipped" not in measurement:
+                yield size, label, before, measurement
+
+
+#############################################
+#     Sync vs async API under concurrency   #
+#############################################
+
+# (label, method, path, whether the request posts a status update) of the endpoints compared.
+# "{machine}" is replaced with a machine id.
+ASYNC_ENDPOINTS = (
+    ("sync read    GET  api/machine/<pk>/", "GET", "/api/machine/{machine}/", False),
+    ("async read   GET  api/async/machine/<pk>/", "GET", "/api/async/machine/{machine}/", False),
+    ("sync update  POST api/machine/faultUpdate", "POST", "/api/machine/faultUpdate", True),
+    ("async update POST api/async/machine/faultUpdate", "POST", "/api/async/machine/faultUpdate", True),
+)
+
+
+async def asgi_request(application, method, path, body=b""):
+    """
+    Sends one request through an ASGI application, in process, and returns its status code.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+        "method": method, "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [
+            (b"host", b"testserver"), (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    request_sent = False
+    response_sent = asyncio.Event()
+    status_code = None
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_sent.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            response_sent.set()
+
+    await application(scope, receive, send)
+    response_sent.set()
+    return status_code
+
+
+async def measure_concurrent(application, method, path, bodies, concurrency):
+    """
+    Sends one request per body (`bodies` is a list), at most `concurrency` at a time, and
+    returns the throughput, p50/p95 latency, status codes and peak number of threads.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+    statuses = Counter()
+    peak_threads = threading.active_count()
+    done = False
+
+    async def send(body):
+        async with semaphore:
+            started = time.perf_counter()
+            statuses[await asgi_request(application, method, path, body)] += 1
+            timings.append((time.perf_counter() - started) * 1000)
+
+    async def count_threads():
+        nonlocal peak_threads
+        while not done:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.005)
+
+    counter = asyncio.create_task(count_threads())
+    started = time.perf_counter()
+    await asyncio.gather(*(send(body) for body in bodies))
+    elapsed = time.perf_counter() - started
+    done = True
+    await counter
+    return {
+        "requests_per_second": round(len(bodies) / elapsed, 1),
+        "p50_ms": round(percentile(timings, 0.50), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "peak_threads": peak_threads,
+    }
+
+
+@contextmanager
+def simulated_commit_latency(queue, seconds):
+    """
+    Slows down every batch the write queue commits by `seconds`, as a slow disk (or a busy
+    database server) would.
+    """
+    run_batch = queue._run_batch
+
+    def slow_run_batch(jobs):
+        time.sleep(seconds)
+        run_batch(jobs)
+
+    queue._run_batch = slow_run_batch
+    try:
+        yield
+    finally:
+        del queue._run_batch
+
+
+def run_async_benchmarks(requests=500, concurrency=100, latency=0.05):
+    """
+    Sends `requests` requests (at most `concurrency` at a time) to each sync and async machine
+    status endpoint through the ASGI application, with the write queue enabled and each of its
+    commits taking `latency` seconds longer. Returns {label: measurements}.
+    """
+    machine_ids = list(Machine.objects.order_by("pk").values_list("pk", flat=True)[:requests])
+    if not machine_ids:
+        raise ValueError("The database has no machines to benchmark against.")
+    # Gives every machine a recent status change first: the first change after a long quiet
+    # period credits the time since the last one to many rollup buckets and costs far more,
+    # which would penalize whichever endpoint happened to run first.
+    apply_machine_statuses(dict.fromkeys(machine_ids, "Warning"))
+    apply_machine_statuses(dict.fromkeys(machine_ids, "OK"))
+
+    application = ASGIHandler()
+    results = {}
+    with override_settings(SQLITE_WRITE_QUEUE=True), simulated_commit_latency(write_queue, latency):
+        try:
+            for label, method, path, posts in ASYNC_ENDPOINTS:
+                bodies = [
+                    json.dumps({
+                        "id": machine_ids[n % len(machine_ids)],
+                        "status": ("Warning", "OK")[(n // len(machine_ids) + len(results)) % 2],
+                    }).encode() if posts else b""
+                    for n in range(requests)
+                ]
+                path = path.format(machine=machine_ids[0])
+                results[label] = asyncio.run(measure_concurrent(application, method, path, bodies, concurrency))
+        finally:
+            write_queue.stop()
+    return results
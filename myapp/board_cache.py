@@ -0,0 +1,74 @@
+"""
+board_cache.py
+
+This module maintains the board versions that the dashboards' fragment cache is keyed on (see
+templatetags/board_cache.py). A rendered fragment (a machine table, a fault list...) is stored in
+Django's cache under its name, the version token of the scope it depends on and any per-user
+values. Writes that change what a scope shows replace its token, so the fragments rendered
+before the write are simply never looked up again and expire from the cache on their own:
+  - "board" (GLOBAL_SCOPE) changes on any write to machines, fault cases, fault notes, warnings,
+    collections, assignments or users;
+  - "collection:<id>" changes on writes to the machines of that collection (or the collection
+    itself) and to users, so the collection-filtered machine tables survive writes elsewhere in
+    the fleet.
+The tokens are kept in the database (BoardVersion), so every worker process sees a bump at once
+whatever cache backend is configured.
+"""
+
+import uuid
+
+from .models import BoardVersion
+from .rollups import collection_memberships
+
+GLOBAL_SCOPE = "board"
+
+
+def collection_scope(collection_id):
+    """
+    Returns the name of the version scope of the machines of a collection.
+    """
+    return f"collection:{collection_id}"
+
+
+def board_versions(scopes):
+    """
+    Returns {scope: token} for the given scopes. Scopes that have no token yet get one.
+    """
+    scopes = set(scopes)
+    versions = dict(BoardVersion.objects.filter(scope__in=scopes).values_list("scope", "token"))
+    for scope in scopes - versions.keys():
+        version, _created = BoardVersion.objects.get_or_create(scope=scope, defaults={"token": uuid.uuid4().hex})
+        versions[scope] = version.token
+    return versions
+
+
+def bump_board_versions(scopes):
+    """
+    Gives the given scopes a new token, invalidating every fragment cached for them.
+    """
+    scopes = set(scopes)
+    token = uuid.uuid4().hex
+    if BoardVersion.objects.filter(scope__in=scopes).update(token=token) < len(scopes):
+        existing = set(BoardVersion.objects.filter(scope__in=scopes).values_list("scope", flat=True))
+        BoardVersion.objects.bulk_create(
+            [BoardVersion(scope=scope, token=token) for scope in scopes - existing], ignore_conflicts=True,
+        )
+
+
+def bump_all_board_versions():
+    """
+    Gives every scope a new token, e.g. after a change to the users listed on every board.
+    """
+    if not BoardVersion.objects.update(token=uuid.uuid4().hex):
+        bump_board_versions([GLOBAL_SCOPE])
+
+
+def bump_machine_versions(machine_ids, collection_ids=()):
+    """
+    Bumps the global scope and the scopes of the collections the given machines belong to
+    (plus `collection_ids`, e.g. collections the machines have just left).
+    """
+    collection_ids = set(collection_ids)
+    for machine_collections in collection_memberships(list(machine_ids)).values():
+        collection_ids.update(machine_collections)
+    bump_board_versions([GLOBAL_SCOPE, *(collection_scope(pk) for pk in collection_ids)])
@@ -2,14 +2,16 @@
 forms.py
 
 This module defines form classes for the application.
-It includes forms for user login and a specialized registration form
-for managers to add new users. Detailed comments are provided to explain
+It includes forms for user login, a specialized registration form
+for managers to add new users and a bulk assignment form. Detailed comments are provided to explain
 the purpose and function of each form and method.
 """
 
 from django import forms
 from django.contrib.auth.models import User
 
+from .models import Machine
+
 #############
 # LoginForm #
 #############
@@ -92,3 +94,47 @@ class ManagerUserRegistrationForm(forms.Form):
         if password and confirm and password != confirm:
             raise forms.ValidationError('Passwords do not match')
         return cleaned_data
+
+
+######################
+# BulkAssignmentForm #
+######################
+class IdListField(forms.Field):
+    """
+    A field for a list of ids, posted by a multiple select or by checkboxes sharing a name.
+    """
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return [int(item) for item in value]
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Enter a list of ids.')
+
+
+class BulkAssignmentForm(forms.Form):
+    """
+    A form for Manager users to reassign many machines at once.
+
+    Fields:
+      - role: Whether technicians or repair personnel are reassigned.
+      - user_ids: The users that become the only assignees with that role (none unassigns them).
+      - machine_ids: The machines to reassign (the checkboxes of the assignment table), or
+      - collection: a collection whose machines are all reassigned.
+
+    Validation:
+      - clean: Ensures that exactly one of machine_ids and collection is given.
+      The roles of the users are checked by MachineQuerySet.reassign().
+    """
+    role = forms.ChoiceField(choices=[(role, role) for role in Machine.ASSIGNEE_ROLES])
+    user_ids = IdListField(required=False)
+    machine_ids = IdListField(required=False)
+    collection = forms.IntegerField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if bool(cleaned_data.get('machine_ids')) == (cleaned_data.get('collection') is not None):
+            raise forms.ValidationError('Select some machines or a collection.')
+        return cleaned_data
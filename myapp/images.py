@@ -0,0 +1,152 @@
+"""
+images.py
+
+This module generates resized, recompressed variants (thumbnails) of uploaded images, such as
+Machine.image and FaultNote.image, with Pillow. Shop-floor photos are often several MB; the
+dashboards and the API use the variants instead of the originals.
+
+Variants are stored next to the uploads in the media storage, under `variants/`, with a name
+derived from the original file name and the variant width, e.g.
+    fault_notes/photo.jpg  ->  variants/fault_notes/photo-480w.webp
+They are generated once an upload is committed (see signals.py), and the widths generated are
+recorded on the row holding the image (`<field>_variant_widths`, e.g. Machine.image_variant_widths);
+images uploaded before this existed, or whose variants were removed, get theirs with the
+`generate_image_variants` command. Serving a URL never touches the storage or Pillow: the URLs
+are derived from the image name and the recorded widths, so listing many machines costs no
+filesystem access and no request renders an image. An image without variants (not generated yet,
+or whose generation failed) is served as the original. Variants are
+written through the default storage (the uploads themselves live in the content-addressed
+storage, which would rename them), so a deduplicated upload shares its variants too.
+"""
+
+import io
+import logging
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+logger = logging.getLogger(__name__)
+
+# Widths (in pixels) of the generated variants.
+VARIANT_WIDTHS = getattr(settings, "IMAGE_VARIANT_WIDTHS", (160, 480, 960))
+# Encoding of the variants: WebP when Pillow supports it, JPEG otherwise.
+VARIANT_FORMAT = getattr(settings, "IMAGE_VARIANT_FORMAT", "WEBP" if features.check("webp") else "JPEG")
+VARIANT_QUALITY = getattr(settings, "IMAGE_VARIANT_QUALITY", 80)
+
+VARIANT_EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg", "PNG": "png"}
+
+
+def variant_name(name, width, image_format=None):
+    """
+    Returns the storage name of the `width` variant of the image stored as `name`.
+    """
+    image_format = image_format or VARIANT_FORMAT
+    stem, _ext = posixpath.splitext(name)
+    return f"variants/{stem}-{width}w.{VARIANT_EXTENSIONS[image_format]}"
+
+
+def render_variant(source, width, image_format=None):
+    """
+    Returns the bytes of `source` (an open image file) scaled down to at most `width` pixels wide
+    (never up), oriented according to its EXIF data and recompressed in `image_format`.
+    """
+    image_format = image_format or VARIANT_FORMAT
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+        if image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        output = io.BytesIO()
+        image.save(output, format=image_format, quality=VARIANT_QUALITY, optimize=True)
+    return output.getvalue()
+
+
+def generate_variant(field_file, width, image_format=None):
+    """
+    Generates and stores the `width` variant of an image field file if it does not exist yet.
+    Returns the variant's storage name, or None if the original cannot be read as an image.
+    """
+    storage = default_storage
+    name = variant_name(field_file.name, width, image_format)
+    if storage.exists(name):
+        return name
+    try:
+        with field_file.storage.open(field_file.name, "rb") as source:
+            content = render_variant(source, width, image_format)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning("Could not generate the %spx variant of %s", width, field_file.name, exc_info=True)
+        return None
+    saved_name = storage.save(name, ContentFile(content))
+    if saved_name != name:
+        # Another request generated the same variant concurrently; keep theirs.
+        storage.delete(saved_name)
+    return name
+
+
+def generate_variants(field_file):
+    """
+    Generates every configured variant of an image field file. Returns the widths of the
+    variants that exist afterwards.
+    """
+    return [width for width in VARIANT_WIDTHS if generate_variant(field_file, width)]
+
+
+def record_variants(field_file):
+    """
+    Generates every configured variant of an image field file and records their widths on the
+    row holding it (`<field>_variant_widths`), unless the row holds another image by now.
+    Returns the widths.
+    """
+    instance, field_name = field_file.instance, field_file.field.name
+    widths = generate_variants(field_file)
+    type(instance)._default_manager.filter(pk=instance.pk, **{field_name: field_file.name}).update(
+        **{f"{field_name}_variant_widths": widths},
+    )
+    return widths
+
+
+def generated_widths(field_file):
+    """
+    Returns the widths of the variants recorded for an image field file, smallest first.
+    """
+    return sorted(getattr(field_file.instance, f"{field_file.field.name}_variant_widths", None) or ())
+
+
+def variant_url(field_file, width):
+    """
+    Returns the URL of the variant of an image field file closest to (and at least) `width`
+    pixels wide, the URL of the original when no variant was generated, or "" for an empty
+    field. Derived from the image name and the recorded widths: the storage is not checked and
+    nothing is generated.
+    """
+    if not field_file:
+        return ""
+    widths = generated_widths(field_file)
+    if not widths:
+        return field_file.url
+    width = min([w for w in widths if w >= width] or [widths[-1]])
+    return default_storage.url(variant_name(field_file.name, width))
+
+
+def variant_urls(field_file):
+    """
+    Returns {width: url} for every configured variant width of an image field file ({} when
+    empty); the widths without a generated variant get the closest one, or the original.
+    """
+    if not field_file:
+        return {}
+    return {width: variant_url(field_file, width) for width in VARIANT_WIDTHS}
+
+
+def delete_variants(name):
+    """
+    Deletes every configured variant of the image stored as `name`.
+    """
+    for width in VARIANT_WIDTHS:
+        default_storage.delete(variant_name(name, width))
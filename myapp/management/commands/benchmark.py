@@ -0,0 +1,124 @@
+"""
+benchmark.py
+
+Management command that benchmarks every view and API endpoint of myapp/urls.py across fleet
+sizes (see myapp/benchmarks.py). For each size it seeds a synthetic fleet (see
+myapp/seeding.py) into a throwaway test database, so the real database is never touched, and
+requests each read endpoint with Django's test client, reporting p50/p95 latency, query count
+and peak memory (the POST-only write endpoints are listed as skipped). The results are saved as JSON; pass an earlier result file to --compare to see
+what changed between commits.
+
+Usage:
+    python manage.py benchmark                                   # fleets of 100 and 1000 machines
+    python manage.py benchmark --sizes 100,1000,5000 --repeat 20
+    python manage.py benchmark --only api/ --compare storage/benchmarks/3f2a9c1.json
+"""
+
+import json
+import subprocess
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from myapp.benchmarks import compare, run_benchmarks
+from myapp.seeding import seed_fleet
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark the views and API endpoints across fleet sizes and save the results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="100,1000",
+            help="Comma-separated fleet sizes (numbers of machines) to benchmark (default 100,1000).",
+        )
+        parser.add_argument("--repeat", type=int, default=10, help="Timed requests per endpoint (default 10).")
+        parser.add_argument("--only", default=None, help="Only benchmark endpoints whose route contains this text.")
+        parser.add_argument(
+            "--output", default=None,
+            help="Result file (default storage/benchmarks/<git revision or timestamp>.json).",
+        )
+        parser.add_argument("--compare", default=None, help="An earlier result file to compare with.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be a comma-separated list of numbers.")
+        if not sizes or options["repeat"] < 1:
+            raise CommandError("Give at least one fleet size and a --repeat of at least 1.")
+        previous = None
+        if options["compare"]:
+            try:
+                previous = json.loads(Path(options["compare"]).read_text())
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Could not read {options['compare']}: {exc}")
+
+        revision = git_revision()
+        report = {
+            "revision": revision,
+            "started_at": timezone.now().isoformat(),
+            "repeat": options["repeat"],
+            "results": {},
+        }
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            for size in sizes:
+                call_command("flush", interactive=False, verbosity=0)
+                seed_fleet(
+                    machines=size, collections=max(1, size // 20), technicians=max(2, size // 20),
+                    repair=max(1, size // 40), seed=size,
+                )
+                for cache in caches.all():
+                    cache.clear()
+                user = User.objects.create_superuser("benchmark", password="benchmark")
+                started = time.perf_counter()
+                results = run_benchmarks(user, options["repeat"], options["only"])
+                report["results"][str(size)] = results
+                self.stdout.write(f"\n{size} machines ({time.perf_counter() - started:.1f}s)")
+                self.stdout.write(f"  {'endpoint':<55} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8} {'peak KiB':>10}")
+                for label, result in results.items():
+                    if "skipped" in result:
+                        self.stdout.write(f"  {label:<55} skipped: {result['skipped']}")
+                        continue
+                    self.stdout.write(
+                        f"  {label:<55} {result['status']:>6} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                        f"{result['queries']:>8} {result['peak_kib']:>10.1f}"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = Path(options["output"] or settings.BASE_DIR / "storage" / "benchmarks" /
+                      f"{revision or timezone.now().strftime('%Y%m%d-%H%M%S')}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"\nSaved the results to {output}"))
+
+        if previous is not None:
+            self.stdout.write(f"\nCompared with {options['compare']} ({previous.get('revision') or 'unknown revision'}):")
+            for size, label, before, after in compare(previous, report):
+                self.stdout.write(
+                    f"  {size:>6} {label:<55} p50 {before['p50_ms']:>8.2f} -> {after['p50_ms']:>8.2f} ms"
+                    f"   queries {before['queries']:>4} -> {after['queries']:>4}"
+                )
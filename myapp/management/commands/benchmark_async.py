@@ -0,0 +1,84 @@
+"""
+benchmark_async.py
+
+Management command that compares the sync (DRF) and async variants of the machine status API
+under concurrent load (see myapp/benchmarks.py). It seeds a synthetic fleet (see
+myapp/seeding.py) into a throwaway test database (a temporary file: SQLite's in-memory test
+database locks whole tables between connections, which concurrent requests run into), then sends many simultaneous requests to each
+endpoint through the ASGI application, with every commit of the write queue slowed down by the
+simulated latency, and reports throughput, p50/p95 latency and the peak number of threads.
+
+Usage:
+    python manage.py benchmark_async                                    # 500 requests, 100 at a time
+    python manage.py benchmark_async --requests 2000 --concurrency 1000 --latency 0.2
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from myapp.benchmarks import run_async_benchmarks
+from myapp.seeding import seed_fleet
+
+
+class Command(BaseCommand):
+    help = "Compare the throughput of the sync and async machine status API under concurrent load."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--machines", type=int, default=500, help="Size of the seeded fleet (default 500).")
+        parser.add_argument("--requests", type=int, default=500, help="Requests sent to each endpoint (default 500).")
+        parser.add_argument("--concurrency", type=int, default=100, help="Requests in flight at a time (default 100).")
+        parser.add_argument(
+            "--latency", type=float, default=0.05,
+            help="Seconds added to every commit of the write queue, simulating a slow disk (default 0.05).",
+        )
+        parser.add_argument("--output", default=None, help="Also save the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options["machines"] < 1 or options["requests"] < 1 or options["concurrency"] < 1 or options["latency"] < 0:
+            raise CommandError("--machines, --requests and --concurrency must be positive, --latency at least 0.")
+
+        setup_test_environment()
+        database_dir = None
+        if connection.vendor == "sqlite":
+            database_dir = tempfile.mkdtemp()
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(database_dir, "benchmark.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed_fleet(machines=options["machines"], collections=max(1, options["machines"] // 20), seed=0)
+            for cache in caches.all():
+                cache.clear()
+            started = time.perf_counter()
+            results = run_async_benchmarks(options["requests"], options["concurrency"], options["latency"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if database_dir:
+                shutil.rmtree(database_dir, ignore_errors=True)
+
+        self.stdout.write(
+            f"\n{options['requests']} requests per endpoint, {options['concurrency']} at a time, "
+            f"{options['latency'] * 1000:.0f} ms added per commit ({time.perf_counter() - started:.1f}s)"
+        )
+        self.stdout.write(f"  {'endpoint':<50} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'threads':>8}  statuses")
+        for label, result in results.items():
+            self.stdout.write(
+                f"  {label:<50} {result['requests_per_second']:>9.1f} {result['p50_ms']:>9.2f} "
+                f"{result['p95_ms']:>9.2f} {result['peak_threads']:>8}  {result['statuses']}"
+            )
+
+        if options["output"]:
+            output = Path(options["output"])
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_text(json.dumps({"options": {
+                name: options[name] for name in ("machines", "requests", "concurrency", "latency")
+            }, "results": results}, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"\nSaved the results to {output}"))
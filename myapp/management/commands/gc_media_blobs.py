@@ -0,0 +1,86 @@
+"""
+gc_media_blobs.py
+
+Management command that garbage-collects the content-addressed media storage. It recounts the
+references to every blob from the Machine and FaultNote images, corrects the stored reference
+counts (MediaBlob), and deletes the blobs nothing refers to, including files left behind by
+uploads whose transaction was rolled back. Files younger than the grace period are kept, as they
+may belong to an upload that has not been committed yet.
+
+Usage:
+    python manage.py gc_media_blobs                      # collect unreferenced blobs
+    python manage.py gc_media_blobs --dry-run            # only report what would be deleted
+    python manage.py gc_media_blobs --grace-minutes 10   # grace period for recent files (default 60)
+"""
+
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from myapp.models import MediaBlob
+from myapp.storage import CAS_PREFIX, get_media_storage
+
+
+class Command(BaseCommand):
+    help = "Recount media blob references and delete unreferenced blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the blobs that would be deleted.",
+        )
+        parser.add_argument(
+            "--grace-minutes",
+            type=int,
+            default=60,
+            help="Keep files modified less than this many minutes ago.",
+        )
+
+    def handle(self, *args, **options):
+        storage = get_media_storage()
+        cutoff = timezone.now() - timedelta(minutes=options["grace_minutes"])
+
+        with transaction.atomic():
+            references = MediaBlob.objects.recount()
+            stored = dict(MediaBlob.objects.values_list("name", "refcount"))
+            for name, refcount in stored.items():
+                if references.get(name, 0) != refcount:
+                    self.stdout.write(f"{name}: reference count is {refcount}, actual is {references.get(name, 0)}")
+
+            # Blob files on disk that nothing refers to, and leftovers of interrupted uploads.
+            orphans, stale_temp_files = [], []
+            for directory, _dirs, files in os.walk(storage.path(CAS_PREFIX)):
+                for filename in files:
+                    path = os.path.join(directory, filename)
+                    name = os.path.relpath(path, storage.location).replace(os.sep, "/")
+                    if storage.get_modified_time(name) >= cutoff:
+                        continue
+                    if not storage.is_blob(name):
+                        stale_temp_files.append(name)
+                    elif name not in references:
+                        orphans.append(name)
+            unreferenced = sorted(set(orphans) | {name for name in stored if name not in references})
+
+            if options["dry_run"]:
+                for name in unreferenced + stale_temp_files:
+                    self.stdout.write(f"Would delete {name}")
+                return
+
+            for name, refcount in references.items():
+                MediaBlob.objects.update_or_create(name=name, defaults={"refcount": refcount})
+            recent = {name for name in unreferenced
+                      if storage.exists(name) and storage.get_modified_time(name) >= cutoff}
+            unreferenced = [name for name in unreferenced if name not in recent]
+            for name in unreferenced:
+                MediaBlob.objects.update_or_create(name=name, defaults={"refcount": 0})
+            deleted = MediaBlob.objects.collect(unreferenced)
+            for name in stale_temp_files:
+                storage.delete(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {len(deleted)} unreferenced blob(s) and {len(stale_temp_files)} temporary file(s)."
+        ))
@@ -0,0 +1,30 @@
+"""
+generate_image_variants.py
+
+Management command that generates the missing resized variants (see myapp/images.py) of the
+Machine and FaultNote images, e.g. for images uploaded before variants existed or whose variants
+were removed, and records their widths on the rows. New uploads get their variants when they are
+committed; the API and the templates only derive the variant URLs (serving the original image
+while none are recorded) and never generate them while serving a request.
+
+Usage:
+    python manage.py generate_image_variants
+"""
+
+from django.core.management.base import BaseCommand
+
+from myapp.images import record_variants
+from myapp.models import FaultNote, Machine
+
+
+class Command(BaseCommand):
+    help = "Generate the missing resized variants of the uploaded images."
+
+    def handle(self, *args, **options):
+        images = 0
+        for model in (Machine, FaultNote):
+            rows = model.objects.exclude(image="").exclude(image__isnull=True).only("image")
+            for row in rows.iterator():
+                record_variants(row.image)
+                images += 1
+        self.stdout.write(self.style.SUCCESS(f"Checked the variants of {images} images."))
@@ -0,0 +1,25 @@
+"""
+rebuild_search_index.py
+
+Management command that rebuilds the full-text search index over the fault history (fault
+titles, machine names and fault notes) from the FaultCase and FaultNote tables. The index is
+normally kept in sync on write; rebuilding is only needed after writes that bypass the ORM
+signals (raw SQL, queryset.update(), fixtures loaded with --raw).
+
+Usage:
+    python manage.py rebuild_search_index
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index over fault cases and notes."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} fault cases."))
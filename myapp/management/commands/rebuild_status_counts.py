@@ -0,0 +1,59 @@
+"""
+rebuild_status_counts.py
+
+Management command that verifies and rebuilds the precomputed machine status counters
+(MachineStatusCount) and the per-collection counters (CollectionStatusCount) against the
+Machine, FaultCase and collection membership tables. The counters are normally maintained
+incrementally, but writes that bypass the ORM signals (raw SQL, fixtures, manual database edits)
+can make them drift.
+
+Usage:
+    python manage.py rebuild_status_counts           # rebuild the counters
+    python manage.py rebuild_status_counts --check   # only report drift (exit code 1 if found)
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from myapp.models import CollectionStatusCount, MachineStatusCount
+
+
+class Command(BaseCommand):
+    help = "Verify and rebuild the precomputed machine status counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare the counters with the Machine table; exit with an error if they differ.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stored = MachineStatusCount.objects.totals()
+            actual = MachineStatusCount.objects.recount()
+            drift = {status: (stored.get(status, 0), count) for status, count in actual.items()
+                     if stored.get(status, 0) != count}
+
+            for status, (stored_count, actual_count) in drift.items():
+                self.stdout.write(f"{status}: counter is {stored_count}, actual is {actual_count}")
+
+            stored_collections = CollectionStatusCount.objects.stored()
+            actual_collections = CollectionStatusCount.objects.recount()
+            collection_drift = {pk: counts for pk, counts in actual_collections.items()
+                                if stored_collections.get(pk, dict.fromkeys(counts, 0)) != counts}
+
+            for pk, counts in collection_drift.items():
+                self.stdout.write(f"Collection {pk}: counters are {stored_collections.get(pk)}, actual is {counts}")
+
+            if options["check"]:
+                if drift or collection_drift:
+                    raise CommandError("Machine status counters are out of date.")
+                self.stdout.write(self.style.SUCCESS("Machine status counters are up to date."))
+                return
+
+            MachineStatusCount.objects.rebuild()
+            CollectionStatusCount.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt machine status counters: {actual} and the counters of {len(actual_collections)} collections"
+        ))
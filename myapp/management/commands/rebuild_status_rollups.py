@@ -0,0 +1,25 @@
+"""
+rebuild_status_rollups.py
+
+Management command that recomputes the hourly and daily machine and collection status rollups
+by replaying the append-only MachineStatusEvent log. The rollups are normally maintained
+incrementally; rebuilding is only needed after editing history by hand, or to re-attribute
+history after machines moved between collections (the replay uses current memberships).
+
+Usage:
+    python manage.py rebuild_status_rollups
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the machine and collection status rollups from the status event log."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            replayed = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt status rollups from {replayed} status events."))
@@ -0,0 +1,63 @@
+"""
+seed_fleet.py
+
+Management command that fills the database with a realistic synthetic fleet (see
+myapp/seeding.py) for load testing and benchmarking: users of every role, machines in
+collections with assignments and a status history, fault cases with notes, and warnings.
+
+Usage:
+    python manage.py seed_fleet                                  # 200 machines, 10 collections
+    python manage.py seed_fleet --machines 5000 --collections 50 --technicians 40
+    python manage.py seed_fleet --faults-per-machine 3 --notes-per-fault 5 --seed 42
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from myapp.seeding import seed_fleet
+
+
+class Command(BaseCommand):
+    help = "Bulk-create a synthetic fleet of machines, users, faults, notes and warnings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--machines", type=int, default=200, help="Number of machines (default 200).")
+        parser.add_argument("--collections", type=int, default=10, help="Number of collections (default 10).")
+        parser.add_argument("--managers", type=int, default=2, help="Number of Manager users (default 2).")
+        parser.add_argument("--technicians", type=int, default=10, help="Number of Technician users (default 10).")
+        parser.add_argument("--repair", type=int, default=5, help="Number of Repair users (default 5).")
+        parser.add_argument("--viewonly", type=int, default=3, help="Number of View-only users (default 3).")
+        parser.add_argument(
+            "--faults-per-machine", type=float, default=1.0,
+            help="Average number of resolved fault cases per machine (default 1).",
+        )
+        parser.add_argument("--notes-per-fault", type=int, default=3, help="Notes per fault case (default 3).")
+        parser.add_argument("--password", default="password", help="Password of the seeded users.")
+        parser.add_argument("--seed", type=int, default=None, help="Random seed, for a reproducible fleet.")
+        parser.add_argument(
+            "--prefix", default="seed",
+            help="Prefix of the usernames and collection names (default 'seed'); must be new.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            created = seed_fleet(
+                machines=options["machines"],
+                collections=options["collections"],
+                managers=options["managers"],
+                technicians=options["technicians"],
+                repair=options["repair"],
+                viewonly=options["viewonly"],
+                faults_per_machine=options["faults_per_machine"],
+                notes_per_fault=options["notes_per_fault"],
+                password=options["password"],
+                seed=options["seed"],
+                prefix=options["prefix"],
+            )
+        except IntegrityError as exc:
+            raise CommandError(f"Could not seed the fleet (already seeded with prefix '{options['prefix']}'?): {exc}")
+        summary = ", ".join(f"{count} {table.replace('_', ' ')}" for table, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} in {time.perf_counter() - started:.1f}s."))
@@ -0,0 +1,134 @@
+"""
+metrics.py
+
+This module keeps in-process metrics of what the application does: counters (e.g. how many
+machine status writes were applied and how many were elided because they changed nothing) and
+histograms (e.g. request latency per view, recorded by RequestMetricsMiddleware). Metrics may
+carry labels, such as the view name. They are per process, start at zero when it starts, and
+are exposed in the Prometheus text format at /metrics (see render_prometheus()).
+"""
+
+import bisect
+import threading
+from collections import defaultdict
+
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the queries-per-request histogram buckets.
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Name -> (type, help text, histogram buckets) of the metrics with a description; metrics
+# without one are exported as untyped.
+DESCRIPTIONS = {
+    "http_requests": ("counter", "HTTP requests served, by view, method and status code.", None),
+    "http_request_duration_seconds": ("histogram", "HTTP request latency, by view.", LATENCY_BUCKETS),
+    "http_request_db_queries": ("histogram", "SQL queries run per HTTP request, by view.", QUERY_COUNT_BUCKETS),
+    "db_queries": ("counter", "SQL queries run while serving HTTP requests, by view.", None),
+    "db_query_duration_seconds": ("counter", "Time spent in SQL queries while serving HTTP requests, by view.", None),
+    "db_slow_queries": ("counter", "SQL queries slower than SLOW_QUERY_THRESHOLD_MS, by view.", None),
+    "machine_status_writes_applied": ("counter", "Machine status updates written.", None),
+    "machine_status_writes_elided": ("counter", "Machine status updates not written: the status was unchanged.", None),
+    "machine_status_writes_debounced": ("counter", "Machine status updates held back by the debouncer.", None),
+}
+
+_counters = defaultdict(float)
+_histograms = {}
+_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    """
+    Adds `amount` to the counter `name` (with the given labels).
+    """
+    if amount:
+        with _lock:
+            _counters[_key(name, labels)] += amount
+
+
+def observe(name, value, **labels):
+    """
+    Records `value` in the histogram `name` (with the given labels).
+    """
+    buckets = DESCRIPTIONS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+        histogram[0][bisect.bisect_left(buckets, value)] += 1
+        histogram[1] += value
+
+
+def snapshot():
+    """
+    Returns a {name: value} copy of every counter, summed over its labels.
+    """
+    totals = defaultdict(float)
+    with _lock:
+        for (name, _labels), value in _counters.items():
+            totals[name] += value
+    return {name: int(value) if value == int(value) else value for name, value in totals.items()}
+
+
+def reset():
+    """
+    Sets every metric back to zero.
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus(prefix="myapp_"):
+    """
+    Returns every metric in the Prometheus text exposition format (version 0.0.4).
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: ([*counts], total) for key, (counts, total) in _histograms.items()}
+
+    by_name = defaultdict(list)
+    for (name, labels), value in counters.items():
+        by_name[name].append((labels, value))
+    for (name, labels), histogram in histograms.items():
+        by_name[name].append((labels, histogram))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text, buckets = DESCRIPTIONS.get(name, ("untyped", None, None))
+        exported = f"{prefix}{name}_total" if kind == "counter" else f"{prefix}{name}"
+        if help_text:
+            lines.append(f"# HELP {exported} {help_text}")
+        lines.append(f"# TYPE {exported} {kind}")
+        for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+            if kind != "histogram":
+                lines.append(f"{exported}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip([*buckets, "+Inf"], counts):
+                cumulative += count
+                le = bound if bound == "+Inf" else _format_value(bound)
+                lines.append(f"{exported}_bucket{_format_labels(labels, le=le)} {cumulative}")
+            lines.append(f"{exported}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{exported}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
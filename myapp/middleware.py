@@ -0,0 +1,301 @@
+"""
+middleware.py
+
+This module contains the middleware of the web application.
+Every middleware here supports both sync and async requests, so that under ASGI
+(mysite/asgi.py) the async views (machine_events, the async API) run on the event loop instead
+of being moved to a thread by a sync-only middleware.
+"""
+
+import contextvars
+import logging
+import mimetypes
+import os
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+from . import metrics
+from .profiling import profile_request, wants_profile
+from .staticfiles import ENCODINGS
+
+slow_query_logger = logging.getLogger("myapp.slow_queries")
+
+# Backend that loads the user of a session together with its profile (see roles.py).
+PROFILE_BACKEND = "myapp.roles.ProfileModelBackend"
+# Backends whose sessions are moved over to PROFILE_BACKEND.
+UPGRADED_BACKENDS = ("django.contrib.auth.backends.ModelBackend",)
+
+# HTTP methods recorded as themselves in the request metrics; any other (client-supplied) method
+# is recorded as "other", so the label cannot grow without bound.
+METRIC_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+# Cache lifetimes (seconds) of static files with and without a content hash in their name.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+UNVERSIONED_MAX_AGE = 60
+
+
+class ProfileAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    Django's AuthenticationMiddleware, loading request.user and its UserProfile in one joined
+    query so the role checks (roles.role_required) and the navbar do not query the profile.
+    Sessions created by the plain ModelBackend (before it was replaced in settings) are
+    switched to ProfileModelBackend instead of being logged out.
+    """
+    def process_request(self, request):
+        if request.session.get(BACKEND_SESSION_KEY) in UPGRADED_BACKENDS:
+            request.session[BACKEND_SESSION_KEY] = PROFILE_BACKEND
+        super().process_request(request)
+
+
+class StaticAssetMiddleware:
+    """
+    Serves the collected static files (STATIC_ROOT, see staticfiles.py) with caching headers:
+      - the brotli or gzip precompressed copy of a file when the client accepts it,
+      - `Cache-Control: immutable` with a one-year max-age for content-hashed file names, and a
+        short max-age for unversioned names, which can change,
+      - ETag/Last-Modified validators, answering conditional requests with 304 Not Modified.
+    Requests for files that are not in STATIC_ROOT are passed on (e.g. to runserver's finders).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.static_url = "/" + settings.STATIC_URL.lstrip("/") if settings.STATIC_URL else None
+        self.static_root = str(settings.STATIC_ROOT) if settings.STATIC_ROOT else None
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.serve_static(request)
+        if response is not None:
+            return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        response = self.serve_static(request)
+        if response is not None:
+            return response
+        return await self.get_response(request)
+
+    def serve_static(self, request):
+        if self.static_url and self.static_root and request.method in ("GET", "HEAD") \
+                and request.path.startswith(self.static_url):
+            return self.serve(request, request.path[len(self.static_url):])
+        return None
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.static_root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not name or not os.path.isfile(path):
+            return None
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        encoding = None
+        for candidate, suffix in ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+
+        stat = os.stat(path)
+        etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}" + (f"-{encoding}" if encoding else ""))
+        last_modified = http_date(stat.st_mtime)
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            content_type, _ = mimetypes.guess_type(name)
+            response = FileResponse(open(path, "rb"), content_type=content_type or "application/octet-stream")
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = last_modified
+        response.headers["Vary"] = "Accept-Encoding"
+        if is_hashed_static_name(name):
+            response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            response.headers["Cache-Control"] = f"public, max-age={UNVERSIONED_MAX_AGE}"
+        return response
+
+
+def accepted_encodings(header):
+    """
+    Returns the set of content codings an Accept-Encoding header accepts (q-value above 0).
+    """
+    accepted = set()
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def is_hashed_static_name(name):
+    """
+    Whether a static file name is one of the content-hashed names listed in the manifest.
+    """
+    hashed_files = getattr(staticfiles_storage, "hashed_files", None)
+    if not hashed_files:
+        return False
+    return re.sub(r"\.(br|gz)$", "", name) in hashed_files.values()
+
+
+# QueryStats of the request being served in the current context (thread or async task).
+_current_query_stats = contextvars.ContextVar("current_query_stats", default=None)
+
+
+def record_request_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper installed on every connection (see install_query_stats_wrapper()),
+    passing each query to the QueryStats of the request being served, if any. The stats are
+    found through a context variable, which sync_to_async() carries over to the thread the ORM
+    work of an async view runs in, so the queries of ASGI requests are counted too.
+    """
+    query_stats = _current_query_stats.get()
+    if query_stats is None:
+        return execute(sql, params, many, context)
+    return query_stats(execute, sql, params, many, context)
+
+
+def install_query_stats_wrapper(sender, connection, **kwargs):
+    """
+    connection_created receiver adding record_request_query() to every new database connection.
+    """
+    if record_request_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_request_query)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records, per view, the latency of every request, its status code, the number of SQL queries
+    it ran and the time spent in them (through the record_request_query() execute wrapper), in
+    the metrics exported at /metrics (see metrics.py). With SLOW_QUERY_THRESHOLD_MS set, queries
+    slower than that are also logged to the "myapp.slow_queries" logger with the view that ran
+    them.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        query_stats = QueryStats(getattr(settings, "SLOW_QUERY_THRESHOLD_MS", None), request)
+        token = _current_query_stats.set(query_stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_query_stats.reset(token)
+        self.record(request, response, query_stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        query_stats = QueryStats(getattr(settings, "SLOW_QUERY_THRESHOLD_MS", None), request)
+        token = _current_query_stats.set(query_stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_query_stats.reset(token)
+        self.record(request, response, query_stats, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, query_stats, duration):
+        view = request_view_name(request)
+        method = request.method if request.method in METRIC_METHODS else "other"
+        metrics.increment("http_requests", view=view, method=method, status=response.status_code)
+        metrics.observe("http_request_duration_seconds", duration, view=view)
+        metrics.observe("http_request_db_queries", query_stats.count, view=view)
+        metrics.increment("db_queries", query_stats.count, view=view)
+        metrics.increment("db_query_duration_seconds", query_stats.duration, view=view)
+        metrics.increment("db_slow_queries", query_stats.slow, view=view)
+
+
+class QueryStats:
+    """
+    Database execute wrapper counting the queries of one request and the time spent in them.
+    """
+    def __init__(self, slow_threshold_ms, request):
+        self.slow_threshold = slow_threshold_ms / 1000 if slow_threshold_ms else None
+        self.request = request
+        self.count = 0
+        self.duration = 0.0
+        self.slow = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if self.slow_threshold is not None and elapsed >= self.slow_threshold:
+                self.slow += 1
+                slow_query_logger.warning(
+                    "Slow query (%.1f ms) in %s: %s", elapsed * 1000, request_view_name(self.request), sql,
+                )
+
+
+class ProfilingMiddleware:
+    """
+    Runs the requests picked by profiling.wants_profile() (asked for by a superuser with the
+    `X-Profile: 1` header or `?_profile=1`, or sampled at PROFILE_SAMPLE_RATE) under the profiler,
+    and saves their report under PROFILE_DIR. The id of the report is returned in the
+    `X-Profile-Id` response header. Placed after the authentication middleware, which sets
+    request.user.
+    Async requests (under ASGI) are not profiled: cProfile follows one thread, while an async
+    request moves between the event loop and worker threads, alongside other requests.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        if wants_profile(request):
+            response, report_id = profile_request(request, self.get_response)
+            if response is not None:
+                response.headers["X-Profile-Id"] = report_id
+                return response
+        return self.get_response(request)
+
+
+def request_view_name(request):
+    """
+    The name under which a request's metrics are recorded: its URL name (or the dotted path of
+    its view), or "unresolved" for requests that matched no view (404s, static files).
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name or match._func_path
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:36
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_status_counts(apps, schema_editor):
+    # Start the counters from the machines that already exist.
+    Machine = apps.get_model('myapp', 'Machine')
+    MachineStatusCount = apps.get_model('myapp', 'MachineStatusCount')
+    totals = {'OK': 0, 'Warning': 0, 'Fault': 0}
+    totals.update(Machine.objects.order_by().values_list('status').annotate(n=Count('id')))
+    MachineStatusCount.objects.bulk_create(
+        [MachineStatusCount(status=status, count=count) for status, count in totals.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineStatusCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('OK', 'OK'), ('Warning', 'Warning'), ('Fault', 'Fault')], max_length=10, unique=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_status_counts, migrations.RunPython.noop),
+    ]
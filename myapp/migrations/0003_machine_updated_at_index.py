@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_machinestatuscount'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['updated_at', 'id'], name='machine_updated_at_id_idx'),
+        ),
+    ]
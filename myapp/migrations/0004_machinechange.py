@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:39
+
+from django.db import migrations, models
+
+
+def seed_machine_changes(apps, schema_editor):
+    # Give every existing machine a position in the change sequence so a sync from the
+    # beginning of the feed returns the whole fleet.
+    Machine = apps.get_model('myapp', 'Machine')
+    MachineChange = apps.get_model('myapp', 'MachineChange')
+    MachineChange.objects.bulk_create(
+        [MachineChange(machine_id=pk) for pk in Machine.objects.order_by('pk').values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_machine_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MachineChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('machine_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(seed_machine_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_status_events(apps, schema_editor):
+    # Start the history of every existing machine with its current status.
+    Machine = apps.get_model('myapp', 'Machine')
+    MachineStatusEvent = apps.get_model('myapp', 'MachineStatusEvent')
+    now = django.utils.timezone.now()
+    MachineStatusEvent.objects.bulk_create(
+        [MachineStatusEvent(machine_id=pk, to_status=status, at=now)
+         for pk, status in Machine.objects.order_by('pk').values_list('pk', 'status')],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_machinechange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionStatusRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('status', models.CharField(choices=[('OK', 'OK'), ('Warning', 'Warning'), ('Fault', 'Fault')], max_length=10)),
+                ('seconds', models.FloatField(default=0)),
+                ('entered', models.PositiveIntegerField(default=0)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_rollups', to='myapp.collection')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('collection', 'period', 'bucket_start', 'status'), name='unique_collection_status_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MachineStatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('OK', 'OK'), ('Warning', 'Warning'), ('Fault', 'Fault')], max_length=10, null=True)),
+                ('to_status', models.CharField(choices=[('OK', 'OK'), ('Warning', 'Warning'), ('Fault', 'Fault')], max_length=10)),
+                ('at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='myapp.machine')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['machine', 'at'], name='statusevent_machine_at_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MachineStatusRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('hour', 'Hourly'), ('day', 'Daily')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('status', models.CharField(choices=[('OK', 'OK'), ('Warning', 'Warning'), ('Fault', 'Fault')], max_length=10)),
+                ('seconds', models.FloatField(default=0)),
+                ('entered', models.PositiveIntegerField(default=0)),
+                ('machine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_rollups', to='myapp.machine')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('machine', 'period', 'bucket_start', 'status'), name='unique_machine_status_rollup')],
+            },
+        ),
+        migrations.RunPython(seed_status_events, migrations.RunPython.noop),
+    ]
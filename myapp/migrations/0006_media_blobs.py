@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:46
+
+import myapp.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_machine_status_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='faultnote',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=myapp.storage.get_media_storage, upload_to='fault_notes/'),
+        ),
+        migrations.AlterField(
+            model_name='machine',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=myapp.storage.get_media_storage, upload_to='machines/'),
+        ),
+    ]
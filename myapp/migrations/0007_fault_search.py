@@ -0,0 +1,59 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # The full-text index over fault cases (see myapp/search.py): an FTS5 virtual table on
+    # SQLite, a table with a generated tsvector column and a GIN index on PostgreSQL.
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE myapp_faultsearch USING fts5(title, machine, notes, "
+            "tokenize = 'porter unicode61 remove_diacritics 2')"
+        )
+        key = "rowid"
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE TABLE myapp_faultsearch ("
+            "fault_case_id bigint PRIMARY KEY, title text, machine text, notes text, "
+            "document tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(machine, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(notes, '')), 'C')) STORED)"
+        )
+        schema_editor.execute("CREATE INDEX myapp_faultsearch_document_idx ON myapp_faultsearch USING gin (document)")
+        key = "fault_case_id"
+    else:
+        return
+
+    # Index the existing fault history.
+    FaultCase = apps.get_model("myapp", "FaultCase")
+    FaultNote = apps.get_model("myapp", "FaultNote")
+    notes = {}
+    for fault_id, note in FaultNote.objects.order_by("fault_case_id", "created_at", "pk") \
+            .values_list("fault_case_id", "note").iterator(chunk_size=2000):
+        notes.setdefault(fault_id, []).append(note)
+    rows = [
+        (pk, title or "", machine_name, "\n".join(notes.get(pk, [])))
+        for pk, title, machine_name in FaultCase.objects.values_list("pk", "title", "machine__name").iterator(chunk_size=2000)
+    ]
+    if rows:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO myapp_faultsearch ({key}, title, machine, notes) VALUES (%s, %s, %s, %s)", rows,
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE IF EXISTS myapp_faultsearch")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_media_blobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
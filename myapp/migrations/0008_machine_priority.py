@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_priority(apps, schema_editor):
+    # One set-based UPDATE per status for the machines that already exist.
+    Machine = apps.get_model('myapp', 'Machine')
+    for status, priority in (('Fault', 1), ('Warning', 2), ('OK', 3)):
+        Machine.objects.filter(status=status).update(priority=priority)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_fault_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='machine',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=3, editable=False),
+        ),
+        migrations.RunPython(backfill_priority, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='machine',
+            index=models.Index(fields=['priority', 'created_at'], name='machine_priority_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='machine',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('priority', 1), ('status', 'Fault')), models.Q(('priority', 2), ('status', 'Warning')), models.Q(('priority', 3), ('status', 'OK')), _connector='OR'), name='machine_priority_matches_status'),
+        ),
+    ]
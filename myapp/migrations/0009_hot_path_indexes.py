@@ -0,0 +1,55 @@
+# Generated by Django 5.1.7 on 2026-10-17 17:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalize_warnings(apps, schema_editor):
+    # Fill in the normalized text of the existing warnings and deactivate all but the oldest of
+    # any duplicate active warnings, so the unique constraint can be added.
+    Warning = apps.get_model('myapp', 'Warning')
+    seen = set()
+    duplicates = []
+    warnings = list(Warning.objects.order_by('created_at', 'pk').only('machine_id', 'warning_text', 'active'))
+    for warning in warnings:
+        warning.warning_text_normalized = " ".join(warning.warning_text.split()).casefold()
+        if warning.active:
+            key = (warning.machine_id, warning.warning_text_normalized)
+            if key in seen:
+                duplicates.append(warning.pk)
+            seen.add(key)
+    Warning.objects.bulk_update(warnings, ['warning_text_normalized'], batch_size=1000)
+    Warning.objects.filter(pk__in=duplicates).update(active=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0008_machine_priority'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='warning',
+            name='warning_text_normalized',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(normalize_warnings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='faultcase',
+            index=models.Index(fields=['status', '-created_at'], name='faultcase_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='faultnote',
+            index=models.Index(fields=['fault_case', '-created_at', '-id'], name='faultnote_case_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warning',
+            index=models.Index(condition=models.Q(('active', True)), fields=['-created_at'], name='warning_active_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='warning',
+            constraint=models.UniqueConstraint(condition=models.Q(('active', True)), fields=('machine', 'warning_text_normalized'), name='unique_active_warning_text'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_collection_counts(apps, schema_editor):
+    # Start the counters from the collections, memberships and fault cases that already exist.
+    Collection = apps.get_model('myapp', 'Collection')
+    CollectionStatusCount = apps.get_model('myapp', 'CollectionStatusCount')
+    fields = {'OK': 'ok', 'Warning': 'warning', 'Fault': 'fault'}
+    counts = {pk: CollectionStatusCount(collection_id=pk) for pk in Collection.objects.values_list('pk', flat=True)}
+    memberships = Collection.machines.through.objects.order_by()
+    for collection_id, status, n in memberships.values_list('collection_id', 'machine__status').annotate(n=Count('id')):
+        setattr(counts[collection_id], fields[status], n)
+    for collection_id, n in memberships.filter(machine__fault_cases__status='open') \
+            .values_list('collection_id').annotate(n=Count('machine__fault_cases')):
+        counts[collection_id].open_faults = n
+    CollectionStatusCount.objects.bulk_create(counts.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0010_board_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionStatusCount',
+            fields=[
+                ('collection', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='status_count', serialize=False, to='myapp.collection')),
+                ('ok', models.IntegerField(default=0)),
+                ('warning', models.IntegerField(default=0)),
+                ('fault', models.IntegerField(default=0)),
+                ('open_faults', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_collection_counts, migrations.RunPython.noop),
+    ]
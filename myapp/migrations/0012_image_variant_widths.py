@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-17 19:19
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+from myapp.images import VARIANT_WIDTHS, variant_name
+
+
+def record_existing_variants(apps, schema_editor):
+    # Record the variants already generated for the existing images; images without any are
+    # served as the original until `generate_image_variants` runs.
+    for model_name in ('Machine', 'FaultNote'):
+        model = apps.get_model('myapp', model_name)
+        for row in model.objects.exclude(image='').exclude(image__isnull=True).only('image').iterator():
+            widths = [width for width in VARIANT_WIDTHS if default_storage.exists(variant_name(row.image.name, width))]
+            if widths:
+                model.objects.filter(pk=row.pk).update(image_variant_widths=widths)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0011_collection_status_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='faultnote',
+            name='image_variant_widths',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='machine',
+            name='image_variant_widths',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(record_existing_variants, migrations.RunPython.noop),
+    ]
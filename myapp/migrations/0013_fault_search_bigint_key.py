@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def widen_search_key(apps, schema_editor):
+    # FaultCase ids are 64-bit (BigAutoField); databases indexed before 0007 declared the key
+    # bigint still have a 32-bit one. SQLite's rowid is 64-bit already.
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("ALTER TABLE myapp_faultsearch ALTER COLUMN fault_case_id TYPE bigint")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0012_image_variant_widths'),
+    ]
+
+    operations = [
+        migrations.RunPython(widen_search_key, migrations.RunPython.noop),
+    ]
@@ -8,10 +8,18 @@ machine alerts) and Collections (groupings of machines). Each model has been com
 its purpose and design decisions.
 """
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
+from django.utils.functional import cached_property
+from collections import Counter, defaultdict
 import re
 
+from .images import delete_variants
+from .storage import get_media_storage
+
 #####################
 # UserProfile Model #
 #####################
@@ -33,6 +41,224 @@ class UserProfile(models.Model):
         return f"{self.user.username} ({self.get_role_display()})"
 
 
+##########################
+# Dashboard Query Layer  #
+##########################
+class MachineQuerySet(models.QuerySet):
+    """
+    Custom QuerySet for machines used by the role dashboards and reports.
+    Each helper loads the related rows a machine table needs up front, so rendering a board
+    costs a fixed number of queries no matter how many machines are listed.
+    """
+
+    def with_board_data(self):
+        """
+        Prefetch the collections and assigned personnel (with their profiles) of every machine.
+        """
+        return self.prefetch_related(
+            "collections",
+            Prefetch("assigned_to", queryset=User.objects.select_related("userprofile")),
+        )
+
+    def with_report_data(self):
+        """
+        Prefetch only the collection names and assignee usernames needed by the CSV report,
+        and load only the machine columns the report writes.
+        """
+        return self.only("name", "status", "description", "created_at").prefetch_related(
+            Prefetch("collections", queryset=Collection.objects.only("name")),
+            Prefetch("assigned_to", queryset=User.objects.only("username")),
+        )
+
+    def by_priority(self):
+        """
+        Order machines for the boards: Fault first, then Warning, then OK, oldest first within
+        a status. Reads the stored priority column, so the order comes off the
+        (priority, created_at) index instead of a computed expression.
+        """
+        return self.order_by("priority", "created_at")
+
+    def in_collection(self, collection_id):
+        """
+        Machines of this queryset that belong to the given collection. Filters on a subquery of
+        the membership table instead of joining it, so no DISTINCT is needed to drop duplicates.
+        """
+        return self.filter(pk__in=Collection.machines.through.objects.filter(
+            collection_id=collection_id,
+        ).values("machine_id"))
+
+    def with_fault_history(self):
+        """
+        Prefetch every fault case of every machine, newest first.
+        """
+        return self.prefetch_related(
+            Prefetch("fault_cases", queryset=FaultCase.objects.order_by("-created_at")),
+        )
+
+    def changed_status_within(self, window):
+        """
+        Machines in this queryset whose status changed less than `window` (a timedelta) ago,
+        according to their status events. Used to hold back status updates of flapping machines.
+        """
+        # Probes the (machine, at) index once per machine.
+        return self.filter(Exists(
+            MachineStatusEvent.objects.filter(machine=OuterRef("pk"), at__gt=timezone.now() - window)
+        ))
+
+    def set_status(self, new_status):
+        """
+        Set-based status change: moves every machine in this queryset that is not already in
+        `new_status` to it with a single UPDATE (no per-row save()), then sends the
+        machine_status_changed signal so the status bookkeeping stays in step.
+        Returns the list of (machine_id, old_status, new_status) transitions that were applied.
+        """
+        from .signals import machine_status_changed
+
+        with transaction.atomic():
+            changing = list(
+                self.exclude(status=new_status).select_for_update().order_by().values_list("pk", "status")
+            )
+            if not changing:
+                return []
+            Machine.objects.filter(pk__in=[pk for pk, _ in changing]).update(
+                status=new_status,
+                priority=Machine.STATUS_PRIORITY[new_status],
+                updated_at=timezone.now(),
+            )
+            changes = [(pk, old_status, new_status) for pk, old_status in changing]
+            machine_status_changed.send(sender=Machine, changes=changes)
+        return changes
+
+    def recompute_status(self):
+        """
+        Set-based status recompute: derives the status of every machine in this queryset from
+        its fault cases and warnings (Fault with an open fault case, otherwise Warning with an
+        active warning, otherwise OK) in one query, then moves the machines whose status differs
+        with one set_status() per target status. Used after bulk fault case changes.
+        Only statuses backed by a case or a warning are lowered: a Warning without an active
+        warning, or a Fault on a machine without any fault case, was reported by the machine
+        itself (see apply_machine_statuses) and is kept. The machines are locked while their
+        status is derived, so a concurrent change cannot be overwritten with a stale status.
+        Returns the list of (machine_id, old_status, new_status) transitions that were applied.
+        """
+        changes = []
+        with transaction.atomic():
+            derived = self.select_for_update().order_by().annotate(
+                has_fault_case=Exists(FaultCase.objects.filter(machine=OuterRef("pk"))),
+                has_open_fault=Exists(FaultCase.objects.filter(machine=OuterRef("pk"), status="open")),
+                has_active_warning=Exists(Warning.objects.filter(machine=OuterRef("pk"), active=True)),
+            ).values_list("pk", "status", "has_fault_case", "has_open_fault", "has_active_warning")
+            ids_by_status = {}
+            for pk, current, has_fault_case, has_open_fault, has_active_warning in derived:
+                new_status = "Fault" if has_open_fault else "Warning" if has_active_warning else "OK"
+                backed = {"Fault": has_fault_case, "Warning": has_active_warning}.get(current, True)
+                lowered = Machine.STATUS_PRIORITY[new_status] > Machine.STATUS_PRIORITY[current]
+                if new_status != current and (backed or not lowered):
+                    ids_by_status.setdefault(new_status, []).append(pk)
+            for new_status, ids in ids_by_status.items():
+                changes += Machine.objects.filter(pk__in=ids).set_status(new_status)
+        return changes
+
+    def reassign(self, role, user_ids):
+        """
+        Set-based reassignment: makes the given users the only assignees with `role`
+        ("Technician" or "Repair") of every machine in this queryset, in one transaction, with
+        one DELETE of the current `role` assignments and one bulk INSERT into the assignment
+        table however many machines there are (no per-machine remove()/add()). The roles of the
+        users are checked in a single query; a ValidationError is raised if any user does not
+        have `role`. An empty `user_ids` unassigns the `role` personnel. The direct writes do not
+        send m2m_changed, so machines_reassigned is sent instead.
+        Returns the ids of the reassigned machines.
+        """
+        from django.core.exceptions import ValidationError
+        from .signals import machines_reassigned
+
+        if role not in Machine.ASSIGNEE_ROLES:
+            raise ValidationError(f"Machines can only be assigned to {' or '.join(Machine.ASSIGNEE_ROLES)} personnel.")
+        user_ids = set(user_ids)
+        if user_ids:
+            valid = set(User.objects.filter(pk__in=user_ids, userprofile__role=role).values_list("pk", flat=True))
+            if user_ids - valid:
+                invalid = ", ".join(str(pk) for pk in sorted(user_ids - valid))
+                raise ValidationError(f"Not {role} personnel: {invalid}.")
+
+        assignment = Machine.assigned_to.through
+        with transaction.atomic():
+            machine_ids = list(self.order_by().values_list("pk", flat=True))
+            if not machine_ids:
+                return []
+            assignment.objects.filter(machine_id__in=machine_ids, user__userprofile__role=role).delete()
+            assignment.objects.bulk_create(
+                [assignment(machine_id=machine_id, user_id=user_id) for machine_id in machine_ids for user_id in user_ids],
+                batch_size=2000, ignore_conflicts=True,
+            )
+            machines_reassigned.send(sender=Machine, machine_ids=machine_ids)
+        return machine_ids
+
+
+class FaultCaseQuerySet(models.QuerySet):
+    """
+    Custom QuerySet for fault cases used by the fault lists on the dashboards.
+    """
+
+    def with_details(self):
+        """
+        Join the machine and reporter of each fault case and prefetch only the latest note
+        of each case (one correlated subquery), which is what the fault detail modals show.
+        """
+        latest_note = FaultNote.objects.filter(
+            fault_case=OuterRef("fault_case"),
+        ).order_by("-created_at", "-pk").values("pk")[:1]
+        return self.select_related("machine", "reported_by").prefetch_related(
+            Prefetch(
+                "notes",
+                queryset=FaultNote.objects.filter(pk=Subquery(latest_note)),
+                to_attr="prefetched_latest_notes",
+            )
+        )
+
+    def set_status(self, new_status, note=None, user=None):
+        """
+        Set-based fault status change: moves every case in this queryset that is not already in
+        `new_status` ("open" or "resolved") to it with a single UPDATE (no per-case save()),
+        optionally adds the same note to each of them (see add_note()), then recomputes the
+        status of the affected machines in one pass (MachineQuerySet.recompute_status()).
+        Sends fault_status_changed for the cases that changed. Returns their ids.
+        """
+        from .signals import fault_cases_changed, fault_status_changed
+
+        with transaction.atomic():
+            changing = list(self.exclude(status=new_status).order_by().values_list("pk", "machine_id", "status"))
+            fault_ids = [pk for pk, _, _ in changing]
+            if fault_ids:
+                FaultCase.objects.filter(pk__in=fault_ids).update(status=new_status, updated_at=timezone.now())
+                fault_status_changed.send(sender=FaultCase, changes=[
+                    (pk, machine_id, old_status, new_status) for pk, machine_id, old_status in changing
+                ])
+            if note:
+                FaultCase.objects.filter(pk__in=fault_ids).add_note(note, user)
+            elif fault_ids:
+                fault_cases_changed.send(sender=FaultCase, fault_ids=fault_ids)
+            Machine.objects.filter(pk__in={machine_id for _, machine_id, _ in changing}).recompute_status()
+        return fault_ids
+
+    def add_note(self, note, user=None):
+        """
+        Adds the same note to every case in this queryset with one bulk INSERT.
+        The bulk insert sends no post_save, so fault_cases_changed is sent instead (the search
+        index and the boards are updated from it). Returns the ids of the annotated cases.
+        """
+        from .signals import fault_cases_changed
+
+        fault_ids = list(self.order_by().values_list("pk", flat=True))
+        if fault_ids:
+            FaultNote.objects.bulk_create(
+                [FaultNote(fault_case_id=pk, note=note, created_by=user) for pk in fault_ids], batch_size=2000,
+            )
+            fault_cases_changed.send(sender=FaultCase, fault_ids=fault_ids)
+        return fault_ids
+
+
 #################
 # Machine Model #
 #################
@@ -47,19 +273,183 @@ class Machine(models.Model):
         ('Warning', 'Warning'),
         ('Fault', 'Fault'),
     )
+    # Roles of the personnel machines are assigned to (see MachineQuerySet.reassign()).
+    ASSIGNEE_ROLES = ('Technician', 'Repair')
+    # Board order of each status (lower first); stored in `priority`, kept in step with `status`.
+    STATUS_PRIORITY = {
+        'Fault': 1,
+        'Warning': 2,
+        'OK': 3,
+    }
     name = models.CharField(max_length=100)
     description = models.TextField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='OK')
-    image = models.ImageField(upload_to='machines/', blank=True, null=True)
+    priority = models.PositiveSmallIntegerField(default=3, editable=False)
+    image = models.ImageField(upload_to='machines/', storage=get_media_storage, blank=True, null=True)
+    # Widths of the resized variants generated for the image (see images.py); empty until then.
+    image_variant_widths = models.JSONField(default=list, blank=True, editable=False)
 
     assigned_to = models.ManyToManyField(User, related_name='assigned_machines', blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MachineQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Supports cursor pagination of the REST API and the max(updated_at) lookup used
+            # for its conditional GET validators.
+            models.Index(fields=["updated_at", "id"], name="machine_updated_at_id_idx"),
+            # Serves the priority board order (by_priority()) straight from the index.
+            models.Index(fields=["priority", "created_at"], name="machine_priority_created_idx"),
+        ]
+        constraints = [
+            # The stored priority must always match the status.
+            models.CheckConstraint(
+                condition=(
+                    models.Q(status="Fault", priority=1)
+                    | models.Q(status="Warning", priority=2)
+                    | models.Q(status="OK", priority=3)
+                ),
+                name="machine_priority_matches_status",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the name and image loaded from the database so the search index and the media
+        # blob references can be kept up to date (see signals.py).
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_name = instance.__dict__.get("name")
+        instance._loaded_image = instance.__dict__.get("image")
+        return instance
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the machine, keeping `priority` in step with `status`, and records the status
+        transition made by this save (if any) in `_status_transition` as an
+        (old_status, new_status) pair, where old_status is None for a new machine. The post_save
+        receivers in signals.py use it to keep the status bookkeeping (counters etc.) up to date.
+        The old status is read from the row being overwritten, locked until the save commits, not
+        from the instance (which may be stale), so concurrent saves never count a transition
+        twice. Status-only changes should still go through MachineQuerySet.set_status().
+        """
+        self.priority = self.STATUS_PRIORITY[self.status]
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "status" in update_fields and "priority" not in update_fields:
+            kwargs["update_fields"] = update_fields = [*update_fields, "priority"]
+        if self._state.adding:
+            self._status_transition = (None, self.status)
+        elif update_fields is not None and "status" not in update_fields:
+            self._status_transition = None
+        else:
+            with transaction.atomic():
+                previous = Machine.objects.select_for_update().filter(pk=self.pk) \
+                    .values_list("status", flat=True).first()
+                self._status_transition = (previous, self.status) if previous != self.status else None
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
+    @cached_property
+    def assignee_ids(self):
+        """
+        The primary keys of the users assigned to this machine. Uses the prefetched
+        assignments when available, so templates can test membership without a query per row.
+        """
+        return {user.pk for user in self.assigned_to.all()}
+
+
+##############################
+# MachineStatusCount Model   #
+##############################
+class MachineStatusCountManager(models.Manager):
+    """
+    Manager for the per-status machine counters.
+    """
+
+    def totals(self):
+        """
+        Returns a dict mapping every machine status to its current machine count (one small query).
+        """
+        totals = {status: 0 for status, _ in Machine.STATUS_CHOICES}
+        totals.update(self.values_list("status", "count"))
+        return totals
+
+    def apply_changes(self, changes):
+        """
+        Applies a list of (machine_id, old_status, new_status) transitions to the counters.
+        A status of None means the machine did not exist before / no longer exists.
+        """
+        deltas = {}
+        for _machine_id, old_status, new_status in changes:
+            if old_status == new_status:
+                continue
+            if old_status is not None:
+                deltas[old_status] = deltas.get(old_status, 0) - 1
+            if new_status is not None:
+                deltas[new_status] = deltas.get(new_status, 0) + 1
+        for status, delta in deltas.items():
+            if delta and not self.filter(status=status).update(count=F("count") + delta):
+                self.create(status=status, count=delta)
+
+    def recount(self):
+        """
+        Returns the actual number of machines per status, counted from the Machine table.
+        """
+        totals = {status: 0 for status, _ in Machine.STATUS_CHOICES}
+        totals.update(Machine.objects.order_by().values_list("status").annotate(n=Count("id")))
+        return totals
+
+    def rebuild(self):
+        """
+        Overwrites the counters with a fresh count of the Machine table and returns it.
+        """
+        totals = self.recount()
+        for status, count in totals.items():
+            self.update_or_create(status=status, defaults={"count": count})
+        return totals
+
+
+class MachineStatusCount(models.Model):
+    """
+    Holds the number of machines currently in each status, so the dashboards can show summary
+    statistics without counting the Machine table on every request. The rows are updated
+    incrementally (in the same transaction as the status change) by the receivers in signals.py
+    and can be rebuilt with the `rebuild_status_counts` management command.
+    """
+    status = models.CharField(max_length=10, choices=Machine.STATUS_CHOICES, unique=True)
+    count = models.IntegerField(default=0)
+
+    objects = MachineStatusCountManager()
+
+    def __str__(self):
+        return f"{self.status}: {self.count}"
+
+
+#######################
+# MachineChange Model #
+#######################
+class MachineChange(models.Model):
+    """
+    Append-only change sequence for machines, used by the delta-sync API. Every time a machine
+    is created, edited, changes status or is deleted a row is appended; its auto-incrementing
+    `seq` is the monotonic position sync clients resume from, so reading the changes since a
+    cursor is an index range scan whose cost depends on the number of changes, not on the
+    size of the fleet. `machine_id` is deliberately not a foreign key so deletions are kept.
+    """
+    seq = models.BigAutoField(primary_key=True)
+    machine_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Change #{self.seq} of machine {self.machine_id}{' (deleted)' if self.deleted else ''}"
+
 
 ###################
 # FaultCase Model #
@@ -81,9 +471,35 @@ class FaultCase(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     title = models.CharField(max_length=200, blank=True, null=True)
 
+    objects = FaultCaseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Open/resolved fault lists, newest first (repair and technician dashboards).
+            models.Index(fields=["status", "-created_at"], name="faultcase_status_created_idx"),
+        ]
+
     def __str__(self):
         return f"Fault #{self.pk} - {self.machine.name} ({self.get_status_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the status loaded from the database so the open fault counts of the
+        # collections can be kept up to date when it changes (see signals.py).
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+    @property
+    def latest_note(self):
+        """
+        The most recent note on this fault case, or None if it has no notes.
+        Uses the note loaded by FaultCaseQuerySet.with_details() when available.
+        """
+        if hasattr(self, "prefetched_latest_notes"):
+            return self.prefetched_latest_notes[0] if self.prefetched_latest_notes else None
+        return self.notes.order_by("-created_at", "-pk").first()
+
 
 ###################
 # FaultNote Model #
@@ -96,17 +512,68 @@ class FaultNote(models.Model):
     """
     fault_case = models.ForeignKey(FaultCase, on_delete=models.CASCADE, related_name="notes")
     note = models.TextField()
-    image = models.ImageField(upload_to='fault_notes/', blank=True, null=True)
+    image = models.ImageField(upload_to='fault_notes/', storage=get_media_storage, blank=True, null=True)
+    # Widths of the resized variants generated for the image (see images.py); empty until then.
+    image_variant_widths = models.JSONField(default=list, blank=True, editable=False)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name="fault_notes")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Latest note of a fault case (FaultCaseQuerySet.with_details()).
+            models.Index(fields=["fault_case", "-created_at", "-id"], name="faultnote_case_created_idx"),
+        ]
+
     def __str__(self):
         return f"Note for Fault #{self.fault_case.pk} by {self.created_by}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the image loaded from the database so the media blob references can be kept
+        # up to date when it is replaced (see signals.py).
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_image = instance.__dict__.get("image")
+        return instance
+
 
 #################
 # Warning Model #
 #################
+def normalize_warning_text(text):
+    """
+    Returns the form of a warning text used to detect duplicates: case-folded, with runs of
+    whitespace collapsed and leading/trailing whitespace removed.
+    """
+    return " ".join(text.split()).casefold()
+
+
+class WarningManager(models.Manager):
+    """
+    Manager for machine warnings.
+    """
+
+    def add_active(self, machine, warning_text, created_by=None):
+        """
+        Adds an active warning to a machine unless it already has the same one (compared
+        case- and whitespace-insensitively). Race-free: a single INSERT that the database
+        skips if it would violate the unique_active_warning_text constraint. The bulk insert
+        sends no post_save, so warning_added is sent instead when a row is inserted.
+        Returns whether the warning was added (a concurrent duplicate may still count as added).
+        """
+        from .signals import warning_added
+
+        warning = self.model(machine=machine, warning_text=warning_text, created_by=created_by, active=True)
+        warning.warning_text_normalized = normalize_warning_text(warning_text)
+        with transaction.atomic():
+            if self.filter(
+                machine=machine, warning_text_normalized=warning.warning_text_normalized, active=True,
+            ).exists():
+                return False
+            self.bulk_create([warning], ignore_conflicts=True)
+            warning_added.send(sender=self.model, machine_id=machine.pk)
+        return True
+
+
 class Warning(models.Model):
     """
     Represents a warning signal associated with a machine. Warnings are free-text alerts that can
@@ -115,17 +582,69 @@ class Warning(models.Model):
     """
     machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name="warnings")
     warning_text = models.CharField(max_length=255)
+    # Case- and whitespace-insensitive form of warning_text, used to detect duplicate warnings.
+    warning_text_normalized = models.CharField(max_length=255, default="", editable=False)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name="warnings_created")
     active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = WarningManager()
+
+    class Meta:
+        indexes = [
+            # The active warning list (repair dashboard). Lookups of the active warnings of one
+            # machine (delete_warning) use the unique_active_warning_text index below.
+            models.Index(fields=["-created_at"], condition=models.Q(active=True), name="warning_active_created_idx"),
+        ]
+        constraints = [
+            # A machine cannot have the same active warning twice.
+            models.UniqueConstraint(
+                fields=["machine", "warning_text_normalized"], condition=models.Q(active=True),
+                name="unique_active_warning_text",
+            ),
+        ]
+
     def __str__(self):
         return f"Warning on {self.machine.name}: {self.warning_text}"
 
+    def save(self, *args, **kwargs):
+        self.warning_text_normalized = normalize_warning_text(self.warning_text)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "warning_text" in update_fields:
+            kwargs["update_fields"] = [*update_fields, "warning_text_normalized"]
+        super().save(*args, **kwargs)
 
-#################
+
+####################
 # Collection Model #
 ####################
+class CollectionQuerySet(models.QuerySet):
+    """
+    Custom QuerySet for collections.
+    """
+
+    def with_status_counts(self):
+        """
+        Annotate every collection with its machine counts per status (`ok`, `warning`, `fault`),
+        its number of machines (`machine_count`) and of open fault cases (`open_faults`), read
+        from the precomputed CollectionStatusCount row (zero for a collection without one).
+        """
+        counts = {
+            field: Coalesce(F(f"status_count__{field}"), 0)
+            for field in (*CollectionStatusCount.STATUS_FIELDS.values(), "open_faults")
+        }
+        return self.annotate(**counts).annotate(
+            machine_count=sum((F(field) for field in CollectionStatusCount.STATUS_FIELDS.values()), Value(0)),
+        )
+
+    def by_trouble(self):
+        """
+        Order collections worst first: by faulty machines, then open fault cases, then machines
+        needing attention, then name. Requires with_status_counts().
+        """
+        return self.order_by("-fault", "-open_faults", "-warning", "name")
+
+
 class Collection(models.Model):
     """
     Allows you to group machines into collections (for example, by physical location or type).
@@ -135,6 +654,8 @@ class Collection(models.Model):
     name = models.CharField(max_length=50, unique=True)
     machines = models.ManyToManyField(Machine, related_name="collections", blank=True)
 
+    objects = CollectionQuerySet.as_manager()
+
     def clean(self):
         if not re.match(r'^[A-Za-z0-9\-]+$', self.name):
             from django.core.exceptions import ValidationError
@@ -142,3 +663,383 @@ class Collection(models.Model):
 
     def __str__(self):
         return self.name
+
+
+#################################
+# CollectionStatusCount Model   #
+#################################
+class CollectionStatusCountManager(models.Manager):
+    """
+    Manager for the per-collection status counters.
+    """
+
+    def apply(self, deltas):
+        """
+        Applies {collection_id: {field: delta}} to the counters with one F() update per
+        collection, creating the rows of collections that have none yet.
+        """
+        for collection_id, fields in deltas.items():
+            fields = {field: delta for field, delta in fields.items() if delta}
+            if fields and not self.filter(collection_id=collection_id).update(
+                **{field: F(field) + delta for field, delta in fields.items()}
+            ):
+                self.create(collection_id=collection_id, **fields)
+
+    def apply_status_changes(self, changes):
+        """
+        Applies a list of (machine_id, old_status, new_status) machine transitions to the
+        counters of the collections the machines belong to. A deleted machine (new_status None)
+        also takes its open fault cases out of the counts, so this must run before its
+        memberships and fault cases are deleted (machine_status_changed is sent at pre_delete).
+        """
+        from .rollups import collection_memberships
+
+        changes = [(machine_id, old, new) for machine_id, old, new in changes if old != new]
+        memberships = collection_memberships([machine_id for machine_id, _old, _new in changes])
+        if not memberships:
+            return
+        deleted = [machine_id for machine_id, _old, new in changes if new is None and machine_id in memberships]
+        open_faults = dict(
+            FaultCase.objects.filter(machine_id__in=deleted, status="open").order_by()
+            .values_list("machine_id").annotate(n=Count("id"))
+        ) if deleted else {}
+        deltas = defaultdict(Counter)
+        for machine_id, old_status, new_status in changes:
+            for collection_id in memberships.get(machine_id, ()):
+                if old_status is not None:
+                    deltas[collection_id][self.model.STATUS_FIELDS[old_status]] -= 1
+                if new_status is not None:
+                    deltas[collection_id][self.model.STATUS_FIELDS[new_status]] += 1
+                else:
+                    deltas[collection_id]["open_faults"] -= open_faults.get(machine_id, 0)
+        self.apply(deltas)
+
+    def apply_fault_changes(self, changes):
+        """
+        Applies a list of (fault_id, machine_id, old_status, new_status) fault case transitions
+        to the open fault counts of the collections of the machines. A status of None means the
+        fault case did not exist before / no longer exists.
+        """
+        from .rollups import collection_memberships
+
+        machine_deltas = Counter()
+        for _fault_id, machine_id, old_status, new_status in changes:
+            machine_deltas[machine_id] += (new_status == "open") - (old_status == "open")
+        machine_deltas = {machine_id: delta for machine_id, delta in machine_deltas.items() if delta}
+        if not machine_deltas:
+            return
+        deltas = defaultdict(Counter)
+        for machine_id, collection_ids in collection_memberships(list(machine_deltas)).items():
+            for collection_id in collection_ids:
+                deltas[collection_id]["open_faults"] += machine_deltas[machine_id]
+        self.apply(deltas)
+
+    def apply_memberships(self, memberships, sign):
+        """
+        Adds (sign=1) or removes (sign=-1) the machines of a list of (collection_id, machine_id)
+        memberships to/from the counters of their collections: their statuses and their open
+        fault cases, read in one query.
+        """
+        if not memberships:
+            return
+        machines = Machine.objects.filter(pk__in={machine_id for _, machine_id in memberships}).order_by() \
+            .annotate(open_faults=Count("fault_cases", filter=Q(fault_cases__status="open"))) \
+            .values_list("pk", "status", "open_faults")
+        machines = {pk: (machine_status, open_faults) for pk, machine_status, open_faults in machines}
+        deltas = defaultdict(Counter)
+        for collection_id, machine_id in memberships:
+            if machine_id in machines:
+                machine_status, open_faults = machines[machine_id]
+                deltas[collection_id][self.model.STATUS_FIELDS[machine_status]] += sign
+                deltas[collection_id]["open_faults"] += sign * open_faults
+        self.apply(deltas)
+
+    def recount(self):
+        """
+        Returns {collection_id: {field: count}} for every collection, counted from the
+        membership, Machine and FaultCase tables (two grouped queries).
+        """
+        empty = dict.fromkeys((*self.model.STATUS_FIELDS.values(), "open_faults"), 0)
+        totals = {pk: dict(empty) for pk in Collection.objects.values_list("pk", flat=True)}
+        memberships = Collection.machines.through.objects.order_by()
+        for collection_id, machine_status, n in memberships.values_list("collection_id", "machine__status") \
+                .annotate(n=Count("id")):
+            totals[collection_id][self.model.STATUS_FIELDS[machine_status]] = n
+        for collection_id, n in memberships.filter(machine__fault_cases__status="open") \
+                .values_list("collection_id").annotate(n=Count("machine__fault_cases")):
+            totals[collection_id]["open_faults"] = n
+        return totals
+
+    def stored(self):
+        """
+        Returns {collection_id: {field: count}} as currently stored in the counters.
+        """
+        fields = (*self.model.STATUS_FIELDS.values(), "open_faults")
+        return {row["collection_id"]: {field: row[field] for field in fields}
+                for row in self.values("collection_id", *fields)}
+
+    def rebuild(self):
+        """
+        Overwrites the counters with a fresh count (see recount()) and returns it.
+        """
+        totals = self.recount()
+        self.all().delete()
+        self.bulk_create(
+            [self.model(collection_id=pk, **counts) for pk, counts in totals.items()], batch_size=1000,
+        )
+        return totals
+
+
+class CollectionStatusCount(models.Model):
+    """
+    Holds, for one collection (a production line, an area...), the number of its machines in
+    each status and the number of open fault cases on them, so the collections overview and the
+    collection-filtered dashboards do not join and count the membership table on every request.
+    Like MachineStatusCount, the row is updated incrementally (in the same transaction as the
+    write) by the receivers in signals.py: on machine status changes, on fault cases being
+    opened, resolved or deleted and on machines joining or leaving the collection. It can be
+    rebuilt with the `rebuild_status_counts` management command.
+    """
+    # Counter field of each machine status.
+    STATUS_FIELDS = {
+        'OK': 'ok',
+        'Warning': 'warning',
+        'Fault': 'fault',
+    }
+    collection = models.OneToOneField(
+        Collection, on_delete=models.CASCADE, primary_key=True, related_name="status_count",
+    )
+    ok = models.IntegerField(default=0)
+    warning = models.IntegerField(default=0)
+    fault = models.IntegerField(default=0)
+    open_faults = models.IntegerField(default=0)
+
+    objects = CollectionStatusCountManager()
+
+    def __str__(self):
+        return (f"{self.collection_id}: {self.ok} OK, {self.warning} Warning, {self.fault} Fault, "
+                f"{self.open_faults} open faults")
+
+
+##############################
+# MachineStatusEvent Model   #
+##############################
+class MachineStatusEvent(models.Model):
+    """
+    Append-only log of machine status transitions. A row is written (by the receivers in
+    signals.py) every time a machine enters a status, including its initial status when it is
+    created, so the full status history of each machine is kept. The events are the source the
+    status rollups below are maintained from.
+    """
+    STATUS_CHOICES = Machine.STATUS_CHOICES
+
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name="status_events")
+    from_status = models.CharField(max_length=10, choices=STATUS_CHOICES, blank=True, null=True)
+    to_status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Finds the latest event of a machine (when its current status began).
+            models.Index(fields=["machine", "at"], name="statusevent_machine_at_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.machine_id}: {self.from_status or '-'} -> {self.to_status} at {self.at}"
+
+
+##########################
+# Status Rollup Models   #
+##########################
+class StatusRollupQuerySet(models.QuerySet):
+    """
+    QuerySet for the status rollup tables.
+    """
+
+    def add(self, deltas):
+        """
+        Adds time and transition counts to rollup buckets in a fixed number of queries.
+        `deltas` maps (owner_id, period, bucket_start, status) keys to (seconds, entered) pairs.
+        Missing bucket rows are created first, then every bucket is incremented with F()
+        expressions in a single bulk update, so concurrent writers never lose increments.
+        """
+        if not deltas:
+            return
+        owner = self.model.owner_field
+        self.bulk_create(
+            [
+                self.model(**{f"{owner}_id": owner_id}, period=period, bucket_start=bucket_start, status=status)
+                for owner_id, period, bucket_start, status in deltas
+            ],
+            ignore_conflicts=True,
+        )
+        rows = self.filter(
+            **{f"{owner}_id__in": {key[0] for key in deltas}},
+            period__in={key[1] for key in deltas},
+            bucket_start__in={key[2] for key in deltas},
+        )
+        updated = []
+        for row in rows:
+            key = (getattr(row, f"{owner}_id"), row.period, row.bucket_start, row.status)
+            if key in deltas:
+                seconds, entered = deltas[key]
+                row.seconds = F("seconds") + seconds
+                row.entered = F("entered") + entered
+                updated.append(row)
+        self.bulk_update(updated, ["seconds", "entered"], batch_size=500)
+
+
+class StatusRollup(models.Model):
+    """
+    Abstract time-bucketed rollup of machine status history. Each row holds, for one owner
+    (a machine or a collection), one period ("hour" or "day"), one bucket and one status, the
+    number of seconds spent in that status during the bucket and the number of times the status
+    was entered. Rollups are maintained incrementally from the status transitions (see
+    rollups.py), so availability and downtime reports read a few rows per bucket instead of
+    scanning the event log or the fault cases.
+    """
+    PERIOD_CHOICES = (
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+    )
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket_start = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=Machine.STATUS_CHOICES)
+    seconds = models.FloatField(default=0)
+    entered = models.PositiveIntegerField(default=0)
+
+    objects = StatusRollupQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+
+class MachineStatusRollup(StatusRollup):
+    """
+    Status rollup of a single machine.
+    """
+    owner_field = "machine"
+    machine = models.ForeignKey(Machine, on_delete=models.CASCADE, related_name="status_rollups")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["machine", "period", "bucket_start", "status"], name="unique_machine_status_rollup",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.machine_id} {self.period} {self.bucket_start} {self.status}: {self.seconds}s"
+
+
+class CollectionStatusRollup(StatusRollup):
+    """
+    Status rollup of a collection: the sum of the rollups of the machines that were in the
+    collection when their time was recorded.
+    """
+    owner_field = "collection"
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name="status_rollups")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["collection", "period", "bucket_start", "status"], name="unique_collection_status_rollup",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.collection_id} {self.period} {self.bucket_start} {self.status}: {self.seconds}s"
+
+
+###################
+# MediaBlob Model #
+###################
+class MediaBlobManager(models.Manager):
+    """
+    Manager for the reference counts of the content-addressed media blobs.
+    """
+
+    def add_references(self, names):
+        """
+        Adds one reference to each blob in `names` (a name may appear more than once).
+        """
+        deltas = Counter(name for name in names if get_media_storage().is_blob(name))
+        for name, delta in deltas.items():
+            if not self.filter(name=name).update(refcount=F("refcount") + delta):
+                self.create(name=name, refcount=delta)
+
+    def release(self, names):
+        """
+        Removes one reference from each blob in `names` and returns the names of the blobs that
+        are no longer referenced.
+        """
+        deltas = Counter(name for name in names if get_media_storage().is_blob(name))
+        for name, delta in deltas.items():
+            self.filter(name=name).update(refcount=F("refcount") - delta)
+        return list(self.filter(name__in=deltas, refcount__lte=0).values_list("name", flat=True))
+
+    def recount(self):
+        """
+        Returns {blob name: number of references} counted from the Machine and FaultNote images.
+        """
+        references = Counter()
+        for model in (Machine, FaultNote):
+            names = model.objects.exclude(image="").exclude(image__isnull=True).values_list("image", flat=True)
+            references.update(name for name in names.iterator() if get_media_storage().is_blob(name))
+        return references
+
+    def collect(self, names=None):
+        """
+        Deletes the unreferenced blobs (all of them, or those among `names`): their files, their
+        resized variants and their rows. Returns the names of the deleted blobs.
+        """
+        storage = get_media_storage()
+        candidates = self.filter(refcount__lte=0)
+        if names is not None:
+            candidates = candidates.filter(name__in=names)
+        deleted = []
+        with transaction.atomic():
+            for name in candidates.select_for_update().values_list("name", flat=True):
+                # The row is deleted first, only if it still has no reference: an upload of the
+                # same content takes its reference before reusing the file (see storage.py), and
+                # waits on this lock, then re-creates the file, if it comes after.
+                if self.filter(name=name, refcount__lte=0).delete()[0]:
+                    storage.delete(name)
+                    delete_variants(name)
+                    deleted.append(name)
+        return deleted
+
+
+class MediaBlob(models.Model):
+    """
+    Reference count of a content-addressed media blob (see storage.py): the number of Machine and
+    FaultNote rows whose image is stored in it. The counts are updated in the same transaction as
+    the rows by the receivers in signals.py; a blob is deleted once nothing refers to it. The
+    `gc_media_blobs` management command recounts them and removes orphaned files.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = MediaBlobManager()
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} references)"
+
+
+######################
+# BoardVersion Model #
+######################
+class BoardVersion(models.Model):
+    """
+    Version token of a "scope" of dashboard data: the whole board ("board") or the machines of one
+    collection ("collection:<id>"). The cached dashboard fragments are keyed on these tokens (see
+    board_cache.py); the receivers in signals.py replace a scope's token with a new random one, in
+    the same transaction as the write, whenever data shown in that scope changes. Random tokens
+    (rather than counters) can never repeat, so a stale fragment is never served again.
+    """
+    scope = models.CharField(max_length=50, unique=True)
+    token = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.scope}: {self.token}"
@@ -0,0 +1,58 @@
+"""
+pagination.py
+
+This module defines the pagination classes used by the REST API views.
+"""
+
+import base64
+import binascii
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class MachineCursorPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination for the machine REST API, ordered by (updated_at, id).
+    Each page is read with an indexed range scan starting at the cursor position, so the cost
+    of a page does not depend on how deep into the fleet it is, and clients polling for recent
+    changes can follow the `next` links. The page size defaults to PAGE_SIZE in the
+    REST_FRAMEWORK settings and can be raised per request with ?page_size=.
+    """
+    ordering = ('updated_at', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class FaultSearchPagination(PageNumberPagination):
+    """
+    Page-number pagination for the fault search API. Search results are ordered by relevance,
+    which has no stable key to keep a cursor on; each page is a ranked, limited index query.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def encode_change_cursor(seq):
+    """
+    Encodes a position in the machine change sequence as an opaque cursor string.
+    """
+    return base64.urlsafe_b64encode(f"seq:{seq}".encode()).decode().rstrip("=")
+
+
+def decode_change_cursor(cursor):
+    """
+    Decodes a cursor produced by encode_change_cursor(). An empty cursor means the start of
+    the sequence. Raises a ValidationError (HTTP 400) for a malformed cursor.
+    """
+    if not cursor:
+        return 0
+    try:
+        value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        prefix, seq = value.split(":")
+        if prefix != "seq" or int(seq) < 0:
+            raise ValueError
+        return int(seq)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValidationError({"since": "Invalid cursor."})
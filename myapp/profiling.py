@@ -0,0 +1,203 @@
+"""
+profiling.py
+
+This module profiles single requests on demand, so that a slow render seen by one user (e.g. a
+manager filtering a big collection) can be examined after the fact. A request is profiled when
+  - a superuser asks for it, with the `X-Profile: 1` header or the `?_profile=1` query flag, or
+  - it is picked at random, with probability PROFILE_SAMPLE_RATE (0 by default).
+The request is run under cProfile by ProfilingMiddleware (see middleware.py). The self time of
+every function is attributed to the area of the code it belongs to (ORM and database, template
+rendering, serialization, other), and a report is saved under PROFILE_DIR (storage/profiles):
+    <id>.json   summary: the request, the time per area and the most expensive functions
+    <id>.txt    call tree: cumulative times, with the functions each call spends its time in
+    <id>.prof   the raw profile, for snakeviz, pstats, etc.
+Only one request per process is profiled at a time. Reports can be browsed at /profiles/.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+# Areas of the code time is attributed to, with the code locations (paths of the Python files,
+# or names of built-in functions) that belong to each, checked in order.
+AREAS = (
+    ("orm", re.compile(r"django[/\\]db[/\\]|sqlite3|psycopg")),
+    ("templates", re.compile(r"django[/\\]template[/\\]|templatetags[/\\]|django[/\\]templatetags[/\\]")),
+    ("serialization", re.compile(r"rest_framework[/\\](serializers|fields|renderers|relations)|json[/\\]|_json|csv")),
+)
+OTHER_AREA = "other"
+# Number of functions listed in the summary, and in the call tree.
+SUMMARY_FUNCTIONS = 25
+CALL_TREE_FUNCTIONS = 60
+
+REPORT_NAME_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$")
+
+_profiler_lock = threading.Lock()
+
+
+def profile_dir():
+    return Path(getattr(settings, "PROFILE_DIR", settings.BASE_DIR / "storage" / "profiles"))
+
+
+def wants_profile(request):
+    """
+    Whether the request should be profiled: asked for by a superuser, or sampled.
+    """
+    asked = request.headers.get("X-Profile") == "1" or request.GET.get("_profile") == "1"
+    if asked and getattr(request, "user", None) is not None and request.user.is_superuser:
+        return True
+    sample_rate = getattr(settings, "PROFILE_SAMPLE_RATE", 0)
+    return bool(sample_rate) and random.random() < sample_rate
+
+
+def area_of(function):
+    """
+    Returns the area of the code a pstats function key (filename, line, name) belongs to.
+    """
+    filename, _line, name = function
+    location = name if filename == "~" else filename
+    for area, pattern in AREAS:
+        if pattern.search(location):
+            return area
+    return OTHER_AREA
+
+
+def area_times(stats):
+    """
+    Returns {area: seconds} splitting the profiled time over the areas, by the self time of each
+    function (the time spent in the function itself, not in the functions it called), so the
+    areas add up to the total.
+    """
+    times = {area: 0.0 for area, _ in AREAS}
+    times[OTHER_AREA] = 0.0
+    for function, (_calls, _primitive, self_time, _cumulative, _callers) in stats.stats.items():
+        times[area_of(function)] += self_time
+    return {area: round(seconds, 6) for area, seconds in times.items()}
+
+
+def top_functions(stats, limit=SUMMARY_FUNCTIONS):
+    """
+    Returns the `limit` functions with the most cumulative time, most expensive first.
+    """
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": pstats.func_std_string(function),
+            "area": area_of(function),
+            "calls": calls,
+            "self_seconds": round(self_time, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        }
+        for function, (_primitive, calls, self_time, cumulative, _callers) in rows
+    ]
+
+
+def call_tree(profiler):
+    """
+    Returns the text call tree of a profile: the most expensive calls by cumulative time, each
+    followed by the functions it called and the time spent in them.
+    """
+    output = io.StringIO()
+    tree = pstats.Stats(profiler, stream=output)
+    tree.sort_stats(pstats.SortKey.CUMULATIVE)
+    tree.print_stats(CALL_TREE_FUNCTIONS)
+    tree.print_callees(CALL_TREE_FUNCTIONS)
+    return output.getvalue()
+
+
+def profile_request(request, get_response):
+    """
+    Runs `get_response(request)` under the profiler and saves the report. Returns the response
+    and the report id, or (None, None) if another request is being profiled.
+    """
+    if not _profiler_lock.acquire(blocking=False):
+        return None, None
+    try:
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - started
+    finally:
+        _profiler_lock.release()
+
+    stats = pstats.Stats(profiler)
+    report_id = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+    match = getattr(request, "resolver_match", None)
+    user = getattr(request, "user", None)
+    summary = {
+        "id": report_id,
+        "at": timezone.now().isoformat(),
+        "method": request.method,
+        "path": request.get_full_path(),
+        "view": (match.view_name or match._func_path) if match else None,
+        "user": user.get_username() if user is not None and user.is_authenticated else None,
+        "status": response.status_code,
+        "duration_seconds": round(duration, 6),
+        "areas": area_times(stats),
+        "functions": top_functions(stats),
+    }
+    save_report(report_id, summary, call_tree(profiler), profiler)
+    return response, report_id
+
+
+def save_report(report_id, summary, tree, profiler):
+    """
+    Writes a report's files and removes the oldest reports beyond PROFILE_MAX_REPORTS.
+    """
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f"{report_id}.json").write_text(json.dumps(summary, indent=2))
+    (directory / f"{report_id}.txt").write_text(tree)
+    profiler.dump_stats(directory / f"{report_id}.prof")
+
+    max_reports = getattr(settings, "PROFILE_MAX_REPORTS", 200)
+    reports = sorted(directory.glob("*.json"))
+    for old in reports[:max(0, len(reports) - max_reports)]:
+        for suffix in (".json", ".txt", ".prof"):
+            try:
+                os.remove(old.with_suffix(suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_reports():
+    """
+    Returns the summaries of the saved reports, newest first.
+    """
+    reports = []
+    for path in sorted(profile_dir().glob("*.json"), reverse=True):
+        try:
+            reports.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return reports
+
+
+def load_report(report_id):
+    """
+    Returns (summary, call tree text) of a saved report, or None if there is no such report.
+    """
+    if not REPORT_NAME_RE.match(report_id):
+        return None
+    directory = profile_dir()
+    try:
+        summary = json.loads((directory / f"{report_id}.json").read_text())
+        tree = (directory / f"{report_id}.txt").read_text()
+    except (OSError, ValueError):
+        return None
+    return summary, tree
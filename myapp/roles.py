@@ -0,0 +1,71 @@
+"""
+roles.py
+
+This module resolves the role of the signed-in user (Manager, Technician, Repair, View-only) and
+restricts views to some roles. The user of each request is loaded together with its UserProfile
+in one joined query by ProfileModelBackend (see also middleware.py), so checking the role does
+not cost an extra query, and users without a profile simply have no role.
+"""
+
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseForbidden
+from rest_framework.permissions import BasePermission
+
+from .models import UserProfile
+
+
+class ProfileModelBackend(ModelBackend):
+    """
+    The default model backend, except that the user of a session is loaded with its UserProfile.
+    """
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related("userprofile").get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+def user_role(user):
+    """
+    Returns the role of a user, or None for anonymous users and users without a UserProfile.
+    """
+    if not user.is_authenticated:
+        return None
+    try:
+        return user.userprofile.role
+    except UserProfile.DoesNotExist:
+        return None
+
+
+def role_required(*roles, message="You are not authorized to view this page."):
+    """
+    Decorator for views that only users with one of the given roles (and superusers) may use.
+    Anonymous users are redirected to the login page; other users get a 403 with `message`.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not request.user.is_superuser and user_role(request.user) not in roles:
+                return HttpResponseForbidden(message)
+            return view_func(request, *args, **kwargs)
+        return login_required(_wrapped_view)
+    return decorator
+
+
+def role_permission(*roles, message="You are not authorized to use this endpoint."):
+    """
+    Returns a DRF permission class that, like role_required, only lets users with one of the
+    given roles (and superusers) through.
+    """
+    class RolePermission(BasePermission):
+        def has_permission(self, request, view):
+            return request.user.is_superuser or user_role(request.user) in roles
+
+    RolePermission.message = message
+    return RolePermission
@@ -0,0 +1,214 @@
+"""
+rollups.py
+
+This module maintains the machine status history: the append-only MachineStatusEvent log and
+the hourly and daily status rollups kept per machine (MachineStatusRollup) and per collection
+(CollectionStatusRollup). The rollups are updated incrementally on every status transition:
+when a machine leaves a status, the time it spent in that status is split over the hour and day
+buckets it covered and added to them. Availability and downtime reports over long ranges are
+then built from a handful of rollup rows per bucket instead of scanning raw history.
+"""
+
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from .models import (
+    Machine, Collection, MachineStatusEvent, MachineStatusRollup, CollectionStatusRollup,
+)
+
+# Length of the rollup buckets of each period.
+PERIODS = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+
+def bucket_start(moment, period):
+    """
+    Returns the start of the `period` bucket containing `moment` (buckets are aligned in UTC).
+    """
+    moment = moment.astimezone(dt_timezone.utc)
+    if period == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def split_interval(start, end, period):
+    """
+    Splits the interval [start, end) over the `period` buckets it covers, yielding
+    (bucket_start, seconds) pairs.
+    """
+    bucket = bucket_start(start, period)
+    while bucket < end:
+        next_bucket = bucket + PERIODS[period]
+        yield bucket, (min(end, next_bucket) - max(start, bucket)).total_seconds()
+        bucket = next_bucket
+
+
+def latest_events(machine_ids):
+    """
+    Returns {machine_id: (status, at)} describing the latest status event of each machine, i.e.
+    its current status and when it began. Machines without events are left out. One query.
+    """
+    latest = MachineStatusEvent.objects.filter(machine=OuterRef("pk")).order_by("-at", "-pk")
+    rows = Machine.objects.filter(pk__in=machine_ids).annotate(
+        last_status=Subquery(latest.values("to_status")[:1]),
+        last_at=Subquery(latest.values("at")[:1]),
+    ).values_list("pk", "last_status", "last_at")
+    return {pk: (status, at) for pk, status, at in rows if at is not None}
+
+
+def collection_memberships(machine_ids):
+    """
+    Returns {machine_id: [collection_id, ...]} for the given machines. One query.
+    """
+    memberships = defaultdict(list)
+    rows = Collection.machines.through.objects.filter(machine_id__in=machine_ids) \
+        .values_list("machine_id", "collection_id")
+    for machine_id, collection_id in rows:
+        memberships[machine_id].append(collection_id)
+    return memberships
+
+
+def record_status_transitions(changes, at=None):
+    """
+    Appends the status events for a list of (machine_id, old_status, new_status) transitions and
+    updates the machine and collection rollups: the time each machine spent in its previous status
+    (since its latest event) is credited to that status, and the new status is counted as entered.
+    Deletions (new_status None) are skipped; the history of a deleted machine is deleted with it.
+    Runs in a fixed number of queries however many machines changed.
+    """
+    at = at or timezone.now()
+    changes = [(machine_id, old, new) for machine_id, old, new in changes if new is not None]
+    if not changes:
+        return
+    machine_ids = [machine_id for machine_id, _old, _new in changes]
+    previous = latest_events(machine_ids)
+    memberships = collection_memberships(machine_ids)
+
+    machine_deltas = defaultdict(lambda: [0.0, 0])
+    collection_deltas = defaultdict(lambda: [0.0, 0])
+    for machine_id, _old, new_status in changes:
+        owners = [(machine_deltas, machine_id)]
+        owners += [(collection_deltas, collection_id) for collection_id in memberships[machine_id]]
+        for period in PERIODS:
+            if machine_id in previous:
+                last_status, last_at = previous[machine_id]
+                for bucket, seconds in split_interval(last_at, at, period):
+                    for deltas, owner_id in owners:
+                        deltas[(owner_id, period, bucket, last_status)][0] += seconds
+            for deltas, owner_id in owners:
+                deltas[(owner_id, period, bucket_start(at, period), new_status)][1] += 1
+
+    MachineStatusEvent.objects.bulk_create([
+        MachineStatusEvent(machine_id=machine_id, from_status=old_status, to_status=new_status, at=at)
+        for machine_id, old_status, new_status in changes
+    ])
+    MachineStatusRollup.objects.add({key: tuple(value) for key, value in machine_deltas.items()})
+    CollectionStatusRollup.objects.add({key: tuple(value) for key, value in collection_deltas.items()})
+
+
+def status_report(owner, start, end, period="day"):
+    """
+    Builds an availability and downtime report for a Machine or a Collection between `start` and
+    `end`, bucketed by `period`, from the rollups. The time each machine has spent in its current
+    status since its last transition (not yet in the rollups) is added from the event log.
+    Returns a dict with one entry per bucket and the totals over the whole range:
+      - seconds: the seconds spent in each status,
+      - faults: the number of times machines entered the Fault status,
+      - availability: the share of tracked time not spent in Fault,
+      - mtbf / mttr: mean time between failures / to repair, in seconds (None without faults).
+    """
+    now = timezone.now()
+    end = min(end, now)
+    statuses = [status for status, _ in Machine.STATUS_CHOICES]
+    buckets = defaultdict(lambda: {"seconds": dict.fromkeys(statuses, 0.0), "faults": 0})
+
+    rollups = owner.status_rollups.filter(
+        period=period, bucket_start__gte=bucket_start(start, period), bucket_start__lt=end,
+    ).values_list("bucket_start", "status", "seconds", "entered")
+    for bucket, status, seconds, entered in rollups:
+        buckets[bucket]["seconds"][status] += seconds
+        if status == "Fault":
+            buckets[bucket]["faults"] += entered
+
+    if isinstance(owner, Machine):
+        machine_ids = [owner.pk]
+    else:
+        machine_ids = list(owner.machines.values_list("pk", flat=True))
+    for status, since in latest_events(machine_ids).values():
+        since = max(since, start)
+        if since < end:
+            for bucket, seconds in split_interval(since, end, period):
+                buckets[bucket]["seconds"][status] += seconds
+
+    def summarize(seconds, faults):
+        tracked = sum(seconds.values())
+        uptime = tracked - seconds["Fault"]
+        return {
+            "seconds": seconds,
+            "faults": faults,
+            "availability": uptime / tracked if tracked else None,
+            "mtbf": uptime / faults if faults else None,
+            "mttr": seconds["Fault"] / faults if faults else None,
+        }
+
+    total_seconds = dict.fromkeys(statuses, 0.0)
+    total_faults = 0
+    report = []
+    for bucket in sorted(buckets):
+        data = buckets[bucket]
+        for status, seconds in data["seconds"].items():
+            total_seconds[status] += seconds
+        total_faults += data["faults"]
+        report.append({"bucket_start": bucket, **summarize(data["seconds"], data["faults"])})
+    return {
+        "period": period,
+        "start": start,
+        "end": end,
+        "buckets": report,
+        "total": summarize(total_seconds, total_faults),
+    }
+
+
+def rebuild_rollups(chunk_size=2000, flush_size=20000):
+    """
+    Recomputes every machine and collection rollup by replaying the status event log (using the
+    current collection memberships). The pending increments are written out whenever more than
+    `flush_size` buckets are pending, so memory use does not grow with the history.
+    Returns the number of events replayed.
+    """
+    MachineStatusRollup.objects.all().delete()
+    CollectionStatusRollup.objects.all().delete()
+    memberships = collection_memberships(Machine.objects.values("pk"))
+
+    replayed = 0
+    machine_deltas = defaultdict(lambda: [0.0, 0])
+    collection_deltas = defaultdict(lambda: [0.0, 0])
+    previous = None
+    events = MachineStatusEvent.objects.order_by("machine_id", "at", "pk") \
+        .values_list("machine_id", "to_status", "at").iterator(chunk_size=chunk_size)
+    for machine_id, status, at in events:
+        if previous and previous[0] != machine_id and len(machine_deltas) + len(collection_deltas) > flush_size:
+            MachineStatusRollup.objects.add({key: tuple(value) for key, value in machine_deltas.items()})
+            CollectionStatusRollup.objects.add({key: tuple(value) for key, value in collection_deltas.items()})
+            machine_deltas.clear()
+            collection_deltas.clear()
+        owners = [(machine_deltas, machine_id)]
+        owners += [(collection_deltas, collection_id) for collection_id in memberships[machine_id]]
+        for period in PERIODS:
+            if previous and previous[0] == machine_id:
+                for bucket, seconds in split_interval(previous[2], at, period):
+                    for deltas, owner_id in owners:
+                        deltas[(owner_id, period, bucket, previous[1])][0] += seconds
+            for deltas, owner_id in owners:
+                deltas[(owner_id, period, bucket_start(at, period), status)][1] += 1
+        previous = (machine_id, status, at)
+        replayed += 1
+
+    MachineStatusRollup.objects.add({key: tuple(value) for key, value in machine_deltas.items()})
+    CollectionStatusRollup.objects.add({key: tuple(value) for key, value in collection_deltas.items()})
+    return replayed
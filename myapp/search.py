@@ -0,0 +1,239 @@
+"""
+search.py
+
+This module maintains and queries the full-text search index over the fault history. Each fault
+case has one search document made of three columns: its title, the name of its machine and the
+text of all its notes. The index is a separate table, kept in sync on write by the receivers in
+signals.py, so a search is an index lookup instead of a LIKE '%...%' scan over every note:
+  - on SQLite it is an FTS5 virtual table (rowid = fault case id), ranked with bm25(),
+  - on PostgreSQL it is a table with a weighted, generated tsvector column and a GIN index,
+    ranked with ts_rank_cd().
+The table is created (and filled from the existing history) by migration 0007_fault_search.
+Other databases fall back to case-insensitive substring matching through the ORM.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import FaultCase, FaultNote
+
+SEARCH_TABLE = "myapp_faultsearch"
+# Relative weights of the title, machine name and notes columns when ranking matches.
+COLUMN_WEIGHTS = (10.0, 5.0, 1.0)
+# Search terms beyond this many are ignored.
+MAX_QUERY_TERMS = 16
+# Markers placed around matched words in snippets (private-use characters, replaced by <mark>).
+MATCH_START, MATCH_END = "\ue000", "\ue001"
+
+
+def search_backend():
+    """
+    Returns the search backend of the default database: "sqlite", "postgresql" or None.
+    """
+    return connection.vendor if connection.vendor in ("sqlite", "postgresql") else None
+
+
+def query_terms(text):
+    """
+    Splits a user's search text into lower-case word terms, dropping any query syntax.
+    """
+    return re.findall(r"\w+", (text or "").lower())[:MAX_QUERY_TERMS]
+
+
+def build_match_query(terms, backend):
+    """
+    Builds the full-text query matching documents that contain every term; the last term is
+    matched as a prefix so results appear while the user is still typing it.
+    """
+    if backend == "sqlite":
+        return " ".join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+    return " & ".join(terms[:-1] + [f"{terms[-1]}:*"])
+
+
+def format_snippet(snippet):
+    """
+    Returns a search snippet as safe HTML: the text escaped and the matches wrapped in <mark>.
+    """
+    html = escape(snippet or "").replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+    return mark_safe(html)
+
+
+##################
+# Index updates  #
+##################
+def _key_column(backend):
+    return "rowid" if backend == "sqlite" else "fault_case_id"
+
+
+def fault_documents(fault_ids):
+    """
+    Returns {fault_id: (title, machine name, notes text)} for the given fault cases. Two queries.
+    """
+    notes = {}
+    for fault_id, note in FaultNote.objects.filter(fault_case_id__in=fault_ids) \
+            .order_by("fault_case_id", "created_at", "pk").values_list("fault_case_id", "note"):
+        notes.setdefault(fault_id, []).append(note)
+    rows = FaultCase.objects.filter(pk__in=fault_ids).values_list("pk", "title", "machine__name")
+    return {pk: (title or "", machine_name, "\n".join(notes.get(pk, []))) for pk, title, machine_name in rows}
+
+
+def index_faults(fault_ids):
+    """
+    (Re)indexes the given fault cases; those that no longer exist are removed from the index.
+    """
+    backend = search_backend()
+    fault_ids = list(fault_ids)
+    if backend is None or not fault_ids:
+        return
+    documents = fault_documents(fault_ids)
+    key = _key_column(backend)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE {key} IN ({', '.join(['%s'] * len(fault_ids))})", fault_ids,
+        )
+        if documents:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} ({key}, title, machine, notes) VALUES (%s, %s, %s, %s)",
+                [(pk, *document) for pk, document in documents.items()],
+            )
+
+
+def unindex_faults(fault_ids):
+    """
+    Removes the given fault cases from the index.
+    """
+    backend = search_backend()
+    fault_ids = list(fault_ids)
+    if backend is None or not fault_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE {_key_column(backend)} IN ({', '.join(['%s'] * len(fault_ids))})",
+            fault_ids,
+        )
+
+
+def rebuild_index(chunk_size=500):
+    """
+    Rebuilds the whole index from the fault cases and notes, `chunk_size` fault cases at a time.
+    Returns the number of fault cases indexed.
+    """
+    if search_backend() is None:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    fault_ids = list(FaultCase.objects.order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(fault_ids), chunk_size):
+        index_faults(fault_ids[start:start + chunk_size])
+    return len(fault_ids)
+
+
+###########
+# Queries #
+###########
+class FaultSearchResults:
+    """
+    The fault cases matching a search, best match first. Behaves like a lazy sequence (count()
+    and slicing), so it can be handed to Django's Paginator or DRF pagination: each page is one
+    ranked, limited index query plus one query loading its fault cases. The fault cases returned
+    carry `search_rank` (higher is better) and `search_snippet` (safe HTML) attributes.
+    """
+
+    def __init__(self, text):
+        self.terms = query_terms(text)
+        self.backend = search_backend()
+
+    @cached_property
+    def _match_query(self):
+        return build_match_query(self.terms, self.backend)
+
+    def count(self):
+        if not self.terms:
+            return 0
+        if self.backend is None:
+            return self._fallback_queryset().count()
+        with connection.cursor() as cursor:
+            if self.backend == "sqlite":
+                cursor.execute(f"SELECT count(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [self._match_query])
+            else:
+                cursor.execute(
+                    f"SELECT count(*) FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('english', %s)",
+                    [self._match_query],
+                )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        offset = index.start or 0
+        limit = (index.stop - offset) if index.stop is not None else -1
+        if not self.terms or limit == 0:
+            return []
+        if self.backend is None:
+            return self._fallback_page(offset, limit)
+        hits = self._hits(offset, limit)
+        faults = FaultCase.objects.select_related("machine", "reported_by").in_bulk([pk for pk, _, _ in hits])
+        results = []
+        for pk, rank, snippet in hits:
+            if pk in faults:
+                fault = faults[pk]
+                fault.search_rank = rank
+                fault.search_snippet = format_snippet(snippet)
+                results.append(fault)
+        return results
+
+    def _hits(self, offset, limit):
+        # Returns [(fault_id, rank, raw snippet)] for one page of matches, best first.
+        with connection.cursor() as cursor:
+            if self.backend == "sqlite":
+                weights = ", ".join(str(weight) for weight in COLUMN_WEIGHTS)
+                cursor.execute(
+                    f"SELECT rowid, -bm25({SEARCH_TABLE}, {weights}) AS rank, "
+                    f"snippet({SEARCH_TABLE}, -1, %s, %s, '…', 16) "
+                    f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                    f"ORDER BY bm25({SEARCH_TABLE}, {weights}), rowid DESC LIMIT %s OFFSET %s",
+                    [MATCH_START, MATCH_END, self._match_query, limit, offset],
+                )
+            else:
+                cursor.execute(
+                    f"SELECT fault_case_id, ts_rank_cd(document, query) AS rank, "
+                    f"ts_headline('english', concat_ws(' — ', title, machine, notes), query, %s) "
+                    f"FROM {SEARCH_TABLE}, to_tsquery('english', %s) AS query WHERE document @@ query "
+                    f"ORDER BY rank DESC, fault_case_id DESC LIMIT %s OFFSET %s",
+                    [f"StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords=24, MinWords=8",
+                     self._match_query, None if limit < 0 else limit, offset],
+                )
+            return cursor.fetchall()
+
+    def _fallback_queryset(self):
+        # Substring matching for databases without a full-text index: every term must appear
+        # in the title, the machine name or one of the notes.
+        queryset = FaultCase.objects.all()
+        for term in self.terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(machine__name__icontains=term) | Q(notes__note__icontains=term)
+            )
+        return queryset.distinct()
+
+    def _fallback_page(self, offset, limit):
+        queryset = self._fallback_queryset().select_related("machine", "reported_by").order_by("-created_at", "-pk")
+        page = list(queryset[offset:offset + limit] if limit >= 0 else queryset[offset:])
+        for fault in page:
+            fault.search_rank = 0.0
+            fault.search_snippet = format_snippet(fault.title or "")
+        return page
+
+
+def search_faults(text):
+    """
+    Returns the FaultSearchResults for a user's search text.
+    """
+    return FaultSearchResults(text)
@@ -0,0 +1,166 @@
+"""
+seeding.py
+
+This module fills the database with a realistic synthetic fleet for load testing and
+benchmarking: users of every role, machines spread over collections and assigned to
+technicians and repair personnel, a status history for every machine, fault cases with notes,
+and active warnings. Everything is inserted with bulk_create (a handful of queries per table
+rather than one per row); the derived data the signals would normally maintain along the way
+(status counters, collection counters, rollups, search index, board versions) is rebuilt once
+at the end.
+Used by the `seed_fleet` and `benchmark` management commands.
+"""
+
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .board_cache import bump_all_board_versions
+from .models import (
+    UserProfile, Machine, MachineStatusCount, CollectionStatusCount, MachineStatusEvent, FaultCase, FaultNote,
+    Warning, Collection, normalize_warning_text,
+)
+from .rollups import rebuild_rollups
+from .search import rebuild_index
+
+# Share of the fleet in each status.
+STATUS_WEIGHTS = {"OK": 80, "Warning": 15, "Fault": 5}
+
+MACHINE_TYPES = (
+    "CNC Mill", "Lathe", "Hydraulic Press", "Laser Cutter", "Welding Robot", "3D Printer",
+    "Buffing Machine", "Deburring Machine", "Grinding Machine", "Injection Moulder", "Conveyor",
+)
+FAULT_TITLES = (
+    "Spindle overheating", "Hydraulic pressure drop", "Coolant leak", "Servo axis drift",
+    "Belt snapped", "Emergency stop triggered", "Tool breakage detected", "Vacuum pump failure",
+    "Encoder signal lost", "Excessive vibration", "Nozzle clogged", "Door interlock fault",
+)
+NOTE_TEXTS = (
+    "Inspected the unit, waiting on spare parts.",
+    "Replaced the worn bearing and recalibrated the axis.",
+    "Cleaned the filters; the pressure is back within range.",
+    "Operator reports the fault recurs at the start of each shift.",
+    "Ran a diagnostic cycle, no further errors logged.",
+    "Escalated to the manufacturer's field service.",
+    "Tightened the fittings and topped up the hydraulic fluid.",
+)
+WARNING_TEXTS = (
+    "Lubricant level low", "Filter due for replacement", "Temperature above normal",
+    "Unusual noise from gearbox", "Calibration overdue", "Tool wear approaching limit",
+)
+
+
+def seed_fleet(machines=200, collections=10, managers=2, technicians=10, repair=5, viewonly=3,
+               faults_per_machine=1.0, notes_per_fault=3, password="password", seed=None, prefix="seed"):
+    """
+    Creates a synthetic fleet and returns {table: number of rows created}.
+    Usernames are "<prefix>-<role>-<n>" and collection names "<Prefix> Line <n>", so fleets
+    seeded with different prefixes can coexist. `faults_per_machine` is the average number of
+    resolved fault cases in each machine's history; machines in Fault also get an open one.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    with transaction.atomic():
+        password_hash = make_password(password)
+        users = {}
+        for role, count in (("Manager", managers), ("Technician", technicians), ("Repair", repair),
+                            ("View-only", viewonly)):
+            slug = role.lower().replace("-", "")
+            users[role] = User.objects.bulk_create([
+                User(username=f"{prefix}-{slug}-{n:03d}", password=password_hash) for n in range(1, count + 1)
+            ])
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, role=role) for role, role_users in users.items() for user in role_users
+        ])
+
+        statuses = rng.choices(list(STATUS_WEIGHTS), weights=list(STATUS_WEIGHTS.values()), k=machines)
+        fleet = Machine.objects.bulk_create([
+            Machine(
+                name=f"{rng.choice(MACHINE_TYPES)} {n:05d}",
+                description=f"Synthetic machine {n} seeded for load testing.",
+                status=status,
+                priority=Machine.STATUS_PRIORITY[status],
+            )
+            for n, status in enumerate(statuses, start=1)
+        ], batch_size=1000)
+
+        # Collections: every machine belongs to one line.
+        lines = Collection.objects.bulk_create([
+            Collection(name=f"{prefix.title()} Line {n:03d}") for n in range(1, collections + 1)
+        ])
+        if lines:
+            Collection.machines.through.objects.bulk_create([
+                Collection.machines.through(collection_id=lines[n % len(lines)].pk, machine_id=machine.pk)
+                for n, machine in enumerate(fleet)
+            ], batch_size=2000)
+
+        # Assignments: one technician and one repair person per machine.
+        assignments = []
+        for machine in fleet:
+            for role in ("Technician", "Repair"):
+                if users[role]:
+                    assignments.append(Machine.assigned_to.through(machine_id=machine.pk, user_id=rng.choice(users[role]).pk))
+        Machine.assigned_to.through.objects.bulk_create(assignments, batch_size=2000)
+
+        # Status history over the last week, ending in each machine's current status.
+        events = []
+        for machine in fleet:
+            at = now - timedelta(days=7)
+            previous = None
+            history = [rng.choice(list(STATUS_WEIGHTS)) for _ in range(rng.randint(0, 3))] + [machine.status]
+            for status in history:
+                if status == previous:
+                    continue
+                events.append(MachineStatusEvent(machine=machine, from_status=previous, to_status=status, at=at))
+                previous = status
+                at += timedelta(minutes=rng.randint(30, 48 * 60))
+                at = min(at, now)
+        MachineStatusEvent.objects.bulk_create(events, batch_size=2000)
+
+        # Fault cases (resolved history, plus an open case for machines in Fault) and their notes.
+        reporters = users["Technician"] + users["Repair"] or [None]
+        faults = []
+        for machine in fleet:
+            resolved = int(faults_per_machine) + (rng.random() < faults_per_machine % 1)
+            for fault_status in ["resolved"] * resolved + (["open"] if machine.status == "Fault" else []):
+                faults.append(FaultCase(
+                    machine=machine, reported_by=rng.choice(reporters), status=fault_status,
+                    title=rng.choice(FAULT_TITLES),
+                ))
+        faults = FaultCase.objects.bulk_create(faults, batch_size=2000)
+        notes = FaultNote.objects.bulk_create([
+            FaultNote(fault_case=fault, note=rng.choice(NOTE_TEXTS), created_by=rng.choice(reporters))
+            for fault in faults for _ in range(notes_per_fault)
+        ], batch_size=2000)
+
+        # Active warnings on the machines in Warning (distinct texts per machine).
+        warnings = []
+        for machine in fleet:
+            if machine.status == "Warning":
+                for text in rng.sample(WARNING_TEXTS, rng.randint(1, 2)):
+                    warnings.append(Warning(
+                        machine=machine, warning_text=text, warning_text_normalized=normalize_warning_text(text),
+                        created_by=rng.choice(reporters), active=True,
+                    ))
+        Warning.objects.bulk_create(warnings, batch_size=2000)
+
+        MachineStatusCount.objects.rebuild()
+        CollectionStatusCount.objects.rebuild()
+        rebuild_rollups()
+        rebuild_index()
+        bump_all_board_versions()
+
+    return {
+        "users": sum(len(role_users) for role_users in users.values()),
+        "machines": len(fleet),
+        "collections": len(lines),
+        "status_events": len(events),
+        "fault_cases": len(faults),
+        "fault_notes": len(notes),
+        "warnings": len(warnings),
+    }
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
-from .models import Machine
+from .images import variant_urls
+from .models import Machine, FaultCase, Collection, CollectionStatusCount
 
 class MachineWarningSerializer(serializers.Serializer):
     """
@@ -11,6 +12,70 @@ class MachineWarningSerializer(serializers.Serializer):
     status = serializers.ChoiceField(choices=[('Warning', 'Warning'), ('Fault', 'Fault'), ('OK', 'OK')])
 
 
+# Maximum number of status updates accepted in one batch ingestion request.
+BATCH_UPDATE_MAX_SIZE = 5000
+
+class MachineWarningListSerializer(serializers.ListSerializer):
+    """
+    List variant of MachineWarningSerializer.
+    This serializer class validates a batch of {id, status} updates sent to the batch ingestion
+    endpoint. Validation errors are reported per item, in the same order as the request.
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('child', MachineWarningSerializer())
+        kwargs.setdefault('allow_empty', False)
+        kwargs.setdefault('max_length', BATCH_UPDATE_MAX_SIZE)
+        super().__init__(*args, **kwargs)
+
+
+# Maximum number of machines (and of users) in one bulk assignment request.
+BULK_ASSIGNMENT_MAX_SIZE = 5000
+
+class MachineAssignmentSerializer(serializers.Serializer):
+    """
+    Serializer for bulk assignment requests.
+    This serializer class validates a request to make `user_ids` the only `role` personnel
+    assigned to a set of machines, given either by `machine_ids` or by `collection`.
+    """
+    role = serializers.ChoiceField(choices=[(role, role) for role in Machine.ASSIGNEE_ROLES])
+    user_ids = serializers.ListField(child=serializers.IntegerField(), max_length=BULK_ASSIGNMENT_MAX_SIZE)
+    machine_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False, max_length=BULK_ASSIGNMENT_MAX_SIZE,
+    )
+    collection = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if ('machine_ids' in data) == ('collection' in data):
+            raise serializers.ValidationError("Give either machine_ids or collection.")
+        return data
+
+
+# Maximum number of fault cases selected by id in one bulk fault request.
+BULK_FAULT_MAX_SIZE = 5000
+
+class FaultBulkSerializer(serializers.Serializer):
+    """
+    Serializer for bulk fault case requests.
+    This serializer class validates an action ("resolve", "reopen" or "note"), an optional note
+    (required to annotate) and the fault cases it applies to, given by exactly one of
+    `fault_ids`, `machine` or `collection`.
+    """
+    action = serializers.ChoiceField(choices=[('resolve', 'resolve'), ('reopen', 'reopen'), ('note', 'note')])
+    note = serializers.CharField(required=False)
+    fault_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False, max_length=BULK_FAULT_MAX_SIZE,
+    )
+    machine = serializers.IntegerField(required=False)
+    collection = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        if sum(name in data for name in ('fault_ids', 'machine', 'collection')) != 1:
+            raise serializers.ValidationError("Give exactly one of fault_ids, machine or collection.")
+        if data['action'] == 'note' and not data.get('note'):
+            raise serializers.ValidationError({'note': "A note is required to annotate fault cases."})
+        return data
+
+
 class MachineStatusSerializer(serializers.ModelSerializer):
      """
      Serializer for the Machine model.
@@ -19,4 +84,46 @@ class MachineStatusSerializer(serializers.ModelSerializer):
      class Meta:
          model = Machine
          # Only display the necessary fields in the API response.
-         fields = ['id', 'name', 'status', 'updated_at']
\ No newline at end of file
+         fields = ['id', 'name', 'status', 'updated_at', 'image_variants']
+
+     # URLs of the resized variants of the machine image, keyed by width (see images.py).
+     image_variants = serializers.SerializerMethodField()
+
+     def get_image_variants(self, machine):
+         return variant_urls(machine.image)
+
+
+class CollectionOverviewSerializer(serializers.ModelSerializer):
+     """
+     Serializer for the Collection model.
+     This serializer converts a collection annotated by CollectionQuerySet.with_status_counts()
+     to JSON, with its machine counts per status and its number of open fault cases.
+     """
+     class Meta:
+         model = Collection
+         fields = ['id', 'name', 'machines', 'statuses', 'open_faults']
+
+     machines = serializers.IntegerField(source='machine_count')
+     statuses = serializers.SerializerMethodField()
+     open_faults = serializers.IntegerField()
+
+     def get_statuses(self, collection):
+         return {status: getattr(collection, field) for status, field in CollectionStatusCount.STATUS_FIELDS.items()}
+
+
+class FaultSearchResultSerializer(serializers.ModelSerializer):
+     """
+     Serializer for the FaultCase model.
+     This serializer converts a fault case found by the full-text search (see search.py) to JSON,
+     with its relevance and a snippet of the matching text (HTML, matches wrapped in <mark>).
+     """
+     class Meta:
+         model = FaultCase
+         fields = ['id', 'title', 'status', 'created_at', 'machine', 'rank', 'snippet']
+
+     machine = serializers.SerializerMethodField()
+     rank = serializers.FloatField(source='search_rank')
+     snippet = serializers.CharField(source='search_snippet')
+
+     def get_machine(self, fault):
+         return {'id': fault.machine_id, 'name': fault.machine.name}
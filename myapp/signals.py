@@ -1,8 +1,50 @@
-from django.db.models.signals import post_migrate
+from django.db import transaction
+from django.core.files import File
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import Signal
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import User
 from django.conf import settings
 import os
 
+from .board_cache import (
+    GLOBAL_SCOPE, bump_all_board_versions, bump_board_versions, bump_machine_versions, collection_scope,
+)
+from .images import record_variants
+from .middleware import install_query_stats_wrapper
+from .models import (
+    UserProfile, Machine, MachineStatusCount, CollectionStatusCount, MachineChange, FaultCase, FaultNote, Warning,
+    Collection, MediaBlob,
+)
+from .rollups import record_status_transitions
+from .search import index_faults, unindex_faults
+
+# Sent whenever one or more machines change status, with
+# changes=[(machine_id, old_status, new_status), ...]. old_status is None for a new machine and
+# new_status is None for a deleted one. Saving or deleting a Machine sends it automatically;
+# code that changes statuses with queryset.update() must send it itself.
+machine_status_changed = Signal()
+
+# Sent by MachineQuerySet.reassign(), whose direct writes to the Machine.assigned_to table send
+# no m2m_changed: machine_ids=[...] are the machines whose assignees were replaced.
+machines_reassigned = Signal()
+
+# Sent by the set-based fault case operations (FaultCaseQuerySet.set_status() and add_note()),
+# whose queryset updates and bulk inserts send no post_save: fault_ids=[...] are the fault cases
+# whose status or notes changed.
+fault_cases_changed = Signal()
+
+# Sent whenever one or more fault cases change status, with
+# changes=[(fault_id, machine_id, old_status, new_status), ...]. old_status is None for a new
+# fault case and new_status is None for a deleted one. Saving or deleting a FaultCase sends it
+# automatically, as does FaultCaseQuerySet.set_status().
+fault_status_changed = Signal()
+
+# Sent by WarningManager.add_active(), whose bulk insert sends no post_save, when it adds a
+# warning: machine_id is the machine the warning was added to.
+warning_added = Signal()
+
 def create_default_superuser(sender, **kwargs):
     User = get_user_model()
     if not User.objects.filter(is_superuser=True).exists():
@@ -13,3 +55,291 @@ def create_default_superuser(sender, **kwargs):
         User.objects.create_superuser(username=username, password=password, email=email)
 
 post_migrate.connect(create_default_superuser)
+
+
+# Count the SQL queries of each request on every connection, whichever thread opened it.
+connection_created.connect(install_query_stats_wrapper)
+
+
+def announce_saved_machine_status(sender, instance, **kwargs):
+    # Machine.save() records the transition it made (if any) in _status_transition.
+    transition = getattr(instance, "_status_transition", None)
+    if transition:
+        machine_status_changed.send(sender=Machine, changes=[(instance.pk, *transition)])
+
+post_save.connect(announce_saved_machine_status, sender=Machine)
+
+
+def announce_deleted_machine_status(sender, instance, **kwargs):
+    # Sent before the row is deleted (still inside the deletion transaction) so receivers can
+    # still look up related rows such as the machine's collections.
+    machine_status_changed.send(sender=Machine, changes=[(instance.pk, instance.status, None)])
+
+pre_delete.connect(announce_deleted_machine_status, sender=Machine)
+
+
+def update_machine_status_counts(sender, changes, **kwargs):
+    MachineStatusCount.objects.apply_changes(changes)
+
+machine_status_changed.connect(update_machine_status_counts)
+
+
+def update_collection_status_counts(sender, changes, **kwargs):
+    CollectionStatusCount.objects.apply_status_changes(changes)
+
+machine_status_changed.connect(update_collection_status_counts)
+
+
+def record_machine_status_changes(sender, changes, **kwargs):
+    MachineChange.objects.bulk_create(
+        [MachineChange(machine_id=machine_id, deleted=new_status is None) for machine_id, _old, new_status in changes]
+    )
+
+machine_status_changed.connect(record_machine_status_changes)
+
+
+def record_machine_edit(sender, instance, **kwargs):
+    # Saves that change the status are recorded by record_machine_status_changes.
+    if not getattr(instance, "_status_transition", None):
+        MachineChange.objects.create(machine_id=instance.pk)
+
+post_save.connect(record_machine_edit, sender=Machine)
+
+
+def record_machine_status_history(sender, changes, **kwargs):
+    record_status_transitions(changes)
+
+machine_status_changed.connect(record_machine_status_history)
+
+
+def generate_image_variants(sender, instance, **kwargs):
+    # Generate the resized variants of a new image once the upload is committed, and record their
+    # widths on the row (a deduplicated upload finds the variants of its blob already there).
+    image = instance.image
+    if image and not instance.image_variant_widths:
+        transaction.on_commit(lambda: record_variants(image))
+
+post_save.connect(generate_image_variants, sender=Machine)
+post_save.connect(generate_image_variants, sender=FaultNote)
+
+
+def _image_name(value):
+    # The loaded value is the stored name (a str); after assignment it may be a FieldFile.
+    return getattr(value, "name", value) or None
+
+
+def _release_media_blobs(names):
+    # Drop the references and delete the blobs nobody refers to any more once committed.
+    unreferenced = MediaBlob.objects.release(names)
+    if unreferenced:
+        transaction.on_commit(lambda: MediaBlob.objects.collect(unreferenced))
+
+
+def note_image_upload(sender, instance, **kwargs):
+    # A file assigned to the field (rather than a stored name) is uploaded by this save; the
+    # storage takes its blob reference itself (see storage.py).
+    image = instance.__dict__.get("image")
+    instance._uploading_image = isinstance(image, File) and not getattr(image, "_committed", False)
+
+pre_save.connect(note_image_upload, sender=Machine)
+pre_save.connect(note_image_upload, sender=FaultNote)
+
+
+def reset_image_variant_widths(sender, instance, **kwargs):
+    # The variants recorded for the previous image do not belong to a new one.
+    if _image_name(instance.__dict__.get("image")) != _image_name(getattr(instance, "_loaded_image", None)):
+        instance.image_variant_widths = []
+
+pre_save.connect(reset_image_variant_widths, sender=Machine)
+pre_save.connect(reset_image_variant_widths, sender=FaultNote)
+
+
+def update_image_references(sender, instance, created, **kwargs):
+    # Keep the media blob reference counts in step with the image the row points to. Rows whose
+    # image was not loaded (deferred) are assumed not to have changed it.
+    new_name = _image_name(instance.__dict__.get("image"))
+    old_name = None if created else _image_name(getattr(instance, "_loaded_image", new_name))
+    if new_name != old_name:
+        if new_name and not getattr(instance, "_uploading_image", False):
+            MediaBlob.objects.add_references([new_name])
+        if old_name:
+            _release_media_blobs([old_name])
+    instance._loaded_image = new_name
+    instance._uploading_image = False
+
+post_save.connect(update_image_references, sender=Machine)
+post_save.connect(update_image_references, sender=FaultNote)
+
+
+def release_image_references(sender, instance, **kwargs):
+    name = _image_name(instance.__dict__.get("image", getattr(instance, "_loaded_image", None)))
+    if name:
+        _release_media_blobs([name])
+
+post_delete.connect(release_image_references, sender=Machine)
+post_delete.connect(release_image_references, sender=FaultNote)
+
+
+def index_saved_fault(sender, instance, **kwargs):
+    index_faults([instance.pk])
+
+post_save.connect(index_saved_fault, sender=FaultCase)
+
+
+def unindex_deleted_fault(sender, instance, **kwargs):
+    unindex_faults([instance.pk])
+
+post_delete.connect(unindex_deleted_fault, sender=FaultCase)
+
+
+def index_fault_of_note(sender, instance, **kwargs):
+    # A fault's search document includes all its notes.
+    index_faults([instance.fault_case_id])
+
+post_save.connect(index_fault_of_note, sender=FaultNote)
+post_delete.connect(index_fault_of_note, sender=FaultNote)
+
+
+def announce_saved_fault_status(sender, instance, created, update_fields=None, **kwargs):
+    # Saves that did not write the status (or whose loaded status is unknown) are assumed not
+    # to have changed it.
+    if created:
+        old_status = None
+    elif update_fields is not None and "status" not in update_fields:
+        return
+    else:
+        old_status = getattr(instance, "_loaded_status", instance.status)
+    if old_status != instance.status:
+        fault_status_changed.send(
+            sender=FaultCase, changes=[(instance.pk, instance.machine_id, old_status, instance.status)],
+        )
+    instance._loaded_status = instance.status
+
+post_save.connect(announce_saved_fault_status, sender=FaultCase)
+
+
+def announce_deleted_fault_status(sender, instance, **kwargs):
+    # When the machine is being deleted its memberships are already gone; its open fault cases
+    # were taken out of the collection counts with it (see apply_status_changes()).
+    fault_status_changed.send(sender=FaultCase, changes=[(instance.pk, instance.machine_id, instance.status, None)])
+
+post_delete.connect(announce_deleted_fault_status, sender=FaultCase)
+
+
+def update_collection_open_faults(sender, changes, **kwargs):
+    CollectionStatusCount.objects.apply_fault_changes(changes)
+
+fault_status_changed.connect(update_collection_open_faults)
+
+
+def index_changed_faults(sender, fault_ids, **kwargs):
+    index_faults(fault_ids)
+    bump_board_versions([GLOBAL_SCOPE])
+
+fault_cases_changed.connect(index_changed_faults)
+
+
+def index_faults_of_renamed_machine(sender, instance, created, **kwargs):
+    # Fault documents include the machine name; most machine saves are status changes.
+    loaded_name = getattr(instance, "_loaded_name", None)
+    if not created and loaded_name is not None and loaded_name != instance.name:
+        index_faults(instance.fault_cases.values_list("pk", flat=True))
+    instance._loaded_name = instance.name
+
+post_save.connect(index_faults_of_renamed_machine, sender=Machine)
+
+
+def bump_versions_of_changed_machines(sender, changes, **kwargs):
+    bump_machine_versions([machine_id for machine_id, _old, _new in changes])
+
+machine_status_changed.connect(bump_versions_of_changed_machines)
+
+
+def bump_versions_of_edited_machine(sender, instance, **kwargs):
+    # Saves that change the status are handled by bump_versions_of_changed_machines.
+    if not getattr(instance, "_status_transition", None):
+        bump_machine_versions([instance.pk])
+
+post_save.connect(bump_versions_of_edited_machine, sender=Machine)
+
+
+def bump_global_board_version(sender, **kwargs):
+    bump_board_versions([GLOBAL_SCOPE])
+
+for model in (FaultCase, FaultNote, Warning):
+    post_save.connect(bump_global_board_version, sender=model)
+    post_delete.connect(bump_global_board_version, sender=model)
+warning_added.connect(bump_global_board_version)
+
+
+def bump_all_board_versions_for_user(sender, update_fields=None, **kwargs):
+    # Users (e.g. the technicians offered for assignment) appear on every board, including the
+    # collection-filtered ones. Logging in only saves last_login, which no board shows.
+    if update_fields is None or set(update_fields) - {"last_login"}:
+        bump_all_board_versions()
+
+for model in (User, UserProfile):
+    post_save.connect(bump_all_board_versions_for_user, sender=model)
+    post_delete.connect(bump_all_board_versions_for_user, sender=model)
+
+
+def bump_collection_version(sender, instance, **kwargs):
+    bump_board_versions([GLOBAL_SCOPE, collection_scope(instance.pk)])
+
+post_save.connect(bump_collection_version, sender=Collection)
+post_delete.connect(bump_collection_version, sender=Collection)
+
+
+def bump_versions_of_reassigned_machines(sender, instance, action, reverse, pk_set, **kwargs):
+    # Machine.assigned_to changed, from the machine side or from the user side.
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        bump_machine_versions([instance.pk])
+    elif pk_set:
+        bump_machine_versions(pk_set)
+    else:
+        # user.assigned_machines.clear(): the machines are no longer known.
+        bump_all_board_versions()
+
+m2m_changed.connect(bump_versions_of_reassigned_machines, sender=Machine.assigned_to.through)
+
+
+def bump_versions_of_bulk_reassigned_machines(sender, machine_ids, **kwargs):
+    bump_machine_versions(machine_ids)
+
+machines_reassigned.connect(bump_versions_of_bulk_reassigned_machines)
+
+
+def bump_versions_of_regrouped_machines(sender, instance, action, reverse, pk_set, **kwargs):
+    # Collection.machines changed, from the collection side or from the machine side.
+    if action not in ("pre_clear", "post_add", "post_remove"):
+        return
+    if action == "pre_clear":
+        # Capture the memberships before they are removed.
+        pk_set = set(getattr(instance, "machines" if not reverse else "collections").values_list("pk", flat=True))
+    if not reverse:
+        bump_machine_versions(pk_set or [], collection_ids=[instance.pk])
+    else:
+        bump_machine_versions([instance.pk], collection_ids=pk_set or [])
+
+m2m_changed.connect(bump_versions_of_regrouped_machines, sender=Collection.machines.through)
+
+
+def update_counts_of_regrouped_machines(sender, instance, action, reverse, pk_set, **kwargs):
+    # Collection.machines changed, from the collection side or from the machine side. Removed
+    # memberships are counted out before the rows are deleted, in the same transaction.
+    through = Collection.machines.through
+    if action == "post_add":
+        if not reverse:
+            memberships = [(instance.pk, machine_id) for machine_id in pk_set]
+        else:
+            memberships = [(collection_id, instance.pk) for collection_id in pk_set]
+        CollectionStatusCount.objects.apply_memberships(memberships, 1)
+    elif action in ("pre_remove", "pre_clear"):
+        rows = through.objects.filter(**{"machine_id" if reverse else "collection_id": instance.pk})
+        if action == "pre_remove":
+            rows = rows.filter(**{"collection_id__in" if reverse else "machine_id__in": pk_set})
+        CollectionStatusCount.objects.apply_memberships(list(rows.values_list("collection_id", "machine_id")), -1)
+
+m2m_changed.connect(update_counts_of_regrouped_machines, sender=Collection.machines.through)
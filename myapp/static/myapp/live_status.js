@@ -0,0 +1,54 @@
+/*
+  live_status.js
+
+  Keeps the dashboards up to date without reloading the page. It subscribes to the
+  machine_events Server-Sent Events stream (the URL is read from the data-events-url attribute
+  of the script tag) and patches the page in place:
+    - rows marked with data-machine-id get their data-field="status" cells updated, or are
+      removed when the machine has been deleted;
+    - summary cards marked with data-status-total="<status>" get the new totals.
+  The browser reconnects automatically and resumes from the last event it received.
+*/
+(function () {
+  var script = document.currentScript;
+  if (!script || !window.EventSource) {
+    return;
+  }
+  var source = new EventSource(script.dataset.eventsUrl);
+
+  function updateStatusCell(cell, status) {
+    var badge = cell.querySelector(".status");
+    if (badge) {
+      badge.className = "status " + status.toLowerCase();
+      badge.textContent = status;
+    } else {
+      cell.textContent = status;
+    }
+  }
+
+  source.addEventListener("machine", function (event) {
+    var machine = JSON.parse(event.data);
+    var rows = document.querySelectorAll('[data-machine-id="' + machine.id + '"]');
+    rows.forEach(function (row) {
+      if (machine.deleted) {
+        row.remove();
+        return;
+      }
+      row.querySelectorAll('[data-field="status"]').forEach(function (cell) {
+        updateStatusCell(cell, machine.status);
+      });
+      row.querySelectorAll('[data-field="name"]').forEach(function (cell) {
+        cell.textContent = machine.name;
+      });
+    });
+  });
+
+  source.addEventListener("totals", function (event) {
+    var totals = JSON.parse(event.data);
+    Object.keys(totals).forEach(function (status) {
+      document.querySelectorAll('[data-status-total="' + status + '"]').forEach(function (card) {
+        card.textContent = totals[status];
+      });
+    });
+  });
+})();
@@ -0,0 +1,127 @@
+"""
+staticfiles.py
+
+This module defines the build step for the static assets (the stylesheets, scripts and the
+photos under myapp/static/images). It runs as part of `manage.py collectstatic` through
+CompressedManifestStaticFilesStorage, which:
+  - names every file after a hash of its content (Django's ManifestStaticFilesStorage), so a
+    file can be cached by browsers for ever: a changed file gets a new name,
+  - writes gzip (and, when the `brotli` package is installed, brotli) compressed copies of the
+    text assets next to them, e.g. myapp/base.3f2a9c1e0b4d.css.gz, and
+  - writes WebP copies of the images at the configured variant widths (see images.py), recorded
+    in the manifest as e.g. images/factory-480w.webp, for responsive srcset attributes.
+The collected files are served by StaticAssetMiddleware (see middleware.py).
+"""
+
+import gzip
+import io
+import posixpath
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from PIL import Image, UnidentifiedImageError
+
+from .images import VARIANT_WIDTHS, render_variant
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available.
+    brotli = None
+
+# Extensions of the text assets that are worth compressing (images are compressed already).
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".json", ".map", ".svg", ".txt", ".html", ".xml"}
+# The images that get responsive variants: the photos under images/ (not the icons of the admin).
+RESPONSIVE_IMAGE_PREFIX = "images/"
+RESPONSIVE_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+# A compressed copy is only kept if it is at least this much smaller than the original.
+MIN_COMPRESSION_RATIO = 0.95
+
+# Content-Encoding of each precompressed copy, by file suffix, in order of preference.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz")) if brotli else (("gzip", ".gz"),)
+
+RESPONSIVE_VARIANT_RE = re.compile(r"^(?P<stem>.+)-(?P<width>\d+)w\.webp$")
+
+
+def responsive_variant_name(name, width):
+    """
+    Returns the (unhashed) static name of the `width` pixels wide WebP copy of image `name`.
+    """
+    stem, _ext = posixpath.splitext(name)
+    return f"{stem}-{width}w.webp"
+
+
+def compress(data):
+    """
+    Returns {suffix: compressed bytes} for the precompressed copies worth keeping of `data`.
+    """
+    copies = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli:
+        copies[".br"] = brotli.compress(data)
+    return {suffix: copy for suffix, copy in copies.items() if len(copy) <= len(data) * MIN_COMPRESSION_RATIO}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also writes precompressed copies of the text assets and
+    responsive WebP copies of the images when the static files are collected.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        # Hash the files (and save the manifest) first; the copies are made from the hashed files.
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        self.__dict__.pop("_responsive_index", None)
+        for name, hashed_name in list(self.hashed_files.items()):
+            if name.startswith(RESPONSIVE_IMAGE_PREFIX) \
+                    and posixpath.splitext(name)[1].lower() in RESPONSIVE_IMAGE_EXTENSIONS:
+                for variant, hashed_variant in self._write_responsive_variants(name, hashed_name):
+                    yield variant, hashed_variant, True
+        for name, hashed_name in list(self.hashed_files.items()):
+            if posixpath.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                # Compress the unhashed copy too: it is what an unversioned URL serves.
+                for stored_name in {name, hashed_name}:
+                    self._write_compressed_copies(stored_name)
+        self.save_manifest()
+
+    def _write_responsive_variants(self, name, hashed_name):
+        # Writes a WebP copy of the image at each variant width below its own width, and one at
+        # its full width; yields (name, hashed name) and records each one in the manifest.
+        with self.open(hashed_name) as source:
+            data = source.read()
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                full_width = image.width
+        except (OSError, UnidentifiedImageError):
+            return
+        for width in sorted({w for w in VARIANT_WIDTHS if w < full_width} | {full_width}):
+            variant = responsive_variant_name(name, width)
+            content = ContentFile(render_variant(io.BytesIO(data), width, "WEBP"))
+            hashed_variant = self.hashed_name(variant, content)
+            if not self.exists(hashed_variant):
+                self._save(hashed_variant, content)
+            self.hashed_files[self.hash_key(self.clean_name(variant))] = hashed_variant
+            yield variant, hashed_variant
+
+    def _write_compressed_copies(self, name):
+        with self.open(name) as source:
+            data = source.read()
+        for suffix, copy in compress(data).items():
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(copy))
+
+    def responsive_variants(self, name):
+        """
+        Returns [(width, name)] of the responsive WebP copies of image `name` recorded in the
+        manifest, narrowest first ([] for files without copies).
+        """
+        if not hasattr(self, "_responsive_index"):
+            index = {}
+            for variant in self.hashed_files:
+                match = RESPONSIVE_VARIANT_RE.match(variant)
+                if match:
+                    index.setdefault(match["stem"], []).append((int(match["width"]), variant))
+            self._responsive_index = {stem: sorted(variants) for stem, variants in index.items()}
+        return self._responsive_index.get(posixpath.splitext(self.clean_name(name))[0], [])
@@ -0,0 +1,101 @@
+"""
+storage.py
+
+This module defines a content-addressed file storage backend for uploaded media.
+
+Uploads (machine photos, fault note images) are hashed with SHA-256 while they are written to
+disk, in a single streaming pass, and stored under a name derived from the hash:
+    cas/<first 2 hex digits>/<next 2 hex digits>/<sha256><extension>
+Uploading the same bytes twice (e.g. a technician attaching the same photo to many notes)
+therefore stores them once. The number of model rows referring to each blob is tracked in the
+MediaBlob table (see signals.py), and a blob's file is deleted when its last reference goes.
+An upload takes its reference in the storage itself, before it decides whether the blob file
+already exists, so a blob whose last reference has just gone cannot be collected while a new
+upload of the same content is reusing it.
+"""
+
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.core.files.move import file_move_safe
+
+CAS_PREFIX = "cas"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names files by the SHA-256 of their content.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is decided from the content in _save(); identical content shares a name.
+        return name
+
+    def _save(self, name, content):
+        """
+        Streams the content to a temporary file in the storage directory while hashing it, takes
+        a reference to the blob (see MediaBlobManager.collect(), which only deletes blobs that
+        still have no reference once locked), then moves the file to its content-addressed name,
+        or discards it if that blob already exists. Returns the content-addressed name.
+        """
+        from .models import MediaBlob
+
+        temp_dir = self.path(posixpath.join(CAS_PREFIX, "tmp"))
+        os.makedirs(temp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as temp_file:
+            try:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            except BaseException:
+                os.unlink(temp_file.name)
+                raise
+
+        blob_name = self.blob_name(digest.hexdigest(), name)
+        blob_path = self.path(blob_name)
+        MediaBlob.objects.add_references([blob_name])
+        try:
+            # Reusing the blob: refresh its modification time so gc_media_blobs treats it as
+            # recent until the row referring to it is saved.
+            os.utime(blob_path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            file_move_safe(temp_file.name, blob_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(blob_path, self.file_permissions_mode)
+        else:
+            os.unlink(temp_file.name)
+        return blob_name
+
+    @staticmethod
+    def blob_name(hexdigest, original_name):
+        """
+        Returns the content-addressed storage name of a blob with the given SHA-256 hex digest,
+        keeping the (lower-cased) extension of the original file name.
+        """
+        extension = posixpath.splitext(original_name)[1].lower()
+        return posixpath.join(CAS_PREFIX, hexdigest[:2], hexdigest[2:4], hexdigest + extension)
+
+    @staticmethod
+    def is_blob(name):
+        """
+        Returns True if `name` is a content-addressed blob name (rather than a legacy upload).
+        """
+        return bool(name) and name.startswith(CAS_PREFIX + "/") and not name.startswith(f"{CAS_PREFIX}/tmp/")
+
+
+content_addressed_storage = ContentAddressedStorage()
+
+
+def get_media_storage():
+    """
+    Returns the storage used by the Machine and FaultNote image fields. A callable, so that
+    migrations refer to it instead of serializing the storage.
+    """
+    return content_addressed_storage
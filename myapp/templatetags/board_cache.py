@@ -0,0 +1,98 @@
+"""
+board_cache.py
+
+Template tag that caches a fragment of a dashboard until the data it shows changes, keyed on the
+board versions maintained by myapp/board_cache.py. A cache hit skips rendering the fragment and
+evaluating the querysets it iterates over.
+
+Usage:
+    {% load board_cache %}
+    {% boardcache "machine_table" %} ... {% endboardcache %}
+    {% boardcache "machine_table" collection=selected_collection.pk %} ... {% endboardcache %}
+    {% boardcache "assigned_machines" user.pk %} ... {% endboardcache %}
+
+`collection` keys the fragment on the version of that collection instead of the whole board (an
+empty value means the whole board). Pass the id of a collection that was looked up, never a raw
+request parameter: every scope gets a BoardVersion row. Any further arguments are added to the key, as with
+Django's {% cache %} tag. Fragments may contain {% csrf_token %}: it is cached as a placeholder
+and filled in with the current request's token on every render.
+"""
+
+from django import template
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template.defaulttags import CsrfTokenNode
+
+from myapp.board_cache import GLOBAL_SCOPE, board_versions, collection_scope
+
+register = template.Library()
+
+# How long a rendered fragment is kept (it is never served once its board version changes).
+FRAGMENT_TIMEOUT = getattr(settings, "BOARD_FRAGMENT_CACHE_TIMEOUT", 600)
+FRAGMENT_CACHE_ALIAS = getattr(settings, "BOARD_FRAGMENT_CACHE_ALIAS", "default")
+
+CSRF_PLACEHOLDER = "board-cache-csrf-token"
+
+
+class BoardCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, collection, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.collection = collection
+        self.vary_on = vary_on
+
+    def scope(self, context):
+        collection = self.collection.resolve(context) if self.collection else None
+        try:
+            return collection_scope(int(collection)) if collection else GLOBAL_SCOPE
+        except (TypeError, ValueError):
+            return GLOBAL_SCOPE
+
+    def version(self, context, scope):
+        # The versions are read once per request (one query), however many fragments use them.
+        request = context.get("request")
+        versions = getattr(request, "_board_versions", None) if request is not None else None
+        if versions is None:
+            versions = {}
+            if request is not None:
+                request._board_versions = versions
+        if scope not in versions:
+            versions.update(board_versions({GLOBAL_SCOPE, scope}))
+        return versions[scope]
+
+    def render(self, context):
+        scope = self.scope(context)
+        key = make_template_fragment_key(
+            self.fragment_name.resolve(context),
+            [scope, self.version(context, scope), *(var.resolve(context) for var in self.vary_on)],
+        )
+        fragment_cache = caches[FRAGMENT_CACHE_ALIAS]
+        content = fragment_cache.get(key)
+        if content is None:
+            with context.push(csrf_token=CSRF_PLACEHOLDER):
+                content = self.nodelist.render(context)
+            fragment_cache.set(key, content, FRAGMENT_TIMEOUT)
+        with context.push(csrf_token=CSRF_PLACEHOLDER):
+            placeholder = CsrfTokenNode().render(context)
+        return content.replace(placeholder, CsrfTokenNode().render(context))
+
+
+@register.tag("boardcache")
+def do_boardcache(parser, token):
+    """
+    {% boardcache fragment_name [collection=<id>] [vary_on ...] %} ... {% endboardcache %}
+    """
+    nodelist = parser.parse(("endboardcache",))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires at least a fragment name.")
+    collection = None
+    vary_on = []
+    for bit in bits[2:]:
+        if bit.startswith("collection="):
+            collection = parser.compile_filter(bit[len("collection="):])
+        else:
+            vary_on.append(parser.compile_filter(bit))
+    return BoardCacheNode(nodelist, parser.compile_filter(bits[1]), collection, vary_on)
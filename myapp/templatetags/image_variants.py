@@ -0,0 +1,35 @@
+"""
+image_variants.py
+
+Template filters that give templates the URLs of resized image variants (see myapp/images.py)
+instead of the original uploads.
+
+Usage:
+    {% load image_variants %}
+    <img src="{{ machine.image|image_variant:480 }}" srcset="{{ machine.image|image_srcset }}" sizes="320px">
+"""
+
+from django import template
+
+from myapp.images import generated_widths, variant_url
+
+register = template.Library()
+
+
+@register.filter
+def image_variant(field_file, width):
+    """
+    Returns the URL of the variant of an image at least `width` pixels wide ("" if no image).
+    """
+    return variant_url(field_file, int(width))
+
+
+@register.filter
+def image_srcset(field_file):
+    """
+    Returns a srcset attribute value listing the generated variants of an image ("" if no image
+    or no variants, so that the browser uses `src`).
+    """
+    if not field_file:
+        return ""
+    return ", ".join(f"{variant_url(field_file, width)} {width}w" for width in generated_widths(field_file))
@@ -0,0 +1,32 @@
+"""
+static_assets.py
+
+Template filters that give templates the responsive WebP copies of the static images written by
+`collectstatic` (see myapp/staticfiles.py).
+
+Usage:
+    {% load static static_assets %}
+    <img src="{% static 'images/factory.jpg' %}" srcset="{{ 'images/factory.jpg'|static_srcset }}" sizes="50vw">
+
+Give every such image a `sizes` attribute with its rendered width: without it the browser assumes
+the full viewport width and picks a copy far larger than needed.
+"""
+
+from django import template
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+register = template.Library()
+
+
+@register.filter
+def static_srcset(name):
+    """
+    Returns a srcset attribute value listing the responsive copies of a static image ("" when
+    the static files were not collected with CompressedManifestStaticFilesStorage).
+    """
+    responsive_variants = getattr(staticfiles_storage, "responsive_variants", None)
+    if responsive_variants is None:
+        return ""
+    return ", ".join(
+        f"{staticfiles_storage.url(variant)} {width}w" for width, variant in responsive_variants(name)
+    )
@@ -1,4 +1,43 @@
-from django.test import TestCase
+from io import BytesIO, StringIO
+import asyncio
+import gzip
+import os
+import runpy
+import shutil
+import tempfile
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from unittest import mock
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from django.urls import reverse
+from django.utils import timezone
+from datetime import timedelta
+from PIL import Image
+
+from . import metrics, profiling
+from .benchmarks import run_benchmarks
+from .board_cache import GLOBAL_SCOPE, board_versions, collection_scope
+from .images import VARIANT_WIDTHS, variant_name, variant_url
+from .templatetags.image_variants import image_srcset
+from .search import search_faults
+from .serializers import MachineStatusSerializer
+from .seeding import seed_fleet
+from .views import apply_machine_statuses
+from .write_queue import WriteQueue
+from .models import (
+    UserProfile, Machine, MachineStatusCount, CollectionStatusCount, MachineChange, FaultCase, FaultNote, Warning,
+    Collection, MachineStatusEvent, MachineStatusRollup, CollectionStatusRollup, MediaBlob, BoardVersion,
+)
 
 # Create your tests here.
 
@@ -7,4 +46,1395 @@ class ExampleTests(TestCase):
         """
         An empty test
         """
-        assert 1 == 1
\ No newline at end of file
+        assert 1 == 1
+
+
+def create_user(username, role=None, superuser=False):
+    """
+    Helper that creates a user (optionally a superuser) with an optional UserProfile role.
+    """
+    if superuser:
+        user = User.objects.create_superuser(username=username, password="password")
+    else:
+        user = User.objects.create_user(username=username, password="password")
+    if role:
+        UserProfile.objects.create(user=user, role=role)
+    return user
+
+
+def create_fleet(size, technician, repair_person, collection):
+    """
+    Helper that creates `size` machines, each in a collection, assigned to a technician and a
+    repair person, with an open fault case carrying two notes and an active warning.
+    """
+    for i in range(size):
+        machine = Machine.objects.create(name=f"Machine {i}", description="", status="Fault")
+        collection.machines.add(machine)
+        machine.assigned_to.add(technician, repair_person)
+        fault = FaultCase.objects.create(machine=machine, reported_by=technician, title=f"Fault {i}")
+        FaultNote.objects.create(fault_case=fault, note="first", created_by=technician)
+        FaultNote.objects.create(fault_case=fault, note="latest", created_by=repair_person)
+        Warning.objects.create(machine=machine, warning_text=f"Warning {i}", created_by=technician)
+
+
+class DashboardQueryCountTests(TestCase):
+    """
+    The role dashboards must load in a number of queries that does not depend on fleet size.
+    """
+    dashboards = [
+        "myapp:manager_dashboard",
+        "myapp:technician_dashboard",
+        "myapp:repair_dashboard",
+        "myapp:viewonly_dashboard",
+    ]
+
+    def setUp(self):
+        self.technician = create_user("tech", "Technician")
+        self.repair_person = create_user("repair", "Repair")
+        self.collection = Collection.objects.create(name="Line-A")
+        self.admin = create_user("boss", superuser=True)
+
+    def count_queries(self, url_name):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_independent_of_fleet_size(self):
+        create_fleet(2, self.technician, self.repair_person, self.collection)
+        small = {name: self.count_queries(name) for name in self.dashboards}
+        create_fleet(6, self.technician, self.repair_person, self.collection)
+        large = {name: self.count_queries(name) for name in self.dashboards}
+        self.assertEqual(small, large)
+
+    def test_fault_modal_shows_latest_note(self):
+        create_fleet(1, self.technician, self.repair_person, self.collection)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("myapp:repair_dashboard"))
+        fault = response.context["repair_cases"][0]
+        self.assertEqual(fault.latest_note.note, "latest")
+
+
+class MachineStatusCountTests(TestCase):
+    """
+    The precomputed status counters must follow every status change.
+    """
+
+    def setUp(self):
+        self.technician = create_user("tech", "Technician")
+        self.client.force_login(self.technician)
+
+    def test_counters_follow_status_changes(self):
+        machine = Machine.objects.create(name="Press", description="", status="OK")
+        Machine.objects.create(name="Lathe", description="", status="OK")
+        self.assertEqual(MachineStatusCount.objects.totals(), {"OK": 2, "Warning": 0, "Fault": 0})
+
+        self.client.post(reverse("myapp:create_fault"), {"machine": machine.pk, "title": "Jammed"})
+        self.assertEqual(MachineStatusCount.objects.totals(), {"OK": 1, "Warning": 0, "Fault": 1})
+
+        self.client.post("/api/machine/faultUpdate", {"id": machine.pk, "status": "Warning"})
+        self.assertEqual(MachineStatusCount.objects.totals(), {"OK": 1, "Warning": 1, "Fault": 0})
+
+        Machine.objects.get(pk=machine.pk).delete()
+        self.assertEqual(MachineStatusCount.objects.totals(), {"OK": 1, "Warning": 0, "Fault": 0})
+        call_command("rebuild_status_counts", "--check", stdout=StringIO())
+
+    def test_stale_instances_do_not_count_twice(self):
+        Machine.objects.create(name="Press", description="", status="OK")
+        first, second = Machine.objects.get(name="Press"), Machine.objects.get(name="Press")
+        first.status = second.status = "Fault"
+        first.save()
+        second.save()
+        self.assertEqual(MachineStatusCount.objects.totals(), {"OK": 0, "Warning": 0, "Fault": 1})
+        self.assertEqual(MachineStatusEvent.objects.filter(to_status="Fault").count(), 1)
+
+    def test_rebuild_command_repairs_drift(self):
+        Machine.objects.create(name="Press", description="", status="Fault")
+        MachineStatusCount.objects.filter(status="Fault").update(count=7)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_status_counts", "--check", stdout=StringIO())
+        call_command("rebuild_status_counts", stdout=StringIO())
+        self.assertEqual(MachineStatusCount.objects.totals()["Fault"], 1)
+
+
+class ExportReportTests(TestCase):
+    """
+    The CSV export streams its rows and prefetches per chunk rather than per machine.
+    """
+
+    def setUp(self):
+        self.technician = create_user("tech", "Technician")
+        self.repair_person = create_user("repair", "Repair")
+        self.collection = Collection.objects.create(name="Line-A")
+        self.client.force_login(create_user("boss", superuser=True))
+
+    def export(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("myapp:export_report"))
+            content = b"".join(response.streaming_content).decode()
+        return content.splitlines(), len(context.captured_queries)
+
+    def test_export_streams_all_machines(self):
+        create_fleet(3, self.technician, self.repair_person, self.collection)
+        lines, _ = self.export()
+        self.assertEqual(lines[0], "Name,Status,Description,Collections,Assigned Personnel")
+        self.assertEqual(len(lines), 4)
+        self.assertIn("Machine 0,Fault,,Line-A,", lines[1])
+
+    def test_query_count_grows_with_chunks_not_rows(self):
+        with mock.patch("myapp.views.EXPORT_CHUNK_SIZE", 100):
+            create_fleet(2, self.technician, self.repair_person, self.collection)
+            _, small = self.export()
+            create_fleet(8, self.technician, self.repair_person, self.collection)
+            _, large = self.export()
+        self.assertEqual(small, large)
+
+
+class MachineBatchUpdateTests(TestCase):
+    """
+    The batch ingestion endpoint applies many status updates in one request.
+    """
+
+    def test_batch_update_reports_per_item_results(self):
+        press = Machine.objects.create(name="Press", description="", status="OK")
+        lathe = Machine.objects.create(name="Lathe", description="", status="Warning")
+        updates = [
+            {"id": press.pk, "status": "Warning"},
+            {"id": lathe.pk, "status": "Warning"},
+            {"id": press.pk, "status": "Fault"},
+            {"id": 999999, "status": "OK"},
+        ]
+        response = self.client.post("/api/machine/batchUpdate", updates, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item["result"] for item in response.json()["results"]],
+            ["superseded", "unchanged", "updated", "not_found"],
+        )
+        press.refresh_from_db()
+        self.assertEqual(press.status, "Fault")
+        self.assertEqual(MachineStatusCount.objects.totals(), {"OK": 0, "Warning": 1, "Fault": 1})
+
+    def test_batch_update_validates_every_item(self):
+        response = self.client.post(
+            "/api/machine/batchUpdate",
+            [{"id": 1, "status": "OK"}, {"id": 2, "status": "Broken"}],
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()[0], {})
+        self.assertIn("status", response.json()[1])
+
+
+class StatusWriteCoalescingTests(TestCase):
+    """
+    Status updates that change nothing are not written; flapping machines can be debounced.
+    """
+
+    def setUp(self):
+        metrics.reset()
+        self.press = Machine.objects.create(name="Press", description="", status="OK")
+
+    def post(self, new_status):
+        response = self.client.post(
+            "/api/machine/faultUpdate", {"id": self.press.pk, "status": new_status}, content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["result"]
+
+    def test_resent_status_is_not_written(self):
+        self.assertEqual(self.post("Warning"), "updated")
+        updated_at = Machine.objects.get(pk=self.press.pk).updated_at
+        changes = MachineChange.objects.count()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.post("Warning"), "unchanged")
+        self.assertFalse(any(query["sql"].startswith("UPDATE") for query in context.captured_queries))
+        self.assertEqual(Machine.objects.get(pk=self.press.pk).updated_at, updated_at)
+        self.assertEqual(MachineChange.objects.count(), changes)
+
+        self.client.force_login(create_user("boss", superuser=True))
+        stats = self.client.get("/api/machine/writeStats").json()
+        self.assertEqual(stats, {"applied": 1, "elided": 1, "debounced": 0})
+
+    def test_deleting_a_warning_writes_only_a_status_change(self):
+        self.client.force_login(create_user("repair", "Repair"))
+        updated_at = Machine.objects.get(pk=self.press.pk).updated_at
+        warning = Warning.objects.create(machine=self.press, warning_text="Noisy")
+        self.client.post(reverse("myapp:delete_warning", args=[warning.pk]))
+        self.assertEqual(Machine.objects.get(pk=self.press.pk).updated_at, updated_at)
+
+        warning = Warning.objects.create(machine=self.press, warning_text="Noisy")
+        Machine.objects.filter(pk=self.press.pk).set_status("Warning")
+        self.client.post(reverse("myapp:delete_warning", args=[warning.pk]))
+        self.assertEqual(Machine.objects.get(pk=self.press.pk).status, "OK")
+        self.assertEqual(MachineStatusCount.objects.totals()["OK"], 1)
+
+    @override_settings(MACHINE_STATUS_DEBOUNCE_SECONDS=60)
+    def test_flapping_machine_is_debounced(self):
+        MachineStatusEvent.objects.update(at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.post("Warning"), "updated")
+        self.assertEqual(self.post("OK"), "debounced")
+        self.assertEqual(self.post("Fault"), "updated")
+        MachineStatusEvent.objects.update(at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.post("OK"), "updated")
+        self.assertEqual(metrics.snapshot()["machine_status_writes_debounced"], 1)
+
+
+class MachineApiConditionalGetTests(TestCase):
+    """
+    The machine list API is cursor paginated and answers unchanged polls with 304.
+    """
+
+    def setUp(self):
+        for i in range(3):
+            Machine.objects.create(name=f"Machine {i}", description="", status="OK")
+
+    def test_cursor_pagination(self):
+        response = self.client.get("/api/machine/?page_size=2")
+        self.assertEqual([m["name"] for m in response.json()["results"]], ["Machine 0", "Machine 1"])
+        response = self.client.get(response.json()["next"])
+        self.assertEqual([m["name"] for m in response.json()["results"]], ["Machine 2"])
+
+    def test_unchanged_poll_returns_not_modified(self):
+        etag = self.client.get("/api/machine/")["ETag"]
+        response = self.client.get("/api/machine/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Machine.objects.filter(name="Machine 1").set_status("Fault")
+        response = self.client.get("/api/machine/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_deletion_changes_etag(self):
+        etag = self.client.get("/api/machine/")["ETag"]
+        Machine.objects.filter(name="Machine 0").delete()
+        self.assertNotEqual(self.client.get("/api/machine/")["ETag"], etag)
+
+    def test_if_modified_since_alone_never_gets_not_modified(self):
+        # A write within the same second as the previous fetch keeps Last-Modified unchanged.
+        response = self.client.get("/api/machine/")
+        Machine.objects.filter(name="Machine 1").set_status("Fault")
+        Machine.objects.update(updated_at=Machine.objects.order_by("-updated_at").first().updated_at)
+        self.assertEqual(self.client.get("/api/machine/")["Last-Modified"], response["Last-Modified"])
+        refetch = self.client.get("/api/machine/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(refetch.status_code, 200)
+        machine = Machine.objects.get(name="Machine 1")
+        detail = self.client.get(f"/api/machine/{machine.pk}/", HTTP_IF_MODIFIED_SINCE=refetch["Last-Modified"])
+        self.assertEqual(detail.status_code, 200)
+
+
+class MachineChangesApiTests(TestCase):
+    """
+    The delta-sync endpoint returns only the machines changed since the cursor.
+    """
+
+    def test_changes_since_cursor(self):
+        press = Machine.objects.create(name="Press", description="", status="OK")
+        lathe = Machine.objects.create(name="Lathe", description="", status="OK")
+        response = self.client.get("/api/machine/changes/").json()
+        self.assertEqual([m["name"] for m in response["changed"]], ["Press", "Lathe"])
+        cursor = response["cursor"]
+
+        response = self.client.get("/api/machine/changes/", {"since": cursor}).json()
+        self.assertEqual((response["changed"], response["deleted"]), ([], []))
+        self.assertEqual(response["cursor"], cursor)
+
+        Machine.objects.filter(pk=press.pk).set_status("Fault")
+        lathe_id = lathe.pk
+        lathe.delete()
+        response = self.client.get("/api/machine/changes/", {"since": cursor}).json()
+        self.assertEqual([(m["id"], m["status"]) for m in response["changed"]], [(press.pk, "Fault")])
+        self.assertEqual(response["deleted"], [lathe_id])
+
+    def test_limit_and_invalid_cursor(self):
+        for i in range(3):
+            Machine.objects.create(name=f"Machine {i}", description="", status="OK")
+        response = self.client.get("/api/machine/changes/", {"limit": 2}).json()
+        self.assertTrue(response["has_more"])
+        self.assertEqual(len(response["changed"]), 2)
+        self.assertEqual(self.client.get("/api/machine/changes/", {"since": "nonsense"}).status_code, 400)
+
+    def test_limit_below_one_is_rejected(self):
+        Machine.objects.create(name="Press", description="", status="OK")
+        for limit in (0, -1, -5):
+            self.assertEqual(self.client.get("/api/machine/changes/", {"limit": limit}).status_code, 400)
+
+
+class MachineEventsTests(TestCase):
+    """
+    The Server-Sent Events stream reports status changes after the client's last event.
+    """
+
+    def test_events_after_last_event_id(self):
+        self.client.force_login(create_user("viewer", "View-only"))
+        press = Machine.objects.create(name="Press", description="", status="OK")
+        last_seq = MachineChange.objects.latest("seq").seq
+        Machine.objects.filter(pk=press.pk).set_status("Fault")
+
+        response = self.client.get(reverse("myapp:machine_events"), HTTP_LAST_EVENT_ID=str(last_seq))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join(response).decode()
+        self.assertIn(f"id: {last_seq + 1}\nevent: machine\n", body)
+        self.assertIn('"status": "Fault"', body)
+        self.assertIn('event: totals\ndata: {"OK": 0, "Warning": 0, "Fault": 1}', body)
+
+
+class MachineStatusHistoryTests(TestCase):
+    """
+    Status transitions are logged and rolled up into hourly and daily buckets.
+    """
+
+    def setUp(self):
+        self.collection = Collection.objects.create(name="Line-A")
+        self.machine = Machine.objects.create(name="Press", description="", status="OK")
+        self.collection.machines.add(self.machine)
+        # Pretend the machine has been OK for the last three hours.
+        MachineStatusEvent.objects.update(at=timezone.now() - timedelta(hours=3))
+
+    def seconds(self, rollups, period, status):
+        return sum(rollups.filter(period=period, status=status).values_list("seconds", flat=True))
+
+    def test_transitions_are_logged_and_rolled_up(self):
+        Machine.objects.filter(pk=self.machine.pk).set_status("Fault")
+        self.assertEqual(
+            list(self.machine.status_events.order_by("at").values_list("from_status", "to_status")),
+            [(None, "OK"), ("OK", "Fault")],
+        )
+        for rollups in (MachineStatusRollup.objects.all(), CollectionStatusRollup.objects.all()):
+            self.assertAlmostEqual(self.seconds(rollups, "hour", "OK"), 3 * 3600, delta=5)
+            self.assertAlmostEqual(self.seconds(rollups, "day", "OK"), 3 * 3600, delta=5)
+            self.assertEqual(rollups.get(period="day", status="Fault").entered, 1)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        Machine.objects.filter(pk=self.machine.pk).set_status("Fault")
+        Machine.objects.filter(pk=self.machine.pk).set_status("OK")
+        def seconds_by_bucket():
+            rows = MachineStatusRollup.objects.values_list("period", "bucket_start", "status", "seconds")
+            return sorted((period, bucket, status, round(seconds)) for period, bucket, status, seconds in rows)
+
+        incremental = seconds_by_bucket()
+        call_command("rebuild_status_rollups", stdout=StringIO())
+        self.assertEqual(seconds_by_bucket(), incremental)
+
+    def test_availability_report(self):
+        Machine.objects.filter(pk=self.machine.pk).set_status("Fault")
+        MachineStatusEvent.objects.filter(to_status="Fault").update(at=timezone.now() - timedelta(hours=1))
+        response = self.client.get(f"/api/collection/{self.collection.pk}/availability/", {"period": "hour"})
+        self.assertEqual(response.status_code, 200)
+        total = response.json()["total"]
+        self.assertEqual(total["faults"], 1)
+        self.assertAlmostEqual(total["seconds"]["Fault"], 3600, delta=5)
+        self.assertAlmostEqual(total["availability"], 0.75, delta=0.01)
+
+
+def make_image_upload(name="photo.jpg", size=(1600, 1200)):
+    """
+    Helper that returns an uploaded JPEG file of the given size.
+    """
+    buffer = BytesIO()
+    Image.new("RGB", size, "steelblue").save(buffer, format="JPEG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+class MediaRootTestCase(TestCase):
+    """
+    Base class for tests that store uploads: MEDIA_ROOT points at a temporary directory.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+class ImageVariantTests(MediaRootTestCase):
+    """
+    Uploaded images get resized variants, generated on upload or by the backfill command, never
+    while serving a request.
+    """
+
+    def test_variants_generated_on_upload(self):
+        machine = Machine.objects.create(name="Press", description="")
+        fault = FaultCase.objects.create(machine=machine)
+        with self.captureOnCommitCallbacks(execute=True):
+            note = FaultNote.objects.create(fault_case=fault, note="photo", image=make_image_upload())
+        for width in VARIANT_WIDTHS:
+            with note.image.storage.open(variant_name(note.image.name, width)) as variant:
+                self.assertEqual(Image.open(variant).width, width)
+        self.assertEqual(FaultNote.objects.get(pk=note.pk).image_variant_widths, list(VARIANT_WIDTHS))
+
+    def test_variant_urls_do_not_touch_storage(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            machine = Machine.objects.create(name="Press", description="", image=make_image_upload(size=(300, 200)))
+        machine = Machine.objects.get(pk=machine.pk)
+        with mock.patch("myapp.images.generate_variant") as generate, \
+                mock.patch.object(type(machine.image.storage), "exists") as exists:
+            url = variant_url(machine.image, 480)
+            response = self.client.get(f"/api/machine/{machine.pk}/")
+        generate.assert_not_called()
+        exists.assert_not_called()
+        self.assertTrue(url.endswith("-480w.webp"))
+        self.assertEqual(response.json()["image_variants"]["480"], url)
+
+    def test_images_without_variants_use_the_original(self):
+        machine = Machine.objects.create(name="Press", description="", image=make_image_upload(size=(300, 200)))
+        self.assertEqual(variant_url(machine.image, 480), machine.image.url)
+        self.assertEqual(self.client.get(f"/api/machine/{machine.pk}/").json()["image_variants"]["480"], machine.image.url)
+        self.assertEqual(image_srcset(machine.image), "")
+
+        # A failed generation records nothing, so the original keeps being served.
+        with mock.patch("myapp.images.render_variant", side_effect=OSError), self.assertLogs("myapp.images"), \
+                self.captureOnCommitCallbacks(execute=True):
+            note = FaultNote.objects.create(
+                fault_case=FaultCase.objects.create(machine=machine), note="photo", image=make_image_upload(),
+            )
+        note = FaultNote.objects.get(pk=note.pk)
+        self.assertEqual(note.image_variant_widths, [])
+        self.assertEqual(variant_url(note.image, 160), note.image.url)
+
+        call_command("generate_image_variants", stdout=StringIO())
+        machine = Machine.objects.get(pk=machine.pk)
+        self.assertTrue(variant_url(machine.image, 480).endswith("-480w.webp"))
+        self.assertIn(" 960w", image_srcset(machine.image))
+
+    @override_settings(DEBUG=False)
+    def test_uploads_are_served_without_debug(self):
+        machine = Machine.objects.create(name="Press", description="", image=make_image_upload(size=(300, 200)))
+        response = self.client.get(machine.image.url)
+        self.assertEqual(response.status_code, 200)
+        with machine.image.open() as image:
+            self.assertEqual(b"".join(response.streaming_content), image.read())
+
+    def test_backfill_command(self):
+        machine = Machine.objects.create(name="Press", description="", image=make_image_upload(size=(300, 200)))
+        call_command("generate_image_variants", stdout=StringIO())
+        # Images are never scaled up.
+        with machine.image.storage.open(variant_name(machine.image.name, 480)) as variant:
+            self.assertEqual(Image.open(variant).width, 300)
+
+
+class ContentAddressedStorageTests(MediaRootTestCase):
+    """
+    Uploads are stored once per content and deleted with their last reference.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.machine = Machine.objects.create(name="Press", description="")
+        self.fault = FaultCase.objects.create(machine=self.machine)
+
+    def test_identical_uploads_share_a_blob(self):
+        first = FaultNote.objects.create(fault_case=self.fault, note="a", image=make_image_upload("a.JPG"))
+        second = FaultNote.objects.create(fault_case=self.fault, note="b", image=make_image_upload("b.jpg"))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r"^cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$")
+        self.assertEqual(MediaBlob.objects.get(name=first.image.name).refcount, 2)
+        self.assertEqual(os.listdir(os.path.dirname(first.image.path)), [os.path.basename(first.image.path)])
+
+    def test_blob_deleted_with_last_reference(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = FaultNote.objects.create(fault_case=self.fault, note="a", image=make_image_upload())
+            second = FaultNote.objects.create(fault_case=self.fault, note="b", image=make_image_upload())
+        name, path = first.image.name, first.image.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            # Cascades from the machine to its fault cases and their notes.
+            self.machine.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, variant_name(name, VARIANT_WIDTHS[0]))))
+        self.assertFalse(MediaBlob.objects.filter(name=second.image.name).exists())
+
+    def test_reused_blob_survives_a_pending_collection(self):
+        note = FaultNote.objects.create(fault_case=self.fault, note="a", image=make_image_upload())
+        name, path = note.image.name, note.image.path
+        note.delete()  # The collection of the unreferenced blob is left pending (on_commit).
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 0)
+        # The collection runs after the upload has reused the file but before its row is saved.
+        self.assertEqual(note.image.storage.save("b.jpg", make_image_upload()), name)
+        self.assertEqual(MediaBlob.objects.collect([name]), [])
+        self.assertTrue(os.path.exists(path))
+        # The reference taken by the upload, for the row about to be saved.
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+
+    def test_replaced_image_released(self):
+        machine = Machine.objects.create(name="Lathe", description="", image=make_image_upload(size=(10, 10)))
+        old_path = machine.image.path
+        machine = Machine.objects.get(pk=machine.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            machine.image = make_image_upload(size=(20, 20))
+            machine.save()
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(MediaBlob.objects.get(name=machine.image.name).refcount, 1)
+
+    def test_gc_command_recounts_and_collects_orphans(self):
+        note = FaultNote.objects.create(fault_case=self.fault, note="a", image=make_image_upload())
+        MediaBlob.objects.filter(name=note.image.name).update(refcount=5)
+        orphan = note.image.storage.save("machines/orphan.png", SimpleUploadedFile("orphan.png", b"not referenced"))
+        old = time.time() - 7200
+        os.utime(note.image.storage.path(orphan), (old, old))
+
+        call_command("gc_media_blobs", "--dry-run", stdout=StringIO())
+        self.assertTrue(note.image.storage.exists(orphan))
+
+        call_command("gc_media_blobs", stdout=StringIO())
+        self.assertFalse(note.image.storage.exists(orphan))
+        self.assertTrue(note.image.storage.exists(note.image.name))
+        self.assertEqual(MediaBlob.objects.get(name=note.image.name).refcount, 1)
+
+
+class FaultSearchTests(TestCase):
+    """
+    The full-text index over fault titles, machine names and notes is kept in sync on write.
+    """
+
+    def setUp(self):
+        self.user = create_user("tech", role="Technician")
+        self.press = Machine.objects.create(name="Hydraulic Press", description="")
+        self.lathe = Machine.objects.create(name="Lathe", description="")
+        self.leak = FaultCase.objects.create(machine=self.press, title="Oil leak")
+        self.noise = FaultCase.objects.create(machine=self.lathe, title="Grinding noise")
+        FaultNote.objects.create(fault_case=self.noise, note="Replaced the spindle bearings")
+
+    def search(self, text):
+        return [fault.pk for fault in search_faults(text)[:50]]
+
+    def test_indexes_titles_machine_names_and_notes(self):
+        self.assertEqual(self.search("leak"), [self.leak.pk])
+        self.assertEqual(self.search("hydraulic"), [self.leak.pk])
+        # Stemmed, prefix-matched and combined across columns.
+        self.assertEqual(self.search("bearing"), [self.noise.pk])
+        self.assertEqual(self.search("lathe spin"), [self.noise.pk])
+        self.assertEqual(self.search('"; DROP TABLE --'), [])
+
+    def test_index_follows_writes(self):
+        note = FaultNote.objects.create(fault_case=self.leak, note="Seal cracked")
+        self.assertEqual(self.search("seal"), [self.leak.pk])
+        note.delete()
+        self.assertEqual(self.search("seal"), [])
+
+        self.press.name = "Stamping Press"
+        self.press.save()
+        self.assertEqual(self.search("stamping"), [self.leak.pk])
+
+        self.lathe.delete()
+        self.assertEqual(self.search("bearing"), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search("press"), [self.leak.pk])
+
+    def test_search_api_ranks_and_paginates(self):
+        FaultCase.objects.create(machine=self.lathe, title="Leak at the coolant pump")
+        FaultNote.objects.create(fault_case=self.noise, note="Small leak near the chuck")
+        self.assertEqual(self.client.get("/api/fault/search/", {"q": "leak"}).status_code, 403)
+
+        self.client.force_login(self.user)
+        response = self.client.get("/api/fault/search/", {"q": "leak", "page_size": 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(len(data["results"]), 2)
+        self.assertIsNotNone(data["next"])
+        # Title matches outrank note matches.
+        self.assertNotEqual(data["results"][0]["id"], self.noise.pk)
+        self.assertIn("<mark>", data["results"][0]["snippet"])
+        self.assertEqual(self.client.get("/api/fault/search/").status_code, 400)
+
+    def test_dashboard_search_page(self):
+        FaultNote.objects.create(fault_case=self.leak, note="<script>alert(1)</script> leak")
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("myapp:fault_search"), {"q": "leak"})
+        self.assertContains(response, "Hydraulic Press")
+        self.assertContains(response, "<mark>")
+        self.assertNotContains(response, "<script>alert")
+
+
+class MachinePriorityTests(TestCase):
+    """
+    The stored priority column follows the status and drives the board order.
+    """
+
+    def test_priority_follows_status(self):
+        machine = Machine.objects.create(name="Press", description="", status="Warning")
+        self.assertEqual(Machine.objects.get(pk=machine.pk).priority, 2)
+        machine.status = "Fault"
+        machine.save(update_fields=["status"])
+        self.assertEqual(Machine.objects.get(pk=machine.pk).priority, 1)
+        Machine.objects.filter(pk=machine.pk).set_status("OK")
+        self.assertEqual(Machine.objects.get(pk=machine.pk).priority, 3)
+
+    def test_board_order(self):
+        ok = Machine.objects.create(name="A", description="", status="OK")
+        fault = Machine.objects.create(name="B", description="", status="Fault")
+        warning = Machine.objects.create(name="C", description="", status="Warning")
+        older_fault = Machine.objects.create(name="D", description="", status="Fault")
+        Machine.objects.filter(pk=older_fault.pk).update(created_at=timezone.now() - timedelta(days=1))
+        self.assertEqual(
+            list(Machine.objects.by_priority().values_list("pk", flat=True)),
+            [older_fault.pk, fault.pk, warning.pk, ok.pk],
+        )
+
+
+class WarningDedupeTests(TestCase):
+    """
+    Active warnings are deduplicated by the database (case- and whitespace-insensitively).
+    """
+
+    def setUp(self):
+        self.user = create_user("tech", role="Technician")
+        self.machine = Machine.objects.create(name="Press", description="")
+        self.client.force_login(self.user)
+
+    def test_duplicate_warning_ignored(self):
+        url = reverse("myapp:create_warning")
+        self.client.post(url, {"machine": self.machine.pk, "warning_text": "Oil pressure low"})
+        self.client.post(url, {"machine": self.machine.pk, "warning_text": "  oil  PRESSURE low "})
+        self.assertEqual(Warning.objects.filter(machine=self.machine, active=True).count(), 1)
+        self.assertEqual(Machine.objects.get(pk=self.machine.pk).status, "Warning")
+
+    def test_inactive_duplicates_allowed(self):
+        Warning.objects.add_active(self.machine, "Belt slipping")
+        Warning.objects.filter(machine=self.machine).update(active=False)
+        self.assertTrue(Warning.objects.add_active(self.machine, "belt slipping"))
+        self.assertFalse(Warning.objects.add_active(self.machine, "Belt  slipping"))
+        self.assertEqual(Warning.objects.filter(machine=self.machine).count(), 2)
+
+    def test_second_warning_shows_on_cached_repair_board(self):
+        repair_person = create_user("repair", role="Repair")
+        url = reverse("myapp:create_warning")
+        self.client.post(url, {"machine": self.machine.pk, "warning_text": "Oil pressure low"})
+        self.client.force_login(repair_person)
+        self.assertContains(self.client.get(reverse("myapp:repair_dashboard")), "Oil pressure low")
+        self.client.force_login(self.user)
+        self.client.post(url, {"machine": self.machine.pk, "warning_text": "Coolant leak"})
+        self.client.force_login(repair_person)
+        self.assertContains(self.client.get(reverse("myapp:repair_dashboard")), "Coolant leak")
+
+
+class HotPathIndexTests(TestCase):
+    """
+    The dashboard lookups are served by the indexes added for them (checked with EXPLAIN).
+    """
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        if connection.vendor == "sqlite":
+            self.assertIn(f"USING INDEX {index_name}", plan)
+        else:
+            self.assertIn(index_name, plan)
+
+    def test_board_order(self):
+        self.assertUsesIndex(Machine.objects.by_priority(), "machine_priority_created_idx")
+
+    def test_fault_lists(self):
+        self.assertUsesIndex(FaultCase.objects.filter(status="open").order_by("-created_at"), "faultcase_status_created_idx")
+
+    def test_latest_note(self):
+        latest = FaultNote.objects.filter(fault_case_id=1).order_by("-created_at", "-pk")[:1]
+        self.assertUsesIndex(latest, "faultnote_case_created_idx")
+        if connection.vendor == "sqlite":
+            # The index also provides the order, so no sort is needed.
+            self.assertNotIn("TEMP B-TREE", latest.explain())
+
+    def test_active_warnings(self):
+        self.assertUsesIndex(Warning.objects.filter(active=True).order_by("-created_at"), "warning_active_created_idx")
+
+
+class BoardFragmentCacheTests(TestCase):
+    """
+    Dashboard fragments are cached until a write changes the board version they are keyed on.
+    """
+
+    def setUp(self):
+        self.technician = create_user("tech", "Technician")
+        self.repair_person = create_user("repair", "Repair")
+        self.line_a = Collection.objects.create(name="Line-A")
+        self.line_b = Collection.objects.create(name="Line-B")
+        create_fleet(2, self.technician, self.repair_person, self.line_a)
+        self.other = Machine.objects.create(name="Other", description="")
+        self.line_b.machines.add(self.other)
+        self.admin = create_user("boss", superuser=True)
+        self.client.force_login(self.admin)
+
+    def render(self, url_name="myapp:manager_dashboard", **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(url_name), params)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode(), len(context.captured_queries)
+
+    def test_cached_render_skips_queries(self):
+        for url_name in DashboardQueryCountTests.dashboards:
+            _, first = self.render(url_name)
+            _, second = self.render(url_name)
+            self.assertLess(second, first, url_name)
+
+    def test_writes_invalidate_fragments(self):
+        self.render()
+        machine = Machine.objects.get(name="Machine 0")
+        machine.name = "Renamed Press"
+        machine.save()
+        self.assertIn("Renamed Press", self.render()[0])
+
+        Machine.objects.filter(pk=machine.pk).set_status("OK")
+        FaultCase.objects.create(machine=machine, title="Belt snapped")
+        self.assertIn("Belt snapped", self.render()[0])
+
+        create_user("newtech", "Technician")
+        self.assertIn("newtech", self.render(collection_filter=self.line_a.pk)[0])
+
+    def test_collection_fragments_survive_writes_elsewhere(self):
+        scope_a, scope_b = collection_scope(self.line_a.pk), collection_scope(self.line_b.pk)
+        before = board_versions([GLOBAL_SCOPE, scope_a, scope_b])
+        Machine.objects.filter(pk=self.other.pk).set_status("Fault")
+        after = board_versions([GLOBAL_SCOPE, scope_a, scope_b])
+        self.assertEqual(after[scope_a], before[scope_a])
+        self.assertNotEqual(after[scope_b], before[scope_b])
+        self.assertNotEqual(after[GLOBAL_SCOPE], before[GLOBAL_SCOPE])
+
+        self.render(collection_filter=self.line_a.pk)
+        Machine.objects.filter(collections=self.line_a).set_status("Warning")
+        self.assertNotEqual(board_versions([scope_a])[scope_a], after[scope_a])
+        self.assertIn("Warning", self.render(collection_filter=self.line_a.pk)[0])
+
+    def test_unknown_collections_create_no_scopes(self):
+        self.render()
+        scopes = BoardVersion.objects.count()
+        for collection_filter in (987654, 987655, "abc"):
+            content = self.render(collection_filter=collection_filter)[0]
+            self.assertNotIn("Other", content)
+        self.assertEqual(BoardVersion.objects.count(), scopes)
+        self.assertIn("Other", self.render()[0])
+
+    def test_cached_forms_carry_the_current_users_csrf_token(self):
+        manager = create_user("manager", "Manager")
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(manager)
+        # Rendered (and cached) for the superuser, then served from the cache to the manager.
+        self.render()
+        with CaptureQueriesContext(connection) as cached:
+            content = client.get(reverse("myapp:manager_dashboard")).content.decode()
+        self.assertFalse(any("myapp_faultnote" in query["sql"] for query in cached.captured_queries))
+        self.assertNotIn("board-cache-csrf-token", content)
+        token = content.split('name="csrfmiddlewaretoken" value="')[-1].split('"')[0]
+        response = client.post(reverse("myapp:delete_machine", args=[self.other.pk]), {"csrfmiddlewaretoken": token})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Machine.objects.filter(pk=self.other.pk).exists())
+
+
+class RoleResolutionTests(TestCase):
+    """
+    The user's role is loaded with the user (one joined query) and checked by @role_required.
+    """
+
+    def setUp(self):
+        self.technician = create_user("tech", "Technician")
+        self.no_profile = create_user("nobody")
+
+    def test_role_loaded_with_the_user(self):
+        self.client.force_login(self.technician)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("myapp:technician_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        profile_queries = [query["sql"] for query in context.captured_queries if "myapp_userprofile" in query["sql"]]
+        self.assertEqual(len(profile_queries), 1)
+        self.assertIn("JOIN", profile_queries[0])
+
+    def test_role_required(self):
+        self.client.force_login(self.technician)
+        self.assertEqual(self.client.get(reverse("myapp:repair_dashboard")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("myapp:manager_dashboard")).status_code, 403)
+        self.client.logout()
+        response = self.client.get(reverse("myapp:manager_dashboard"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_users_without_profile(self):
+        self.client.force_login(self.no_profile)
+        self.assertEqual(self.client.get(reverse("myapp:technician_dashboard")).status_code, 403)
+        self.assertEqual(self.client.get(reverse("myapp:home")).status_code, 200)
+        self.client.logout()
+        response = self.client.post(reverse("myapp:employee_login"), {"username": "nobody", "password": "password"})
+        self.assertRedirects(response, reverse("myapp:home"))
+
+    def test_model_backend_sessions_upgraded(self):
+        self.client.force_login(self.technician, backend="django.contrib.auth.backends.ModelBackend")
+        response = self.client.get(reverse("myapp:technician_dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.session["_auth_user_backend"], "myapp.roles.ProfileModelBackend")
+
+
+class StaticAssetPipelineTests(TestCase):
+    """
+    collectstatic hashes, precompresses and resizes the static assets; the middleware serves them.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root, ignore_errors=True)
+        static_settings = override_settings(STATIC_ROOT=cls.static_root, STORAGES={
+            "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+            "staticfiles": {"BACKEND": "myapp.staticfiles.CompressedManifestStaticFilesStorage"},
+        })
+        static_settings.enable()
+        cls.addClassCleanup(static_settings.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+        cls.stylesheet = staticfiles_storage.stored_name("myapp/base.css")
+
+    def get(self, name, **headers):
+        return self.client.get("/static/" + name, headers=headers)
+
+    def test_collected_files_are_hashed_compressed_and_resized(self):
+        self.assertNotEqual(self.stylesheet, "myapp/base.css")
+        self.assertTrue(staticfiles_storage.exists(self.stylesheet + ".gz"))
+        self.assertEqual(
+            [width for width, _ in staticfiles_storage.responsive_variants("images/factory.jpg")], [160, 480, 960, 1200],
+        )
+        content = self.client.get(reverse("myapp:products")).content.decode()
+        self.assertIn(staticfiles_storage.url("images/cnc_mill-480w.webp") + " 480w", content)
+        self.assertEqual(content.count("srcset="), content.count('sizes="310px"'))
+
+    def test_serves_precompressed_copies_with_immutable_caching(self):
+        with staticfiles_storage.open(self.stylesheet) as stylesheet:
+            original = stylesheet.read()
+        response = self.get(self.stylesheet, accept_encoding="br;q=0, gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Content-Type"], "text/css")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), original)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+        plain = self.get(self.stylesheet, accept_encoding="gzip;q=0")
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(b"".join(plain.streaming_content), original)
+
+        not_modified = self.get(self.stylesheet, accept_encoding="gzip", if_none_match=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_unversioned_names_are_revalidated(self):
+        response = self.get("myapp/base.css")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("immutable", response["Cache-Control"])
+        self.assertEqual(self.get("myapp/missing.css").status_code, 404)
+
+    def test_production_settings_enable_the_pipeline(self):
+        settings_file = os.path.join(settings.BASE_DIR, "mysite", "settings.py")
+        with mock.patch.dict(os.environ, {"DJANGO_DEBUG": "0"}):
+            production = runpy.run_path(settings_file)
+        self.assertFalse(production["DEBUG"])
+        self.assertEqual(
+            production["STORAGES"]["staticfiles"]["BACKEND"], "myapp.staticfiles.CompressedManifestStaticFilesStorage",
+        )
+        with override_settings(STORAGES=production["STORAGES"]):
+            content = self.client.get(reverse("myapp:products")).content.decode()
+            self.assertIn("/static/" + self.stylesheet, content)
+            self.assertEqual(self.get(self.stylesheet).status_code, 200)
+
+
+@override_settings(SQLITE_WRITE_QUEUE=True)
+class WriteQueueTests(TransactionTestCase):
+    """
+    Writes submitted from many threads are executed (and batched) by the write queue's writer.
+    """
+
+    def setUp(self):
+        self.machines = [Machine.objects.create(name=f"Machine {i}", description="") for i in range(8)]
+        self.queue = WriteQueue(batch_size=50)
+        self.addCleanup(self.queue.stop, 10)
+
+    def test_concurrent_writes_are_serialized(self):
+        writer_threads = set()
+
+        def apply(machine_id, new_status):
+            writer_threads.add(threading.current_thread().name)
+            return apply_machine_statuses({machine_id: new_status})
+
+        def post(machine):
+            for new_status in ("Warning", "Fault", "OK", "Fault"):
+                self.queue.run(apply, machine.pk, new_status)
+
+        threads = [threading.Thread(target=post, args=(machine,)) for machine in self.machines]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(writer_threads, {"db-write-queue"})
+        self.assertEqual(set(Machine.objects.values_list("status", flat=True)), {"Fault"})
+        self.assertEqual(MachineStatusCount.objects.totals()["Fault"], len(self.machines))
+
+    def test_failing_write_does_not_undo_its_batch(self):
+        def fail():
+            raise ValueError("bad write")
+
+        futures = [
+            self.queue.submit(apply_machine_statuses, {self.machines[0].pk: "Fault"}),
+            self.queue.submit(fail),
+            self.queue.submit(apply_machine_statuses, {self.machines[1].pk: "Warning"}),
+        ]
+        self.assertEqual(futures[0].result(), {self.machines[0].pk: "updated"})
+        with self.assertRaises(ValueError):
+            futures[1].result()
+        self.assertEqual(Machine.objects.get(pk=self.machines[1].pk).status, "Warning")
+
+    def test_runs_inline_inside_a_transaction(self):
+        with transaction.atomic():
+            self.queue.run(apply_machine_statuses, {self.machines[0].pk: "Fault"})
+            self.assertEqual(Machine.objects.get(pk=self.machines[0].pk).status, "Fault")
+        self.assertIsNone(self.queue._thread)
+
+    async def test_async_writes_share_the_writer(self):
+        writer_threads = set()
+
+        def apply(machine_id, new_status):
+            writer_threads.add(threading.current_thread().name)
+            return apply_machine_statuses({machine_id: new_status})
+
+        results = await asyncio.gather(*(self.queue.arun(apply, machine.pk, "Fault") for machine in self.machines))
+        self.assertEqual(results, [{machine.pk: "updated"} for machine in self.machines])
+        self.assertEqual(writer_threads, {"db-write-queue"})
+        self.assertEqual(await Machine.objects.filter(status="Fault").acount(), len(self.machines))
+
+
+class AsyncMachineApiTests(TestCase):
+    """
+    The async machine status endpoints answer like their sync (DRF) counterparts.
+    """
+
+    def setUp(self):
+        self.press = Machine.objects.create(name="Press", description="", status="OK")
+
+    async def test_read(self):
+        url = reverse("myapp:async_machine_detail", args=[self.press.pk])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sync_response = await sync_to_async(self.client.get)(f"/api/machine/{self.press.pk}/")
+        self.assertEqual(response.json(), sync_response.json())
+        self.assertEqual(response["ETag"], sync_response["ETag"])
+        not_modified = await self.async_client.get(url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(not_modified.status_code, 304)
+        missing = await self.async_client.get(reverse("myapp:async_machine_detail", args=[self.press.pk + 1]))
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_serialized_off_the_event_loop(self):
+        threads = []
+        original = MachineStatusSerializer.get_image_variants
+
+        def get_image_variants(serializer, machine):
+            threads.append(threading.current_thread())
+            return original(serializer, machine)
+
+        with mock.patch.object(MachineStatusSerializer, "get_image_variants", get_image_variants):
+            response = await self.async_client.get(reverse("myapp:async_machine_detail", args=[self.press.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    async def test_update(self):
+        url = reverse("myapp:async_machine_status_update")
+
+        async def post(data):
+            return await self.async_client.post(url, data, content_type="application/json")
+
+        response = await post({"id": self.press.pk, "status": "Fault"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"success": "Machine 'Press' updated to Fault.", "result": "updated"})
+        self.assertEqual((await post({"id": self.press.pk, "status": "Fault"})).json()["result"], "unchanged")
+        self.assertEqual((await Machine.objects.aget(pk=self.press.pk)).status, "Fault")
+
+        self.assertEqual((await post({"id": self.press.pk + 1, "status": "OK"})).status_code, 404)
+        self.assertEqual((await post({"id": self.press.pk, "status": "Broken"})).status_code, 400)
+        self.assertEqual((await self.async_client.get(url)).status_code, 405)
+
+
+class SeedFleetTests(TestCase):
+    """
+    seed_fleet bulk-creates a consistent fleet; the benchmark harness measures every endpoint.
+    """
+
+    def test_seeded_fleet_is_consistent(self):
+        out = StringIO()
+        call_command("seed_fleet", machines=60, collections=3, technicians=4, repair=2, seed=1, stdout=out)
+        self.assertIn("60 machines", out.getvalue())
+        self.assertEqual(Machine.objects.count(), 60)
+        self.assertEqual(MachineStatusCount.objects.totals(), MachineStatusCount.objects.recount())
+        self.assertEqual(Machine.objects.filter(collections__isnull=False).count(), 60)
+        for machine in Machine.objects.all():
+            self.assertEqual(machine.priority, Machine.STATUS_PRIORITY[machine.status])
+        self.assertFalse(Warning.objects.filter(warning_text_normalized="").exists())
+        self.assertEqual(
+            FaultCase.objects.filter(status="open").count(), Machine.objects.filter(status="Fault").count(),
+        )
+        self.assertEqual(search_faults("spindle").count(), FaultCase.objects.filter(title__icontains="spindle").count())
+        with self.assertRaises(CommandError):
+            call_command("seed_fleet", machines=1, seed=1, stdout=StringIO())
+
+    def test_benchmark_harness(self):
+        seed_fleet(machines=10, collections=2, seed=2)
+        results = run_benchmarks(create_user("boss", superuser=True), repeat=2, only="dashboard")
+        self.assertIn("manager_dashboard/?collection_filter=" + str(Collection.objects.order_by("pk")[0].pk), results)
+        for label, result in results.items():
+            self.assertEqual(result["status"], 200, label)
+            self.assertGreater(result["queries"], 0, label)
+            self.assertLessEqual(result["p50_ms"], result["p95_ms"], label)
+
+    def test_write_endpoints_are_skipped_not_measured(self):
+        seed_fleet(machines=10, collections=2, seed=3)
+        results = run_benchmarks(create_user("boss", superuser=True), repeat=1)
+        self.assertEqual(results["api/fault/bulk"], {"skipped": "write endpoint (POST only)"})
+        self.assertEqual(results["mark_resolved/<int:fault_id>/"], {"skipped": "write endpoint (POST only)"})
+        measured = {label: result["status"] for label, result in results.items() if "skipped" not in result}
+        self.assertIn("api/machine/", measured)
+        self.assertEqual({label: code for label, code in measured.items() if code != 200}, {})
+
+
+class RequestMetricsTests(TestCase):
+    """
+    Request latency and SQL metrics are recorded per view and exported at /metrics.
+    """
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_metrics_recorded_per_view(self):
+        self.client.force_login(create_user("boss", superuser=True))
+        self.client.get(reverse("myapp:viewonly_dashboard"))
+        self.client.get(reverse("myapp:viewonly_dashboard"))
+        response = self.client.get(reverse("myapp:metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.content.decode()
+        self.assertIn('myapp_http_requests_total{method="GET",status="200",view="myapp:viewonly_dashboard"} 2', text)
+        self.assertIn('myapp_http_request_duration_seconds_count{view="myapp:viewonly_dashboard"} 2', text)
+        self.assertIn('myapp_http_request_duration_seconds_bucket{view="myapp:viewonly_dashboard",le="+Inf"} 2', text)
+        queries = next(line for line in text.splitlines()
+                       if line.startswith('myapp_db_queries_total{view="myapp:viewonly_dashboard"}'))
+        self.assertGreater(int(queries.split()[-1]), 2)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0.000001)
+    def test_slow_queries_logged(self):
+        with self.assertLogs("myapp.slow_queries", "WARNING") as logs:
+            self.client.get("/api/machine/")
+        self.assertIn("myapp.views.MachineView", logs.output[0])
+        self.assertGreater(metrics.snapshot()["db_slow_queries"], 0)
+
+    async def test_async_request_queries_recorded(self):
+        press = await Machine.objects.acreate(name="Press", description="", status="OK")
+        response = await self.async_client.get(reverse("myapp:async_machine_detail", args=[press.pk]))
+        self.assertEqual(response.status_code, 200)
+        counters = metrics.snapshot()
+        self.assertEqual(counters["http_requests"], 1)
+        self.assertGreater(counters.get("db_queries", 0), 0)
+        self.assertGreater(counters.get("db_query_duration_seconds", 0), 0)
+
+    def test_metrics_restricted(self):
+        url = reverse("myapp:metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="127.0.0.1").status_code, 403)
+        with override_settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer wrong"}).status_code, 403)
+            self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer s3cret"}).status_code, 200)
+
+    def test_unknown_methods_share_a_label(self):
+        self.client.generic("BREW", "/api/machine/")
+        self.client.generic("PROPFIND", "/api/machine/")
+        self.assertIn('method="other"', metrics.render_prometheus())
+        self.assertNotIn("BREW", metrics.render_prometheus())
+
+
+class RequestProfilingTests(TestCase):
+    """
+    Superusers can profile a request; the report is saved and can be browsed.
+    """
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir, ignore_errors=True)
+        profile_settings = override_settings(PROFILE_DIR=self.profile_dir, PROFILE_SAMPLE_RATE=0)
+        profile_settings.enable()
+        self.addCleanup(profile_settings.disable)
+        Machine.objects.create(name="Lathe", status="OK")
+
+    def test_superuser_profiles_request(self):
+        self.client.force_login(create_user("boss", superuser=True))
+        response = self.client.get(reverse("myapp:viewonly_dashboard") + "?_profile=1")
+        self.assertEqual(response.status_code, 200)
+        report_id = response["X-Profile-Id"]
+        self.assertEqual(sorted(os.listdir(self.profile_dir)),
+                         [f"{report_id}.json", f"{report_id}.prof", f"{report_id}.txt"])
+
+        summary, tree = profiling.load_report(report_id)
+        self.assertEqual(summary["view"], "myapp:viewonly_dashboard")
+        self.assertEqual(summary["user"], "boss")
+        self.assertEqual(set(summary["areas"]), {"orm", "templates", "serialization", "other"})
+        self.assertGreater(summary["areas"]["orm"], 0)
+        self.assertGreater(summary["areas"]["templates"], 0)
+        self.assertIn("cumulative", tree)
+
+        listing = self.client.get(reverse("myapp:profile_list"))
+        self.assertContains(listing, report_id)
+        detail = self.client.get(reverse("myapp:profile_detail", args=[report_id]))
+        self.assertContains(detail, "viewonly_dashboard")
+        self.assertEqual(self.client.get(reverse("myapp:profile_detail", args=["..settings"])).status_code, 404)
+
+    def test_profiling_restricted_to_superusers(self):
+        self.client.force_login(create_user("viewer", role="View-only"))
+        response = self.client.get(reverse("myapp:viewonly_dashboard"), HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+        self.assertEqual(self.client.get(reverse("myapp:profile_list")).status_code, 302)
+
+    def test_sampled_requests_profiled(self):
+        with override_settings(PROFILE_SAMPLE_RATE=1):
+            response = self.client.get("/api/machine/")
+        self.assertIn("X-Profile-Id", response)
+        self.assertEqual(len(profiling.list_reports()), 1)
+
+
+class BulkAssignmentTests(TestCase):
+    """
+    Managers reassign many machines at once with a fixed number of queries.
+    """
+
+    def setUp(self):
+        self.old_tech = create_user("old-tech", "Technician")
+        self.new_techs = [create_user("tech-1", "Technician"), create_user("tech-2", "Technician")]
+        self.repair_person = create_user("repair", "Repair")
+        self.line = Collection.objects.create(name="Line-A")
+        create_fleet(3, self.old_tech, self.repair_person, self.line)
+        self.machines = list(Machine.objects.all())
+        self.client.force_login(create_user("manager", "Manager"))
+
+    def assignees(self, machine, role):
+        return set(machine.assigned_to.filter(userprofile__role=role).values_list("username", flat=True))
+
+    def post(self, data):
+        return self.client.post("/api/machine/assign", data, content_type="application/json")
+
+    def test_reassign_by_ids_in_fixed_queries(self):
+        user_ids = [user.pk for user in self.new_techs]
+        with CaptureQueriesContext(connection) as small:
+            Machine.objects.filter(pk__in=[self.machines[0].pk]).reassign("Technician", user_ids)
+        with CaptureQueriesContext(connection) as large:
+            reassigned = Machine.objects.filter(pk__in=[m.pk for m in self.machines]).reassign("Technician", user_ids)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(sorted(reassigned), sorted(m.pk for m in self.machines))
+        for machine in self.machines:
+            self.assertEqual(self.assignees(machine, "Technician"), {"tech-1", "tech-2"})
+            self.assertEqual(self.assignees(machine, "Repair"), {"repair"})
+
+    def test_api_by_collection(self):
+        versions = board_versions([GLOBAL_SCOPE, collection_scope(self.line.pk)])
+        response = self.post({"role": "Technician", "user_ids": [self.new_techs[0].pk], "collection": self.line.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["machines"], 3)
+        self.assertEqual(self.assignees(self.machines[2], "Technician"), {"tech-1"})
+        self.assertNotEqual(board_versions(versions), versions)
+
+        response = self.post({"role": "Technician", "user_ids": [], "machine_ids": [self.machines[0].pk, 999999]})
+        self.assertEqual(response.json()["not_found"], [999999])
+        self.assertEqual(self.assignees(self.machines[0], "Technician"), set())
+
+    def test_api_rejects_wrong_role_and_non_managers(self):
+        response = self.post({"role": "Technician", "user_ids": [self.repair_person.pk], "collection": self.line.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.assignees(self.machines[0], "Technician"), {"old-tech"})
+        self.assertEqual(self.post({"role": "Technician", "user_ids": []}).status_code, 400)
+
+        self.client.force_login(self.old_tech)
+        response = self.post({"role": "Technician", "user_ids": [], "collection": self.line.pk})
+        self.assertEqual(response.status_code, 403)
+
+    def test_dashboard_form(self):
+        response = self.client.post(reverse("myapp:bulk_assign"), {
+            "role": "Repair", "user_ids": [], "machine_ids": [self.machines[0].pk, self.machines[1].pk],
+        })
+        self.assertRedirects(response, reverse("myapp:manager_dashboard"), fetch_redirect_response=False)
+        self.assertEqual(self.assignees(self.machines[0], "Repair"), set())
+        self.assertEqual(self.assignees(self.machines[2], "Repair"), {"repair"})
+        self.assertContains(self.client.get(reverse("myapp:manager_dashboard")), "Reassigned the Repair personnel of 2 machines.")
+
+
+class FaultBulkOperationTests(TestCase):
+    """
+    Fault cases are resolved, reopened and annotated in bulk; machine statuses follow in one pass.
+    """
+
+    def setUp(self):
+        self.technician = create_user("tech", "Technician")
+        self.repair_person = create_user("repair", "Repair")
+        self.line = Collection.objects.create(name="Line-A")
+        create_fleet(3, self.technician, self.repair_person, self.line)
+        self.machines = list(Machine.objects.order_by("pk"))
+        # Only the first machine keeps an active warning once its fault is resolved.
+        Warning.objects.exclude(machine=self.machines[0]).update(active=False)
+        self.client.force_login(self.repair_person)
+
+    def post(self, data):
+        return self.client.post("/api/fault/bulk", data, content_type="application/json")
+
+    def statuses(self):
+        return [machine.status for machine in Machine.objects.order_by("pk")]
+
+    def test_resolve_in_fixed_queries(self):
+        with CaptureQueriesContext(connection) as one:
+            FaultCase.objects.filter(machine=self.machines[1]).set_status("resolved", note="Line restarted")
+        FaultCase.objects.filter(machine=self.machines[1]).set_status("open")
+        with CaptureQueriesContext(connection) as two:
+            FaultCase.objects.filter(machine__in=self.machines[1:]).set_status("resolved", note="Line restarted")
+        self.assertEqual(len(one.captured_queries), len(two.captured_queries))
+        self.assertEqual(self.statuses(), ["Fault", "OK", "OK"])
+
+    def test_resolve_by_collection(self):
+        response = self.post({"action": "resolve", "note": "Line restarted", "collection": self.line.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["fault_ids"]), 3)
+        self.assertEqual(self.statuses(), ["Warning", "OK", "OK"])
+        self.assertFalse(FaultCase.objects.filter(status="open").exists())
+        self.assertEqual(FaultNote.objects.filter(note="Line restarted").count(), 3)
+        self.assertEqual(len(search_faults("restarted")), 3)
+
+    def test_reopen_and_annotate(self):
+        self.post({"action": "resolve", "collection": self.line.pk})
+        response = self.post({"action": "reopen", "machine": self.machines[1].pk})
+        self.assertEqual(response.json()["machines"], {str(self.machines[1].pk): "Fault"})
+        self.assertEqual(self.statuses(), ["Warning", "Fault", "OK"])
+
+        fault_ids = list(FaultCase.objects.values_list("pk", flat=True))
+        response = self.post({"action": "note", "note": "Parts ordered", "fault_ids": fault_ids})
+        self.assertEqual(sorted(response.json()["fault_ids"]), sorted(fault_ids))
+        self.assertEqual(FaultNote.objects.filter(note="Parts ordered", created_by=self.repair_person).count(), 3)
+        self.assertEqual(self.post({"action": "note", "fault_ids": fault_ids}).status_code, 400)
+        self.assertEqual(self.post({"action": "resolve", "machine": 1, "collection": 1}).status_code, 400)
+
+    def test_restricted_to_staff_roles(self):
+        self.client.force_login(create_user("viewer", "View-only"))
+        self.assertEqual(self.post({"action": "resolve", "collection": self.line.pk}).status_code, 403)
+        self.assertEqual(self.statuses(), ["Fault", "Fault", "Fault"])
+
+    def test_mark_resolved_keeps_fault_with_other_open_cases(self):
+        machine = self.machines[1]
+        other = FaultCase.objects.create(machine=machine, reported_by=self.technician, title="Second fault")
+        first = FaultCase.objects.filter(machine=machine).exclude(pk=other.pk).get()
+        self.client.post(reverse("myapp:mark_resolved", args=[first.pk]))
+        self.assertEqual(Machine.objects.get(pk=machine.pk).status, "Fault")
+        self.client.post(reverse("myapp:mark_resolved", args=[other.pk]))
+        self.assertEqual(Machine.objects.get(pk=machine.pk).status, "OK")
+
+    def test_sensor_reported_statuses_are_kept(self):
+        Machine.objects.filter(pk=self.machines[1].pk).set_status("Warning")
+        sensor_fault = Machine.objects.create(name="Press", status="Fault")
+        self.post({"action": "resolve", "collection": self.line.pk})
+        self.assertEqual(self.statuses()[:3], ["Warning", "Warning", "OK"])
+        self.assertEqual(Machine.objects.filter(pk=sensor_fault.pk).recompute_status(), [])
+
+        self.post({"action": "reopen", "machine": self.machines[1].pk})
+        self.post({"action": "resolve", "machine": self.machines[1].pk})
+        self.assertEqual(self.statuses()[1], "OK")
+
+    def test_status_is_derived_inside_the_transaction(self):
+        depths = []
+
+        def record_depth(execute, sql, params, many, context):
+            if "has_open_fault" in sql:
+                depths.append(len(connection.atomic_blocks))
+            return execute(sql, params, many, context)
+
+        FaultCase.objects.filter(machine=self.machines[1]).update(status="resolved")
+        outer_depth = len(connection.atomic_blocks)
+        with connection.execute_wrapper(record_depth):
+            Machine.objects.filter(pk=self.machines[1].pk).recompute_status()
+        self.assertEqual(len(depths), 1)
+        self.assertGreater(depths[0], outer_depth)
+        self.assertEqual(self.statuses()[1], "OK")
+
+
+class CollectionStatusCountTests(TestCase):
+    """
+    The per-collection counters follow status changes, fault cases and memberships, and back the
+    collections overview and the collection filter.
+    """
+
+    def setUp(self):
+        self.technician = create_user("tech", "Technician")
+        self.repair_person = create_user("repair", "Repair")
+        self.line = Collection.objects.create(name="Line-A")
+        self.area = Collection.objects.create(name="Area-B")
+        create_fleet(3, self.technician, self.repair_person, self.line)
+        self.machines = list(Machine.objects.order_by("pk"))
+        self.client.force_login(create_user("boss", "Manager"))
+
+    def counts(self, collection):
+        counts = CollectionStatusCount.objects.stored().get(collection.pk, {})
+        return tuple(counts.get(field, 0) for field in ("ok", "warning", "fault", "open_faults"))
+
+    def assert_consistent(self):
+        stored = CollectionStatusCount.objects.stored()
+        for pk, counts in CollectionStatusCount.objects.recount().items():
+            self.assertEqual(stored.get(pk, dict.fromkeys(counts, 0)), counts)
+
+    def test_counts_follow_writes(self):
+        self.assertEqual(self.counts(self.line), (0, 0, 3, 3))
+        self.client.post("/api/machine/faultUpdate", {"id": self.machines[0].pk, "status": "OK"})
+        FaultCase.objects.filter(machine=self.machines[1]).set_status("resolved")
+        self.assertEqual(self.counts(self.line), (1, 1, 1, 2))
+
+        self.area.machines.add(*self.machines[1:])
+        self.machines[2].collections.remove(self.line)
+        self.assertEqual(self.counts(self.line), (1, 1, 0, 1))
+        self.assertEqual(self.counts(self.area), (0, 1, 1, 1))
+
+        FaultCase.objects.create(machine=self.machines[1], reported_by=self.technician, title="Again")
+        self.machines[2].delete()
+        self.assertEqual(self.counts(self.area), (0, 1, 0, 1))
+        self.line.machines.clear()
+        self.assertEqual(self.counts(self.line), (0, 0, 0, 0))
+        self.assert_consistent()
+        call_command("rebuild_status_counts", "--check", stdout=StringIO())
+
+    def test_rebuild_command_repairs_drift(self):
+        CollectionStatusCount.objects.filter(collection=self.line).update(open_faults=9)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_status_counts", "--check", stdout=StringIO())
+        call_command("rebuild_status_counts", stdout=StringIO())
+        self.assertEqual(self.counts(self.line), (0, 0, 3, 3))
+
+    def test_overview_page_and_api(self):
+        self.area.machines.add(self.machines[0])
+        FaultCase.objects.filter(machine=self.machines[0]).set_status("resolved")
+        with self.assertNumQueries(1):
+            self.assertEqual(len(Collection.objects.with_status_counts().by_trouble()), 2)
+        response = self.client.get("/api/collection/overview/")
+        self.assertEqual(response.json(), [
+            {"id": self.line.pk, "name": "Line-A", "machines": 3,
+             "statuses": {"OK": 0, "Warning": 1, "Fault": 2}, "open_faults": 2},
+            {"id": self.area.pk, "name": "Area-B", "machines": 1,
+             "statuses": {"OK": 0, "Warning": 1, "Fault": 0}, "open_faults": 0},
+        ])
+        response = self.client.get(reverse("myapp:collection_overview"))
+        self.assertEqual([collection.name for collection in response.context["collections"]], ["Line-A", "Area-B"])
+
+    def test_collection_filter_uses_counters(self):
+        self.area.machines.add(self.machines[0])
+        url = reverse("myapp:manager_dashboard")
+        response = self.client.get(url, {"collection_filter": self.area.pk})
+        self.assertEqual([machine.pk for machine in response.context["machines"]], [self.machines[0].pk])
+        self.assertNotIn("DISTINCT", str(response.context["machines"].query))
+        self.assertEqual(response.context["selected_collection"].fault, 1)
+
+        empty = Collection.objects.create(name="Empty")
+        response = self.client.get(url, {"collection_filter": empty.pk})
+        self.assertEqual(list(response.context["machines"]), [])
+
+        # Memberships written around the signals leave the counters behind, not the machine list.
+        Collection.machines.through.objects.bulk_create([
+            Collection.machines.through(collection_id=empty.pk, machine_id=self.machines[1].pk),
+        ])
+        response = self.client.get(url, {"collection_filter": empty.pk})
+        self.assertEqual(response.context["selected_collection"].machine_count, 0)
+        self.assertEqual([machine.pk for machine in response.context["machines"]], [self.machines[1].pk])
+        response = self.client.get(reverse("myapp:export_report"), {"collection_filter": self.line.pk})
+        self.assertEqual(len(b"".join(response.streaming_content).decode().splitlines()), 4)
@@ -7,7 +7,10 @@ It maps URL patterns to view functions, enabling navigation between the applicat
 
 from django.urls import path
 from . import views
-from .views import MachineView
+from .views import (
+    MachineView, MachineBatchView, MachineChangesView, MachineStatusReportView, CollectionStatusReportView,
+    FaultSearchView, MachineWriteStatsView, MachineAssignmentView, FaultBulkView, CollectionOverviewView,
+)
 
 
 app_name = "myapp"
@@ -24,6 +27,8 @@ urlpatterns = [
     path("technician_dashboard/", views.technician_dashboard, name="technician_dashboard"),
     path("repair_dashboard/", views.repair_dashboard, name="repair_dashboard"),
     path("viewonly_dashboard/", views.viewonly_dashboard, name="viewonly_dashboard"),
+    # Collections Overview route: machine and open fault counts of every collection, worst first.
+    path("collections/", views.collection_overview, name="collection_overview"),
     path("add_machine/", views.add_machine, name="add_machine"),
     # Delete Machine route: Processes deletion of a machine, expects a machine ID as parameter.
     path("delete_machine/<int:machine_id>/", views.delete_machine, name="delete_machine"),
@@ -31,6 +36,8 @@ urlpatterns = [
     path("assign_technician/<int:machine_id>/", views.assign_technician, name="assign_technician"),
     # Assign Repair route: For managers to assign repair personnel to a machine.
     path("assign_repair/<int:machine_id>/", views.assign_repair, name="assign_repair"),
+    # Bulk Assign route: For managers to reassign many machines (ticked or a collection) at once.
+    path("bulk_assign/", views.bulk_assign, name="bulk_assign"),
     path("create_fault/", views.create_fault, name="create_fault"),
     # Add Fault Note route: Enables users to add notes to a specific fault case, identified by its ID.
     path("add_fault_note/<int:fault_id>/", views.add_fault_note, name="add_fault_note"),
@@ -40,15 +47,55 @@ urlpatterns = [
     # Mark Resolved route: Marks a fault case as resolved by its ID.
     path("mark_resolved/<int:fault_id>/", views.mark_resolved, name="mark_resolved"),
     path("export_report/", views.export_report, name="export_report"),
+    # Fault Search route: Full-text search over fault cases and notes (dashboard search box).
+    path("fault_search/", views.fault_search, name="fault_search"),
     # Delete User route: Enables a manager to delete a user account; identified by user ID.
     path("delete_user/<int:user_id>/", views.delete_user, name="delete_user"),
 
+    # Prometheus metrics of the requests, SQL queries and status writes
+    path("metrics", views.prometheus_metrics, name="metrics"),
+    # Saved request profiles (superusers only)
+    path("profiles/", views.profile_list, name="profile_list"),
+    path("profiles/<str:report_id>/", views.profile_detail, name="profile_detail"),
+
+    # Live status push (Server-Sent Events) for the dashboards
+    path("machine_events/", views.machine_events, name="machine_events"),
+
     # API
 
     # HTTP POST API
     path('api/machine/faultUpdate', MachineView.as_view()),
+
+    # HTTP POST API for batches of status updates
+    path('api/machine/batchUpdate', MachineBatchView.as_view()),
     
+    # Bulk reassignment of technicians or repair personnel (managers)
+    path('api/machine/assign', MachineAssignmentView.as_view()),
+
+    # Counters of applied and elided status writes
+    path('api/machine/writeStats', MachineWriteStatsView.as_view()),
+
     # REST API for machine status
     path('api/machine/', MachineView.as_view()),
     path('api/machine/<int:pk>/', MachineView.as_view()),
+
+    # Async variants of the status read and update endpoints for sensor clients (under ASGI)
+    path('api/async/machine/<int:pk>/', views.async_machine_detail, name="async_machine_detail"),
+    path('api/async/machine/faultUpdate', views.async_machine_status_update, name="async_machine_status_update"),
+
+    # Delta-sync API: machines changed since a cursor
+    path('api/machine/changes/', MachineChangesView.as_view()),
+
+    # Availability and downtime reports from the status rollups
+    path('api/machine/<int:pk>/availability/', MachineStatusReportView.as_view()),
+    path('api/collection/<int:pk>/availability/', CollectionStatusReportView.as_view()),
+
+    # Machine counts per status and open faults of every collection
+    path('api/collection/overview/', CollectionOverviewView.as_view()),
+
+    # Bulk fault case operations: resolve, reopen or annotate many cases at once
+    path('api/fault/bulk', FaultBulkView.as_view()),
+
+    # Full-text search over the fault history
+    path('api/fault/search/', FaultSearchView.as_view()),
 ]
@@ -1,4 +1,60 @@
+"""
+utils.py
+
+Small helpers shared by the views that are not tied to a single model.
+"""
+
+import csv
 import datetime
+import io
 
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.utils import timezone
 
+
+def csv_chunks(rows, rows_per_chunk=500):
+    """
+    Encodes an iterable of rows as CSV text, yielding one string per `rows_per_chunk` rows.
+    Only one chunk is held in memory at a time, so the rows can come from a lazy iterator
+    over a table of any size.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue()
+
+
+async def aiterate(iterator):
+    """
+    Wraps a synchronous iterator (e.g. one reading from the database) in an async iterator that
+    fetches each item in Django's thread-sensitive executor, so that a StreamingHttpResponse
+    served under ASGI streams it instead of buffering the whole iterator in memory.
+    """
+    iterator = iter(iterator)
+    sentinel = object()
+    fetch = sync_to_async(next, thread_sensitive=True)
+    while True:
+        item = await fetch(iterator, sentinel)
+        if item is sentinel:
+            return
+        yield item
+
+
+def streaming_content(request, iterator):
+    """
+    Returns `iterator` in the form a StreamingHttpResponse can stream without buffering
+    for the server handling `request` (synchronous under WSGI, asynchronous under ASGI).
+    """
+    if isinstance(request, ASGIRequest):
+        return aiterate(iterator)
+    return iterator
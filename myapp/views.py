@@ -8,23 +8,60 @@ dashboard rendering (Manager, Technician, Repair, View-only), and functionality
 managing machines, fault cases, warnings, and user assignments.
 """
 
-from django.http import HttpResponse, HttpResponseForbidden
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.core.paginator import Paginator
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
-from django.db.models import Q, Case, When, Value, IntegerField
-import csv
+from django.contrib import messages
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Max
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from collections import Counter, defaultdict
+from datetime import datetime, time as dt_time, timedelta
+import asyncio
+import hashlib
+import hmac
+import json
+import time
 
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 
-from .serializers import MachineWarningSerializer, MachineStatusSerializer
+from .serializers import (
+    MachineWarningSerializer, MachineWarningListSerializer, MachineStatusSerializer, FaultSearchResultSerializer,
+    MachineAssignmentSerializer, FaultBulkSerializer, CollectionOverviewSerializer,
+)
 
-from .models import UserProfile, Machine, FaultCase, FaultNote, Warning, Collection
-from .forms import LoginForm, ManagerUserRegistrationForm
+from . import metrics, profiling
+from .models import (
+    UserProfile, Machine, MachineStatusCount, MachineChange, FaultCase, FaultNote, Warning, Collection,
+)
+from .forms import LoginForm, ManagerUserRegistrationForm, BulkAssignmentForm
+from .pagination import MachineCursorPagination, FaultSearchPagination, encode_change_cursor, decode_change_cursor
+from .roles import role_permission, role_required, user_role
+from .rollups import PERIODS, status_report
+from .search import search_faults
+from .utils import csv_chunks, streaming_content
+from .write_queue import write_queue
+
+# Number of machines loaded (and prefetched) per database round trip by the CSV export.
+EXPORT_CHUNK_SIZE = 2000
 
 #####################
 # Public Page Views #
@@ -90,10 +127,7 @@ def employee_login(request):
             if user is not None:
                 login(request, user)
                 # Redirect user based on their role using the extended UserProfile model.
-                try:
-                    role = user.userprofile.role
-                except Exception:
-                    role = None
+                role = user_role(user)
                 if role == "Manager":
                     return redirect("myapp:manager_dashboard")
                 elif role == "Technician":
@@ -124,7 +158,7 @@ def employee_logout(request):
 #######################################
 # Dashboard and Data Management Views #
 #######################################
-@login_required
+@role_required("Manager", message="You are not authorized to view the Manager Dashboard.")
 def manager_dashboard(request):
     """
     Renders the Manager Dashboard.
@@ -132,14 +166,10 @@ def manager_dashboard(request):
     It provides functionalities such as:
       - Creating new users via the ManagerUserRegistrationForm.
       - Viewing summary statistics for machine statuses.
-      - Filtering machines by collections.
+      - Filtering machines by collections (with the selected collection's status counts).
       - Ordering machines based on priority (Fault > Warning > OK).
       - Managing assignments (Technicians and Repair personnel).
     """
-    # Allow superusers to bypass role restrictions.
-    if not request.user.is_superuser and request.user.userprofile.role != "Manager":
-        return HttpResponseForbidden("You are not authorized to view the Manager Dashboard.")
-    
     if request.method == "POST":
         form = ManagerUserRegistrationForm(request.POST)
         if form.is_valid():
@@ -155,32 +185,34 @@ def manager_dashboard(request):
     else:
         form = ManagerUserRegistrationForm()
 
-    # Retrieve dynamic machine statistics and recent fault cases.
-    active_machines = Machine.objects.filter(status="OK").count()
-    warning_machines = Machine.objects.filter(status="Warning").count()
-    faulty_machines = Machine.objects.filter(status="Fault").count()
-    recent_fault_cases = FaultCase.objects.order_by("-created_at")[:5]
+    # Retrieve dynamic machine statistics (from the precomputed counters) and recent fault cases.
+    status_totals = MachineStatusCount.objects.totals()
+    active_machines = status_totals["OK"]
+    warning_machines = status_totals["Warning"]
+    faulty_machines = status_totals["Fault"]
+    recent_fault_cases = FaultCase.objects.with_details().order_by("-created_at")[:5]
     collections = Collection.objects.all()
 
     collection_filter = request.GET.get("collection_filter")
+    selected_collection = None
     if collection_filter:
-        machines = Machine.objects.filter(collections__pk=collection_filter).distinct()
+        # The counters of the collection only feed its summary line; the machines are read
+        # through a membership subquery (no join and DISTINCT), whatever the counters say.
+        if collection_filter.isdigit():
+            selected_collection = Collection.objects.with_status_counts().filter(pk=collection_filter).first()
+        if selected_collection is not None:
+            machines = Machine.objects.in_collection(selected_collection.pk)
+        else:
+            machines = Machine.objects.none()
     else:
         machines = Machine.objects.all()
 
-    machines = machines.annotate(
-        priority=Case(
-            When(status="Fault", then=Value(1)),
-            When(status="Warning", then=Value(2)),
-            When(status="OK", then=Value(3)),
-            default=Value(4),
-            output_field=IntegerField(),
-        )
-    ).order_by("priority", "created_at")
+    machines = machines.by_priority().with_board_data()
 
     technicians = User.objects.filter(userprofile__role="Technician")
     repair_personnel = User.objects.filter(userprofile__role="Repair")
-    users = User.objects.filter(is_superuser=False).exclude(pk=request.user.pk).order_by("username")
+    users = User.objects.filter(is_superuser=False).exclude(pk=request.user.pk) \
+        .select_related("userprofile").order_by("username")
 
     context = {
         'form': form,
@@ -189,6 +221,7 @@ def manager_dashboard(request):
         'faulty_machines': faulty_machines,
         'recent_fault_cases': recent_fault_cases,
         'collections': collections,
+        'selected_collection': selected_collection,
         'machines': machines,
         'technicians': technicians,
         'repair_personnel': repair_personnel,
@@ -197,7 +230,7 @@ def manager_dashboard(request):
     return render(request, "myapp/manager_dashboard.html", context)
 
 
-@login_required
+@role_required("Manager", "Technician", message="You are not authorized to view the Technician Dashboard.")
 def technician_dashboard(request):
     """
     Renders the Technician Dashboard.
@@ -208,27 +241,17 @@ def technician_dashboard(request):
       - Shows all machines for broader context.
       - Lists open fault cases relevant to the technician.
     """
-    if not request.user.is_superuser and request.user.userprofile.role not in ["Manager", "Technician"]:
-        return HttpResponseForbidden("You are not authorized to view the Technician Dashboard.")
-
-    priority_annotation = Case(
-        When(status="Fault", then=Value(1)),
-        When(status="Warning", then=Value(2)),
-        When(status="OK", then=Value(3)),
-        default=Value(4),
-        output_field=IntegerField(),
-    )
     assigned_machines = request.user.assigned_machines.all() \
-        .annotate(priority=priority_annotation) \
-        .order_by("priority", "created_at")
+        .by_priority() \
+        .with_board_data()
     all_machines = Machine.objects.all() \
-        .annotate(priority=priority_annotation) \
-        .order_by("priority", "created_at")
+        .by_priority() \
+        .with_board_data()
 
     open_fault_cases = FaultCase.objects.filter(
-        Q(machine__in=assigned_machines) | Q(reported_by=request.user),
+        Q(machine__in=request.user.assigned_machines.values("pk")) | Q(reported_by=request.user),
         status="open"
-    )
+    ).with_details()
     
     context = {
         'assigned_machines': assigned_machines,
@@ -238,7 +261,7 @@ def technician_dashboard(request):
     return render(request, "myapp/technician_dashboard.html", context)
 
 
-@login_required
+@role_required("Manager", "Technician", "Repair", message="You are not authorized to view the Repair Dashboard.")
 def repair_dashboard(request):
     """
     Renders the Repair Dashboard.
@@ -250,25 +273,15 @@ def repair_dashboard(request):
       - A list of repair cases that are open.
       - Active warnings on machines.
     """
-    if not request.user.is_superuser and request.user.userprofile.role not in ["Manager", "Technician", "Repair"]:
-        return HttpResponseForbidden("You are not authorized to view the Repair Dashboard.")
-    
-    priority_annotation = Case(
-        When(status="Fault", then=Value(1)),
-        When(status="Warning", then=Value(2)),
-        When(status="OK", then=Value(3)),
-        default=Value(4),
-        output_field=IntegerField(),
-    )
     assigned_machines = request.user.assigned_machines.all() \
-        .annotate(priority=priority_annotation) \
-        .order_by("priority", "created_at")
+        .by_priority() \
+        .with_board_data()
     all_machines = Machine.objects.all() \
-        .annotate(priority=priority_annotation) \
-        .order_by("priority", "created_at")
+        .by_priority() \
+        .with_board_data()
         
-    repair_cases = FaultCase.objects.filter(status__in=["open"])
-    warnings = Warning.objects.filter(active=True)
+    repair_cases = FaultCase.objects.filter(status__in=["open"]).with_details()
+    warnings = Warning.objects.filter(active=True).order_by("-created_at").select_related("machine")
     
     context = {
         'assigned_machines': assigned_machines,
@@ -284,22 +297,18 @@ def viewonly_dashboard(request):
     """
     Renders the View-Only Dashboard.
     This view provides basic machine status information and summary statistics.
-    It orders machines by priority and calculates counts for OK, Warning, and Fault statuses.
-    """
-    priority_annotation = Case(
-        When(status="Fault", then=Value(1)),
-        When(status="Warning", then=Value(2)),
-        When(status="OK", then=Value(3)),
-        default=Value(4),
-        output_field=IntegerField(),
-    )
+    It orders machines by priority and reads the counts for OK, Warning, and Fault statuses
+    from the precomputed status counters.
+    """
     machines = Machine.objects.all() \
-        .annotate(priority=priority_annotation) \
-        .order_by("priority", "created_at")
+        .by_priority() \
+        .with_board_data() \
+        .with_fault_history()
     
-    ok_count = machines.filter(status="OK").count()
-    warning_count = machines.filter(status="Warning").count()
-    fault_count = machines.filter(status="Fault").count()
+    status_totals = MachineStatusCount.objects.totals()
+    ok_count = status_totals["OK"]
+    warning_count = status_totals["Warning"]
+    fault_count = status_totals["Fault"]
     
     context = {
         'machines': machines,
@@ -310,6 +319,22 @@ def viewonly_dashboard(request):
     return render(request, "myapp/viewonly_dashboard.html", context)
 
 
+@login_required
+def collection_overview(request):
+    """
+    Renders the Collections Overview: every collection (production line, area...) with its
+    number of OK, Warning and Fault machines and of open fault cases, worst first, so the lines
+    in trouble stand out at a glance. Read from the precomputed per-collection counters, in one
+    query however many machines the collections hold.
+    """
+    collections = Collection.objects.with_status_counts().by_trouble()
+    context = {
+        'collections': collections,
+        'status_totals': MachineStatusCount.objects.totals(),
+    }
+    return render(request, "myapp/collection_overview.html", context)
+
+
 ##########################################
 # Machine Management and Reporting Views #
 ##########################################
@@ -384,8 +409,8 @@ def assign_technician(request, machine_id):
         for tech in current_technicians:
             machine.assigned_to.remove(tech)
         try:
-            technician = User.objects.get(pk=technician_id)
-            if technician.userprofile.role == "Technician":
+            technician = User.objects.select_related("userprofile").get(pk=technician_id)
+            if user_role(technician) == "Technician":
                 machine.assigned_to.add(technician)
         except User.DoesNotExist:
             pass
@@ -407,14 +432,43 @@ def assign_repair(request, machine_id):
         for rep in current_repair:
             machine.assigned_to.remove(rep)
         try:
-            repair_person = User.objects.get(pk=repair_id)
-            if repair_person.userprofile.role == "Repair":
+            repair_person = User.objects.select_related("userprofile").get(pk=repair_id)
+            if user_role(repair_person) == "Repair":
                 machine.assigned_to.add(repair_person)
         except User.DoesNotExist:
             pass
     return redirect("myapp:manager_dashboard")
 
 
+@role_required("Manager", message="Only managers can reassign machines.")
+def bulk_assign(request):
+    """
+    Reassigns many machines at once from the manager dashboard: makes the selected technicians
+    (or repair personnel) the only ones of their role assigned to the machines ticked in the
+    assignment table, or to every machine of a collection, with set-based writes (see
+    MachineQuerySet.reassign()).
+    """
+    if request.method == "POST":
+        form = BulkAssignmentForm(request.POST)
+        if form.is_valid():
+            data = form.cleaned_data
+            if data["collection"] is not None:
+                machines = Machine.objects.in_collection(data["collection"])
+            else:
+                machines = Machine.objects.filter(pk__in=data["machine_ids"])
+            try:
+                reassigned = machines.reassign(data["role"], data["user_ids"])
+            except ValidationError as exc:
+                messages.error(request, " ".join(exc.messages))
+            else:
+                messages.success(request, f"Reassigned the {data['role']} personnel of {len(reassigned)} machines.")
+        else:
+            messages.error(request, " ".join(error for errors in form.errors.values() for error in errors))
+    collection_filter = request.POST.get("collection_filter")
+    url = reverse("myapp:manager_dashboard")
+    return redirect(f"{url}?collection_filter={collection_filter}" if collection_filter else url)
+
+
 @login_required
 def create_fault(request):
     """
@@ -425,14 +479,15 @@ def create_fault(request):
         machine_id = request.POST.get("machine")
         fault_title = request.POST.get("title", "")
         machine = get_object_or_404(Machine, pk=machine_id)
-        fault = FaultCase.objects.create(
-            machine=machine,
-            reported_by=request.user,
-            status="open",
-            title=fault_title,
-        )
-        machine.status = "Fault"
-        machine.save()
+        with transaction.atomic():
+            fault = FaultCase.objects.create(
+                machine=machine,
+                reported_by=request.user,
+                status="open",
+                title=fault_title,
+            )
+            # Conditional update: nothing is written if the machine is already in Fault.
+            Machine.objects.filter(pk=machine.pk).set_status("Fault")
         return redirect("myapp:technician_dashboard")
     return redirect("myapp:technician_dashboard")
 
@@ -463,26 +518,17 @@ def add_fault_note(request, fault_id):
 def create_warning(request):
     """
     Allows a technician to create a warning for a machine.
-    Prevents duplicate active warnings (case-insensitive) from being created.
+    Duplicate active warnings (case- and whitespace-insensitive) are skipped by the database's
+    unique constraint (insert-or-ignore), so concurrent submissions cannot create duplicates.
     Updates the machine's status to 'Warning'.
     """
     if request.method == "POST":
         machine_id = request.POST.get("machine")
         warning_text = request.POST.get("warning_text", "").strip()
         machine = get_object_or_404(Machine, pk=machine_id)
-        if not Warning.objects.filter(
-                machine=machine,
-                warning_text__iexact=warning_text,
-                active=True
-            ).exists():
-            Warning.objects.create(
-                machine=machine,
-                warning_text=warning_text,
-                created_by=request.user,
-                active=True
-            )
-        machine.status = "Warning"
-        machine.save()
+        with transaction.atomic():
+            Warning.objects.add_active(machine, warning_text, created_by=request.user)
+            Machine.objects.filter(pk=machine.pk).set_status("Warning")
         return redirect("myapp:technician_dashboard")
     return redirect("myapp:technician_dashboard")
 
@@ -495,11 +541,11 @@ def delete_warning(request, warning_id):
     """
     if request.method == "POST":
         warning = get_object_or_404(Warning, pk=warning_id)
-        machine = warning.machine
-        warning.delete()
-        if not Warning.objects.filter(machine=machine, active=True).exists():
-            machine.status = "OK"
-            machine.save()
+        machine_id = warning.machine_id
+        with transaction.atomic():
+            warning.delete()
+            if not Warning.objects.filter(machine_id=machine_id, active=True).exists():
+                Machine.objects.filter(pk=machine_id).set_status("OK")
         return redirect("myapp:repair_dashboard")
     return redirect("myapp:repair_dashboard")
 
@@ -507,16 +553,13 @@ def delete_warning(request, warning_id):
 @login_required
 def mark_resolved(request, fault_id):
     """
-    Marks a fault case as resolved and updates the machine status to 'OK'.
+    Marks a fault case as resolved and updates the machine status: back to 'OK', unless the
+    machine still has other open fault cases (Fault) or active warnings (Warning).
     This view is typically used by repair personnel once maintenance has been completed.
     """
     if request.method == "POST":
-        fault = get_object_or_404(FaultCase, pk=fault_id)
-        machine = fault.machine
-        fault.status = "resolved"
-        fault.save()
-        machine.status = "OK"
-        machine.save()
+        get_object_or_404(FaultCase.objects.only("pk"), pk=fault_id)
+        FaultCase.objects.filter(pk=fault_id).set_status("resolved")
         return redirect("myapp:repair_dashboard")
     return redirect("myapp:repair_dashboard")
 
@@ -527,6 +570,9 @@ def export_report(request):
     Exports a CSV report of machines based on either a specific machine or collection filter.
     The CSV includes details such as machine name, status, description, associated collections,
     and assigned personnel.
+    The report is streamed: machines are read in chunks of EXPORT_CHUNK_SIZE, with the
+    collections and assignees of each chunk prefetched in one query each, so memory use stays
+    flat and the number of queries grows with the number of chunks rather than machines.
     """
     collection_filter = request.GET.get("collection_filter")
     machine_id = request.GET.get("machine_id")
@@ -534,43 +580,52 @@ def export_report(request):
     if machine_id:
         qs = Machine.objects.filter(pk=machine_id)
     elif collection_filter:
-        qs = Machine.objects.filter(collections__pk=collection_filter).distinct()
+        qs = Machine.objects.in_collection(collection_filter)
     else:
         qs = Machine.objects.all()
     
-    qs = qs.annotate(
-        priority=Case(
-            When(status="Fault", then=Value(1)),
-            When(status="Warning", then=Value(2)),
-            When(status="OK", then=Value(3)),
-            default=Value(4),
-            output_field=IntegerField(),
-        )
-    ).order_by("priority", "created_at")
-
-    response = HttpResponse(content_type='text/csv')
+    qs = qs.by_priority().with_report_data()
+
+    def report_rows():
+        yield ["Name", "Status", "Description", "Collections", "Assigned Personnel"]
+        for machine in qs.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            collections = ", ".join([col.name for col in machine.collections.all()])
+            assigned = ", ".join([user.username for user in machine.assigned_to.all()])
+            yield [machine.name, machine.status, machine.description, collections, assigned]
+
+    response = StreamingHttpResponse(
+        streaming_content(request, csv_chunks(report_rows())),
+        content_type='text/csv',
+    )
     response['Content-Disposition'] = 'attachment; filename="machines_report.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(["Name", "Status", "Description", "Collections", "Assigned Personnel"])
-    
-    for machine in qs:
-        collections = ", ".join([col.name for col in machine.collections.all()])
-        assigned = ", ".join([user.username for user in machine.assigned_to.all()])
-        writer.writerow([machine.name, machine.status, machine.description, collections, assigned])
-    
     return response
 
 
+# Number of fault cases per page of the fault search results.
+FAULT_SEARCH_PAGE_SIZE = 20
+
 @login_required
+def fault_search(request):
+    """
+    Renders the results of the dashboard search box: fault cases whose title, machine name or
+    notes match the search text, best match first, with a snippet of the matching text.
+    """
+    query = request.GET.get("q", "").strip()
+    page = Paginator(search_faults(query), FAULT_SEARCH_PAGE_SIZE).get_page(request.GET.get("page"))
+    context = {
+        'query': query,
+        'page': page,
+    }
+    return render(request, "myapp/fault_search.html", context)
+
+
+@role_required("Manager", message="You are not authorized to delete users.")
 def delete_user(request, user_id):
     """
     Allows a Manager to delete a user account (excluding self-deletion or deletion of superusers).
     This operation is only processed via a POST request.
     """
     if request.method == "POST":
-        if request.user.userprofile.role != "Manager":
-            return HttpResponseForbidden("You are not authorized to delete users.")
         user_to_delete = get_object_or_404(User, pk=user_id)
         if user_to_delete == request.user or user_to_delete.is_superuser:
             return HttpResponseForbidden("You cannot delete this user.")
@@ -578,15 +633,243 @@ def delete_user(request, user_id):
         return redirect("myapp:manager_dashboard")
     return HttpResponseForbidden("Only POST requests are allowed.")
 
+
+###############################
+# Monitoring (Prometheus)     #
+###############################
+def prometheus_metrics(request):
+    """
+    Exposes the request, SQL and write metrics of this server process (see metrics.py and
+    RequestMetricsMiddleware) in the Prometheus text format. Open to staff users and to scrapers
+    sending the METRICS_TOKEN bearer token.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    authorized_scraper = bool(token) and scheme.lower() == "bearer" \
+        and hmac.compare_digest(credentials.strip().encode(), token.encode())
+    if not authorized_scraper and not request.user.is_staff:
+        return HttpResponseForbidden("You are not authorized to view the metrics.")
+    return HttpResponse(metrics.render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+###############################
+# Request Profiles            #
+###############################
+@user_passes_test(lambda user: user.is_superuser, login_url="admin:login")
+def profile_list(request):
+    """
+    Lists the saved request profiles (see profiling.py), newest first, with the time each
+    request spent in the ORM, template rendering and serialization. Superusers only.
+    """
+    return render(request, "myapp/profile_list.html", {
+        "title": "Request profiles",
+        "reports": profiling.list_reports(),
+        "areas": [area for area, _ in profiling.AREAS] + [profiling.OTHER_AREA],
+    })
+
+
+@user_passes_test(lambda user: user.is_superuser, login_url="admin:login")
+def profile_detail(request, report_id):
+    """
+    Shows one saved request profile: its summary, most expensive functions and call tree.
+    Superusers only.
+    """
+    report = profiling.load_report(report_id)
+    if report is None:
+        raise Http404("No such profile.")
+    summary, tree = report
+    return render(request, "myapp/profile_detail.html", {
+        "title": f"Profile {report_id}",
+        "summary": summary,
+        "tree": tree,
+    })
+
+
+#############################################
+#     Live Status Push (Server-Sent Events)  #
+#############################################
+
+# Seconds between checks of the change sequence for new machine changes.
+MACHINE_EVENTS_POLL_INTERVAL = 1.0
+# Seconds between keep-alive comments sent while no changes arrive.
+MACHINE_EVENTS_KEEPALIVE = 15
+# How long one event stream stays open under ASGI before the browser reconnects (resuming
+# from its Last-Event-ID). Under WSGI the stream behaves as a long poll and ends after the
+# first batch of events or after MACHINE_EVENTS_LONG_POLL seconds.
+MACHINE_EVENTS_STREAM_DURATION = 300
+MACHINE_EVENTS_LONG_POLL = 25
+# Maximum number of change-sequence entries turned into events per check.
+MACHINE_EVENTS_BATCH_SIZE = 500
+
+
+def format_server_sent_event(event, data, event_id=None):
+    """
+    Formats one Server-Sent Event message.
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, cls=DjangoJSONEncoder)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def machine_event_batch(last_seq):
+    """
+    Reads the machine changes after `last_seq` from the change sequence (see MachineChange) and
+    returns (messages, last_seq): one "machine" event per changed machine with its current state,
+    followed by a "totals" event with the status counters.
+    """
+    entries = [
+        entry async for entry in MachineChange.objects.filter(seq__gt=last_seq)
+        .order_by("seq").values_list("seq", "machine_id")[:MACHINE_EVENTS_BATCH_SIZE]
+    ]
+    if not entries:
+        return [], last_seq
+
+    latest_seq = {machine_id: seq for seq, machine_id in entries}
+    machines = {
+        machine["id"]: machine async for machine in Machine.objects.filter(pk__in=latest_seq)
+        .values("id", "name", "status", "updated_at")
+    }
+    messages = []
+    for machine_id, seq in sorted(latest_seq.items(), key=lambda item: item[1]):
+        data = machines.get(machine_id, {"id": machine_id})
+        data["deleted"] = machine_id not in machines
+        messages.append(format_server_sent_event("machine", data, event_id=seq))
+    totals = {status: count async for status, count in MachineStatusCount.objects.values_list("status", "count")}
+    messages.append(format_server_sent_event("totals", totals))
+    return messages, entries[-1][0]
+
+
+@login_required
+async def machine_events(request):
+    """
+    Streams machine status changes to the dashboards as Server-Sent Events.
+    Changes are read from the MachineChange sequence, which every status change (create_fault,
+    create_warning, mark_resolved, delete_warning, MachineView.post, batch updates, admin edits)
+    appends to, so the fan-out works across worker processes without a message broker.
+    Each event's id is its position in the sequence; browsers resume from it (Last-Event-ID)
+    when they reconnect.
+    Served under ASGI (mysite/asgi.py) the stream stays open without tying up a thread; under
+    WSGI it degrades to a long poll.
+    """
+    try:
+        last_seq = int(request.headers.get("Last-Event-ID", ""))
+    except ValueError:
+        last_seq = (await MachineChange.objects.aaggregate(last=Max("seq")))["last"] or 0
+    is_asgi = isinstance(request, ASGIRequest)
+    duration = MACHINE_EVENTS_STREAM_DURATION if is_asgi else MACHINE_EVENTS_LONG_POLL
+
+    async def stream():
+        nonlocal last_seq
+        yield f"retry: {int(MACHINE_EVENTS_POLL_INTERVAL * 3000)}\n\n"
+        deadline = time.monotonic() + duration
+        last_message = time.monotonic()
+        while time.monotonic() < deadline:
+            messages, last_seq = await machine_event_batch(last_seq)
+            for message in messages:
+                yield message
+            if messages:
+                last_message = time.monotonic()
+                if not is_asgi:
+                    return
+                continue
+            if time.monotonic() - last_message >= MACHINE_EVENTS_KEEPALIVE:
+                last_message = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(MACHINE_EVENTS_POLL_INTERVAL)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 #############################################
 #           REST API Views                  #
 #############################################
 
+def machine_list_validators(request):
+    """
+    Returns the (ETag, Last-Modified timestamp) validators of the machine list.
+    The ETag derives from the position of the latest entry in the machine change sequence (every
+    creation, edit, status change and deletion appends one; an index lookup) plus the requested
+    page; Last-Modified from the newest `updated_at`. Both are computed without loading or
+    serializing any machine.
+    """
+    last_updated = Machine.objects.aggregate(last_updated=Max("updated_at"))["last_updated"]
+    last_change = MachineChange.objects.aggregate(last_change=Max("seq"))["last_change"]
+    version = f"{last_change or 0}-{request.get_full_path()}"
+    etag = quote_etag(hashlib.md5(version.encode(), usedforsecurity=False).hexdigest())
+    return etag, int(last_updated.timestamp()) if last_updated else None
+
+
+def not_modified_response(request, etag):
+    """
+    Returns a 304 Not Modified response if the request's If-None-Match matches `etag`, else None.
+    The ETag is the only validator honoured: Last-Modified has a one-second resolution and does
+    not move when a machine is deleted, so If-Modified-Since alone could answer 304 for data
+    that changed. Last-Modified is still sent, for information.
+    """
+    return get_conditional_response(request, etag=etag)
+
+
+def add_validators(response, etag, last_modified):
+    """
+    Sets the ETag and Last-Modified headers on a response.
+    """
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def apply_machine_statuses(final_status):
+    """
+    Applies {machine_id: status} in one transaction with one conditional, set-based UPDATE per
+    target status: only machines not already in that status are written, and only their status,
+    priority and updated_at columns. With MACHINE_STATUS_DEBOUNCE_SECONDS set, a machine whose
+    status changed less than that long ago is left as it is (a flapping sensor's next resend
+    applies the update once the window has passed); escalations to Fault are never held back.
+    Returns {machine_id: "updated" | "unchanged" | "debounced"} for the machines that exist, and
+    counts the applied and elided writes (see metrics.py).
+    Runs on the write queue (see write_queue.py).
+    """
+    debounce_seconds = getattr(settings, "MACHINE_STATUS_DEBOUNCE_SECONDS", 0)
+    results = {}
+    with transaction.atomic():
+        existing = set(Machine.objects.filter(pk__in=final_status).values_list('pk', flat=True))
+        ids_by_status = defaultdict(list)
+        for machine_id, new_status in final_status.items():
+            if machine_id in existing:
+                ids_by_status[new_status].append(machine_id)
+                results[machine_id] = "unchanged"
+        for new_status, machine_ids in ids_by_status.items():
+            machines = Machine.objects.filter(pk__in=machine_ids)
+            if debounce_seconds and new_status != "Fault":
+                held = set(
+                    machines.exclude(status=new_status)
+                    .changed_status_within(timedelta(seconds=debounce_seconds))
+                    .values_list('pk', flat=True)
+                )
+                results.update((machine_id, "debounced") for machine_id in held)
+                machines = machines.exclude(pk__in=held)
+            for machine_id, _old, _new in machines.set_status(new_status):
+                results[machine_id] = "updated"
+    outcomes = Counter(results.values())
+    metrics.increment("machine_status_writes_applied", outcomes["updated"])
+    metrics.increment("machine_status_writes_elided", outcomes["unchanged"])
+    metrics.increment("machine_status_writes_debounced", outcomes["debounced"])
+    return results
+
+
 class MachineView(APIView):
     """
     API endpoint that allows machines to be viewed
     This is specifically for the REST API to get machine status
     """
+    pagination_class = MachineCursorPagination
     
     def post(self, request, *args, **kwargs):
         """
@@ -598,16 +881,20 @@ class MachineView(APIView):
             machine_id = serializer.validated_data['id']
             new_status = serializer.validated_data['status']
 
-            try:
-                machine = Machine.objects.get(id=machine_id)
-            except Machine.DoesNotExist:
+            machine_name = Machine.objects.filter(pk=machine_id).values_list("name", flat=True).first()
+            if machine_name is None:
                 return Response({"error": "Machine not found."}, status=status.HTTP_404_NOT_FOUND)
 
-            # Update the machine status and save the record.
-            machine.status = new_status
-            machine.save()
+            # The update goes through the write queue, which serializes (and batches) the
+            # writes of concurrent requests. Resending the current status writes nothing.
+            result = write_queue.run(apply_machine_statuses, {machine_id: new_status}).get(machine_id, "not_found")
+            if result == "not_found":
+                return Response({"error": "Machine not found."}, status=status.HTTP_404_NOT_FOUND)
 
-            return Response({"success": f"Machine '{machine.name}' updated to {new_status}."}, status=status.HTTP_200_OK)
+            return Response(
+                {"success": f"Machine '{machine_name}' updated to {new_status}.", "result": result},
+                status=status.HTTP_200_OK,
+            )
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
    
@@ -615,15 +902,374 @@ class MachineView(APIView):
         """
         Handles GET requests.
         If a primary key (pk) is provided in the URL, returns details for that machine;
-        otherwise, returns the list of all machines.
+        otherwise, returns a page of machines ordered by (updated_at, id), with `next` and
+        `previous` cursor links.
+        Responses carry ETag and Last-Modified headers; conditional requests (If-None-Match)
+        for unchanged data get a 304 without any serialization work.
         """
         if pk is not None:
             try:
                 machine = Machine.objects.get(pk=pk)
             except Machine.DoesNotExist:
                 return Response({"error": "Machine not found."}, status=status.HTTP_404_NOT_FOUND)
+            etag = quote_etag(f"{machine.pk}-{machine.updated_at.timestamp()}")
+            last_modified = int(machine.updated_at.timestamp())
+            not_modified = not_modified_response(request, etag)
+            if not_modified is not None:
+                return not_modified
             serializer = MachineStatusSerializer(machine)
+            return add_validators(Response(serializer.data, status=status.HTTP_200_OK), etag, last_modified)
+
+        etag, last_modified = machine_list_validators(request)
+        not_modified = not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(Machine.objects.all(), request, view=self)
+        serializer = MachineStatusSerializer(page, many=True)
+        return add_validators(paginator.get_paginated_response(serializer.data), etag, last_modified)
+
+
+class MachineBatchView(APIView):
+    """
+    API endpoint for batch ingestion of machine status updates.
+    Gateways send many status changes in one request instead of one request per machine.
+    """
+
+    def post(self, request, *args, **kwargs):
+        """
+        Handles POST requests with a JSON array of {"id": ..., "status": ...} updates.
+        All updates are applied in a single transaction with one set-based UPDATE per target
+        status. If a machine appears more than once, its last update wins. The response lists a
+        result for every item, in request order: "updated", "unchanged", "debounced" (held back
+        because the machine's status changed very recently, see apply_machine_statuses),
+        "not_found" or "superseded" (a later item in the batch updates the same machine).
+        """
+        serializer = MachineWarningListSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        items = serializer.validated_data
+
+        # The last update for each machine is the one that is applied.
+        final_status = {item['id']: item['status'] for item in items}
+        last_index = {item['id']: index for index, item in enumerate(items)}
+
+        applied = write_queue.run(apply_machine_statuses, final_status)
+
+        results = []
+        for index, item in enumerate(items):
+            if index != last_index[item['id']]:
+                result = "superseded"
+            else:
+                result = applied.get(item['id'], "not_found")
+            results.append({"id": item['id'], "status": item['status'], "result": result})
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+
+class MachineAssignmentView(APIView):
+    """
+    API endpoint for bulk reassignment of machines, restricted to managers.
+    Makes the given users the only technicians (or repair personnel) of many machines at once,
+    selected by id or by collection, in one transaction with set-based writes.
+    """
+    permission_classes = [role_permission("Manager", message="Only managers can reassign machines.")]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Handles POST requests with {"role": "Technician" | "Repair", "user_ids": [...]} and
+        either "machine_ids": [...] or "collection": id. An empty user_ids list unassigns the
+        role. Responds with the number of machines reassigned and the requested machine ids
+        that do not exist.
+        """
+        serializer = MachineAssignmentSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        if "collection" in data:
+            if not Collection.objects.filter(pk=data["collection"]).exists():
+                return Response({"error": "Collection not found."}, status=status.HTTP_404_NOT_FOUND)
+            machines = Machine.objects.in_collection(data["collection"])
+        else:
+            machines = Machine.objects.filter(pk__in=data["machine_ids"])
+        try:
+            reassigned = machines.reassign(data["role"], data["user_ids"])
+        except ValidationError as exc:
+            return Response({"user_ids": exc.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "role": data["role"],
+            "user_ids": sorted(set(data["user_ids"])),
+            "machines": len(reassigned),
+            "not_found": sorted(set(data.get("machine_ids", ())) - set(reassigned)),
+        }, status=status.HTTP_200_OK)
+
+
+class FaultBulkView(APIView):
+    """
+    API endpoint for bulk fault case operations, e.g. after a line-wide outage.
+    Resolves, reopens or annotates many fault cases at once, selected by id, by machine or by
+    collection, with set-based writes; the statuses of the affected machines are then
+    recomputed in one pass. Restricted to managers, technicians and repair personnel.
+    """
+    permission_classes = [role_permission("Manager", "Technician", "Repair")]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Handles POST requests with {"action": "resolve" | "reopen" | "note", "note": "..."} and
+        one of "fault_ids": [...], "machine": id or "collection": id. "resolve" and "reopen"
+        apply to the selected cases not already in the target status and add the optional
+        note to those; "note" (which requires a note) annotates every selected case.
+        Responds with the ids of the changed (or annotated) cases and the resulting status of
+        the machines they belong to. Resolving never clears a status the machine reported
+        itself (a Warning without an active warning, or a Fault on a machine without fault cases).
+        """
+        serializer = FaultBulkSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        if "fault_ids" in data:
+            faults = FaultCase.objects.filter(pk__in=data["fault_ids"])
+        elif "machine" in data:
+            faults = FaultCase.objects.filter(machine_id=data["machine"])
         else:
-            machines = Machine.objects.all()
-            serializer = MachineStatusSerializer(machines, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+            faults = FaultCase.objects.filter(machine__collections__pk=data["collection"])
+
+        with transaction.atomic():
+            machine_ids = set(faults.values_list("machine_id", flat=True))
+            if data["action"] == "note":
+                fault_ids = faults.add_note(data["note"], request.user)
+            else:
+                new_status = "resolved" if data["action"] == "resolve" else "open"
+                fault_ids = faults.set_status(new_status, note=data.get("note"), user=request.user)
+            machine_statuses = dict(Machine.objects.filter(pk__in=machine_ids).values_list("pk", "status"))
+        return Response({
+            "action": data["action"],
+            "fault_ids": sorted(fault_ids),
+            "machines": {str(pk): machine_status for pk, machine_status in sorted(machine_statuses.items())},
+        }, status=status.HTTP_200_OK)
+
+
+class CollectionOverviewView(APIView):
+    """
+    API endpoint for the collections overview: the machine counts per status and the open
+    fault cases of every collection, worst first (see collection_overview). Requires an
+    authenticated user.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handles GET requests. Responds with the list of collections and their counts.
+        """
+        collections = Collection.objects.with_status_counts().by_trouble()
+        return Response(CollectionOverviewSerializer(collections, many=True).data, status=status.HTTP_200_OK)
+
+
+class MachineWriteStatsView(APIView):
+    """
+    API endpoint reporting, for this server process, how many machine status writes were applied
+    and how many were elided: resends of the current status ("elided") and updates held back by
+    the debouncer ("debounced"). Restricted to staff users.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        counters = metrics.snapshot()
+        names = ("applied", "elided", "debounced")
+        return Response({name: counters.get(f"machine_status_writes_{name}", 0) for name in names})
+
+
+#############################################
+#           Async REST API Views            #
+#############################################
+
+@require_GET
+async def async_machine_detail(request, pk):
+    """
+    Async variant of GET api/machine/<pk>/ (MachineView.get) for sensor clients and gateways:
+    same response, ETag and Last-Modified validators, read with the async ORM. Served under
+    ASGI (mysite/asgi.py), a request waiting on a slow client or on the database does not tie
+    up a worker thread.
+    """
+    try:
+        machine = await Machine.objects.aget(pk=pk)
+    except Machine.DoesNotExist:
+        return JsonResponse({"error": "Machine not found."}, status=404)
+    etag = quote_etag(f"{machine.pk}-{machine.updated_at.timestamp()}")
+    last_modified = int(machine.updated_at.timestamp())
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+    # Serializers may reach the storage (image URLs); keep any blocking work off the event loop.
+    data = await sync_to_async(lambda: MachineStatusSerializer(machine).data)()
+    return add_validators(JsonResponse(data, encoder=DjangoJSONEncoder), etag, last_modified)
+
+
+# Sensors post without a session, like to the DRF views (which are CSRF exempt).
+@csrf_exempt
+@require_POST
+async def async_machine_status_update(request):
+    """
+    Async variant of POST api/machine/faultUpdate (MachineView.post): takes {"id", "status"} and
+    applies it through the write queue, awaiting the commit without holding a thread, so a
+    single ASGI worker can keep thousands of sensor requests waiting on the same batch.
+    Responds like MachineView.post.
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "The request body must be JSON."}, status=400)
+    serializer = MachineWarningSerializer(data=payload)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    machine_id = serializer.validated_data['id']
+    new_status = serializer.validated_data['status']
+
+    machine_name = await Machine.objects.filter(pk=machine_id).values_list("name", flat=True).afirst()
+    if machine_name is None:
+        return JsonResponse({"error": "Machine not found."}, status=404)
+    result = (await write_queue.arun(apply_machine_statuses, {machine_id: new_status})).get(machine_id, "not_found")
+    if result == "not_found":
+        return JsonResponse({"error": "Machine not found."}, status=404)
+    return JsonResponse({"success": f"Machine '{machine_name}' updated to {new_status}.", "result": result})
+
+
+# Default and maximum number of change-sequence entries read per delta-sync request.
+CHANGE_FEED_PAGE_SIZE = 500
+CHANGE_FEED_MAX_PAGE_SIZE = 5000
+
+class MachineChangesView(APIView):
+    """
+    Delta-sync API endpoint that returns the machines changed since a cursor.
+    Sync clients (dashboards, MES systems) keep a mirror of the fleet by following the cursor
+    instead of re-fetching the whole machine list.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handles GET requests with an optional `since` cursor (omit it to start from the
+        beginning) and an optional `limit`.
+        Returns the current state of every machine changed after the cursor in `changed`, the
+        ids of deleted machines in `deleted`, the cursor to resume from in `cursor`, and
+        `has_more` when further changes are waiting. Reading the changes is an index range scan
+        on the change sequence, so the cost depends on the number of changes, not the fleet size.
+        """
+        since = decode_change_cursor(request.query_params.get("since"))
+        try:
+            limit = min(int(request.query_params.get("limit", CHANGE_FEED_PAGE_SIZE)), CHANGE_FEED_MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({"limit": "Must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            # An empty page would report has_more with an unchanged cursor forever.
+            return Response({"limit": "Must be at least 1."}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = list(
+            MachineChange.objects.filter(seq__gt=since).order_by("seq").values_list("seq", "machine_id")[:limit + 1]
+        )
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        last_seq = entries[-1][0] if entries else since
+
+        # Each machine is reported once, in its current state (or as deleted if it no longer exists).
+        machine_ids = {machine_id for _seq, machine_id in entries}
+        machines = Machine.objects.filter(pk__in=machine_ids).order_by("pk")
+        changed = MachineStatusSerializer(machines, many=True).data
+        deleted = sorted(machine_ids - {machine["id"] for machine in changed})
+
+        return Response({
+            "cursor": encode_change_cursor(last_seq),
+            "has_more": has_more,
+            "changed": changed,
+            "deleted": deleted,
+        }, status=status.HTTP_200_OK)
+
+
+
+# Default length of the range covered by an availability report, per bucket period.
+REPORT_DEFAULT_RANGE = {
+    "hour": timedelta(days=1),
+    "day": timedelta(days=30),
+}
+
+def parse_report_moment(value):
+    """
+    Parses an ISO date or datetime query parameter into an aware datetime (None if invalid).
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        moment = datetime.combine(day, dt_time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class StatusReportView(APIView):
+    """
+    Base API endpoint for availability and downtime reports built from the status rollups.
+    Subclasses set `model` to the report owner (Machine or Collection).
+    """
+    model = None
+
+    def get(self, request, pk, *args, **kwargs):
+        """
+        Handles GET requests with optional `period` ("hour" or "day"), `start` and `end`
+        (ISO dates or datetimes) query parameters. Defaults to daily buckets over the last 30
+        days (hourly buckets over the last day).
+        """
+        try:
+            owner = self.model.objects.get(pk=pk)
+        except self.model.DoesNotExist:
+            return Response({"error": f"{self.model.__name__} not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        period = request.query_params.get("period", "day")
+        if period not in PERIODS:
+            return Response({"period": f"Must be one of {', '.join(PERIODS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        end = timezone.now()
+        if "end" in request.query_params:
+            end = parse_report_moment(request.query_params["end"])
+        start = end - REPORT_DEFAULT_RANGE[period] if end else None
+        if "start" in request.query_params:
+            start = parse_report_moment(request.query_params["start"])
+        if start is None or end is None or start >= end:
+            return Response({"error": "Invalid start/end range."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(status_report(owner, start, end, period), status=status.HTTP_200_OK)
+
+
+class MachineStatusReportView(StatusReportView):
+    """
+    API endpoint for the availability and downtime report of a machine.
+    """
+    model = Machine
+
+
+class CollectionStatusReportView(StatusReportView):
+    """
+    API endpoint for the availability and downtime report of a collection.
+    """
+    model = Collection
+
+
+
+class FaultSearchView(APIView):
+    """
+    API endpoint for full-text search over the fault history (fault titles, machine names and
+    fault notes). Requires an authenticated user, as the notes are internal.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = FaultSearchPagination
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handles GET requests with a `q` search text and optional `page` / `page_size`.
+        Returns the matching fault cases, best match first, one page at a time.
+        """
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            return Response({"q": "This parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(search_faults(query), request, view=self)
+        return paginator.get_paginated_response(FaultSearchResultSerializer(page, many=True).data)
@@ -0,0 +1,150 @@
+"""
+write_queue.py
+
+This module serializes the database writes of the ingestion endpoints through one writer thread.
+
+SQLite allows a single writer at a time. When many request threads write at once (sensors and
+gateways posting status updates), they queue on the database lock and, past the busy timeout,
+fail with "database is locked". Instead, writes submitted here are queued in process and
+executed by a single writer thread, which takes whatever has queued up (up to
+WRITE_QUEUE_BATCH_SIZE writes) and runs it in one transaction: one lock acquisition and one
+fsync per batch instead of per write. Each write runs in its own savepoint, so a failing write
+does not undo the others in its batch. Readers are never blocked, since the database runs in
+WAL mode (see the SQLite options in settings.py).
+
+Usage:
+    from .write_queue import write_queue
+    changes = write_queue.run(apply_status, machine_id, "Fault")   # waits for the commit
+    changes = await write_queue.arun(apply_status, machine_id, "Fault")   # in async views
+
+Writes run inline (in the calling thread) when the queue is disabled (SQLITE_WRITE_QUEUE), and
+when the caller is already inside a transaction, whose writes must be part of it.
+"""
+
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of queued writes committed together in one transaction.
+WRITE_QUEUE_BATCH_SIZE = getattr(settings, "WRITE_QUEUE_BATCH_SIZE", 200)
+# Maximum number of writes waiting in the queue; submitting blocks while it is full.
+WRITE_QUEUE_MAX_SIZE = getattr(settings, "WRITE_QUEUE_MAX_SIZE", 10000)
+
+
+class WriteQueue:
+    """
+    A queue of database writes executed, in submission order, by one writer thread.
+    """
+
+    def __init__(self, batch_size=WRITE_QUEUE_BATCH_SIZE, max_size=WRITE_QUEUE_MAX_SIZE):
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, "SQLITE_WRITE_QUEUE", False)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues `func(*args, **kwargs)` and returns a Future, resolved with its return value (or
+        exception) once the transaction it ran in has been committed.
+        """
+        future = Future()
+        if not self.enabled or connection.in_atomic_block or threading.current_thread() is self._thread:
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as exc:
+                future.set_exception(exc)
+            return future
+        self._ensure_writer()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def run(self, func, *args, **kwargs):
+        """
+        Queues `func(*args, **kwargs)`, waits until it is committed and returns its result.
+        """
+        return self.submit(func, *args, **kwargs).result()
+
+    async def arun(self, func, *args, **kwargs):
+        """
+        Async variant of run(), for async views: the caller waits for the commit without holding
+        a thread, so any number of requests can wait on the same batch. The write is submitted
+        from the thread the async ORM runs in (sync_to_async), where the transaction state is
+        known: when the queue is disabled, or the caller is inside a transaction, it runs there.
+        """
+        future = await sync_to_async(self.submit)(func, *args, **kwargs)
+        return await asyncio.wrap_future(future)
+
+    def stop(self, timeout=None):
+        """
+        Lets the writer thread finish the queued writes, then stops it.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._writer, name="db-write-queue", daemon=True)
+                self._thread.start()
+
+    def _writer(self):
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while batch[-1] is not None and len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stopping = batch[-1] is None
+                jobs = [job for job in batch if job is not None]
+                if jobs:
+                    close_old_connections()
+                    self._run_batch(jobs)
+                if stopping:
+                    return
+        finally:
+            connection.close()
+
+    def _run_batch(self, jobs):
+        # Runs the jobs in one transaction, each in a savepoint, and resolves their futures once
+        # the transaction is committed.
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for future, func, args, kwargs in jobs:
+                    try:
+                        with transaction.atomic():
+                            outcomes.append((future, func(*args, **kwargs), None))
+                    except Exception as exc:
+                        outcomes.append((future, None, exc))
+        except Exception as exc:
+            logger.exception("Could not commit a batch of %d queued writes", len(jobs))
+            for future, *_ in jobs:
+                future.set_exception(exc)
+            return
+        for future, result, exc in outcomes:
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+
+write_queue = WriteQueue()
+atexit.register(write_queue.stop)
@@ -26,7 +26,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-c*kr(es(cziy=1)j*^b5c#v7k1bh^*+l^5pa%s3h%_-5t@4tfa'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Set DJANGO_DEBUG=0 in production; it also enables the static asset pipeline below.
+DEBUG = os.environ.get('DJANGO_DEBUG', '1').lower() not in ('0', 'false', 'no', 'off')
 
 # SECURITY WARNING: don't run with "Host" header wildcard turned on in production!
 ALLOWED_HOSTS = ['*']
@@ -46,15 +47,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myapp.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'myapp.middleware.StaticAssetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'myapp.middleware.ProfileAuthenticationMiddleware',
+    'myapp.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Users are loaded together with their UserProfile (role), see myapp/roles.py.
+AUTHENTICATION_BACKENDS = [
+    'myapp.roles.ProfileModelBackend',
+]
+
 ROOT_URLCONF = 'mysite.urls'
 
 TEMPLATES = [
@@ -90,6 +99,46 @@ DATABASES = {
     )
 }
 
+# SQLite production profile: WAL journal (readers never wait for the writer), relaxed fsync
+# (synchronous=NORMAL is safe in WAL mode), a larger page cache, a busy timeout (seconds) for
+# writers of other processes, and IMMEDIATE transactions, which take the write lock up front
+# rather than failing with "database is locked" when upgrading a read transaction. Writes from
+# the ingestion API are serialized and batched in process by myapp/write_queue.py.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        'init_command': (
+            'PRAGMA journal_mode=WAL;'
+            'PRAGMA synchronous=NORMAL;'
+            'PRAGMA cache_size=-20000;'
+            'PRAGMA temp_store=MEMORY;'
+            'PRAGMA mmap_size=134217728'
+        ),
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': 20,
+    })
+    SQLITE_WRITE_QUEUE = True
+else:
+    SQLITE_WRITE_QUEUE = False
+WRITE_QUEUE_BATCH_SIZE = 200
+
+# Status updates for a machine whose status changed less than this many seconds ago are held
+# back (escalations to Fault excepted), damping flapping sensors; 0 turns this off.
+MACHINE_STATUS_DEBOUNCE_SECONDS = 0
+
+# Request metrics (see myapp/metrics.py), exported at /metrics to staff users and to scrapers
+# sending "Authorization: Bearer <METRICS_TOKEN>" (no token: staff only). Client addresses are
+# not trusted, as behind a reverse proxy every request comes from loopback.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+# Queries slower than this (ms) are logged to "myapp.slow_queries"; None turns this off.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ['SLOW_QUERY_THRESHOLD_MS']) if os.environ.get('SLOW_QUERY_THRESHOLD_MS') else None
+
+# Request profiling (see myapp/profiling.py): superusers can profile a request with the
+# X-Profile: 1 header or ?_profile=1; besides, this share of all requests is profiled.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = BASE_DIR / 'storage' / 'profiles'
+# Number of profile reports kept; the oldest are removed.
+PROFILE_MAX_REPORTS = 200
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -128,6 +177,18 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# Outside development, `collectstatic` hashes the file names and writes precompressed and
+# responsive image copies (see myapp/staticfiles.py); StaticAssetMiddleware serves them.
+if not DEBUG:
+    STORAGES = {
+        'default': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        },
+        'staticfiles': {
+            'BACKEND': 'myapp.staticfiles.CompressedManifestStaticFilesStorage',
+        },
+    }
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -139,6 +200,29 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_ROOT =  BASE_DIR / 'storage' / 'media'
 MEDIA_URL = '/media/'
 
+# Resized variants of uploaded images (see myapp/images.py)
+IMAGE_VARIANT_WIDTHS = (160, 480, 960)
+IMAGE_VARIANT_QUALITY = 80
+
+# Cache used for the dashboard fragments (see myapp/board_cache.py). The fragments are keyed on
+# board versions kept in the database, so a per-process local-memory cache stays correct with
+# several worker processes; set CACHE_DIR to share one file-based cache between them instead.
+if os.environ.get("CACHE_DIR"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ["CACHE_DIR"],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'board-fragments',
+        }
+    }
+BOARD_FRAGMENT_CACHE_TIMEOUT = 600
+
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10